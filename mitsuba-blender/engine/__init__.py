@@ -19,17 +19,22 @@ def get_panels():
     return panels
 
 def register():
-    from . import properties
+    from . import properties, operators
     properties.register()
+    operators.register()
     bpy.utils.register_class(MitsubaRenderEngine)
     for panel in get_panels():
         panel.COMPAT_ENGINES.add('MITSUBA')
 
 def unregister():
     print("engine unregister")
-    from . import properties
+    from . import properties, operators
     properties.unregister()
+    operators.unregister()
     bpy.utils.unregister_class(MitsubaRenderEngine)
+    # Stop the Mitsuba 0.6 render servers
+    from . import v1_workers
+    v1_workers.shutdown()
     for panel in get_panels():
         if 'MITSUBA' in panel.COMPAT_ENGINES:
             panel.COMPAT_ENGINES.remove('MITSUBA')
@@ -1,14 +1,18 @@
 import bpy
 import tempfile
 import os
-import os.path as osp
-import subprocess
 import numpy as np
-from ..io.exporter import SceneConverter, downgrade
-from glob import glob
+from contextlib import nullcontext
+from ..io.exporter import SceneConverter
+from . import v1_workers
 
 from ipdb import set_trace
 
+# Scene kept between the frames of an animation render. Unless persistent data
+# is enabled, Blender creates a new render engine for each frame, so this cannot
+# be stored in the engine itself.
+_animation_state = None
+
 class MitsubaRenderEngine(bpy.types.RenderEngine):
 
     bl_idname = "MITSUBA"
@@ -24,6 +28,12 @@ class MitsubaRenderEngine(bpy.types.RenderEngine):
         self.scene_data = None
         self.draw_data = None
         self.converter = SceneConverter(render=False)
+        # Scene kept alive between renders when Blender's persistent data is enabled
+        self.mts_scene = None
+        self.scene_signature = None
+        self.persistent_dir = None
+        # Pixel buffers of the Blender render passes, by pass name
+        self.pass_buffers = {}
 
     # When the render engine instance is destroy, this is called. Clean up any
     # render engine data here, for example stopping running render threads.
@@ -50,46 +60,87 @@ class MitsubaRenderEngine(bpy.types.RenderEngine):
             scale = b_scene.render.resolution_percentage / 100.0
             self.size_x = int(b_scene.render.resolution_x * scale)
             self.size_y = int(b_scene.render.resolution_y * scale)
+            self.pass_buffers.clear()
+
+            # Reuse the loaded scene between renders if Blender asks us to keep persistent data,
+            # or between the frames of an animation. This is only supported when rendering with Mitsuba 3.
+            persistent = version == "v3" and (b_scene.render.use_persistent_data or self.is_animation)
+            # Without persistent data, the scene of the previous frame is not found in this engine
+            animation = persistent and not b_scene.render.use_persistent_data
+            if animation:
+                self.restore_animation_state(b_scene)
+            else:
+                self.release_animation_state()
+            if not persistent:
+                self.free_persistent_data()
+            elif self.persistent_dir is None:
+                # Files written during the export need to outlive the render
+                self.persistent_dir = tempfile.TemporaryDirectory()
 
             # Temporary workaround as long as the dict creation writes stuff to dict
             # dummy_dir = "/home/arpit/Downloads/test_render"
-            with tempfile.TemporaryDirectory() as dummy_dir:
+            scene_dir = nullcontext(self.persistent_dir.name) if persistent else tempfile.TemporaryDirectory()
+            with scene_dir as dummy_dir:
                 filepath = os.path.join(dummy_dir, "scene.xml")
-                self.converter.set_path(filepath)
-                self.converter.scene_to_dict(depsgraph)
-                curr_thread = Thread.thread()
-                curr_thread.file_resolver().prepend(dummy_dir)
-                mts_scene = self.converter.dict_to_scene()
+                mts_scene = None
+                signature = self.get_scene_signature(b_scene)
+                if persistent and self.mts_scene is not None and signature == self.scene_signature:
+                    if animation:
+                        updated = self.converter.update_frame(depsgraph, self.mts_scene)
+                    else:
+                        updated = self.converter.update_scene(depsgraph, self.mts_scene)
+                    if updated:
+                        self.converter.export_ctx.log("Updated the persistent Mitsuba scene", 'DEBUG')
+                        mts_scene = self.mts_scene
+
+                if mts_scene is None:
+                    # Mitsuba 3 renders from shapes built in memory, Mitsuba 0.6 needs the scene on disk
+                    self.converter = SceneConverter(render=(version == "v3"))
+                    # Named entries are required to update the scene in place later on
+                    self.converter.export_ctx.export_ids = persistent
+                    self.converter.cameras = {b_camera.name_full for b_camera in self.get_render_cameras(b_scene)}
+                    # Mitsuba 0.6 scenes are written in its own syntax, to scene_v1.xml
+                    self.converter.set_path(filepath, xml_version=version)
+                    # Objects instantiated during the export may need to load textures
+                    curr_thread = Thread.thread()
+                    curr_thread.file_resolver().prepend(dummy_dir)
+                    self.converter.scene_to_dict(depsgraph)
+                    mts_scene = self.converter.dict_to_scene()
+
+                if persistent:
+                    self.mts_scene = mts_scene
+                    self.scene_signature = signature
+                if animation:
+                    self.store_animation_state(b_scene)
+
+                if self.test_break():
+                    return
 
                 if version == "v3":
-                    sensor = mts_scene.sensors()[0]
-                    mts_scene.integrator().render(mts_scene, sensor)
-                    render_results = sensor.film().bitmap().split()
+                    # The same loaded scene is rendered from every camera
+                    views = self.get_views(b_scene, mts_scene)
+                    if not views:
+                        self.report({"ERROR"}, "No camera to render")
+                        return
+                    self.render_v3(mts_scene, views, b_scene.mitsuba.pass_count, b_scene.mitsuba.progressive)
+                    return
                 else:
                     print(f"exe path - {mitsubaV1exe}")
 
                     # write to disk
                     self.converter.dict_to_xml()
-                    # call downgrade
-                    folder = osp.dirname(filepath)
-                    fns = glob(osp.join(folder, "*/*.xml"), recursive=True) +\
-                                glob(osp.join(folder, "*.xml"), recursive=True)
-                    for fname in fns:
-                        print(f"Checking {fname}")
-                        downgrade.convert(fname)
-                    # ---
-                    # issue subprocess command
-                    # this needs to be a blocking thread
-                    env = os.environ.copy()
-                    mit1_dir = osp.dirname(mitsubaV1exe)
-                    env["PATH"] = mit1_dir + ":" + env["PATH"]
-                    env["LD_LIBRARY_PATH"] = mit1_dir + ":" + env["LD_LIBRARY_PATH"]
-                    
-                    # render exr
+                    # render exr, on the warm render servers if there are some
+                    mts_settings = b_scene.mitsuba
+                    pool = v1_workers.get_pool(mitsubaV1exe, mts_settings.v1_servers, mts_settings.v1_threads,
+                                               mts_settings.v1_jobs, mts_settings.v1_python)
                     try:
-                        result = subprocess.run([
-                            mitsubaV1exe, filepath.replace(".xml", "_v1.xml")
-                        ], capture_output=True, env = env)
+                        return_code, output = pool.render(filepath.replace(".xml", "_v1.xml"),
+                                                          self.update_progress, self.test_break)
+                        if return_code is None:
+                            print("v1 render process cancelled")
+                            return
+                        if return_code != 0:
+                            print(output.decode('utf-8', 'replace'))
                         # output file would be 
                         outfilePath = filepath.replace(".xml", "_v1.exr")
                         bitmap = mi.Bitmap(outfilePath)
@@ -100,29 +151,251 @@ class MitsubaRenderEngine(bpy.types.RenderEngine):
                         self.report({"WARNING"}, f"Something isn't right\n{e}")
                         return {"CANCELLED"}
 
+            self.display_results([('', render_results)])
+
+    def get_scene_signature(self, b_scene):
+        '''
+        Summarize the settings that require the whole scene to be reloaded
+        when they change.
+        '''
+        mts_settings = b_scene.mitsuba
+        integrator = getattr(mts_settings.available_integrators, mts_settings.active_integrator).to_dict()
+        camera_names = [b_camera.name_full for b_camera in self.get_render_cameras(b_scene)]
+        return repr((mts_settings.variant, self.size_x, self.size_y, sorted(integrator.items()), camera_names))
+
+    def get_render_cameras(self, b_scene):
+        '''
+        List the cameras to render, starting with the active one
+        '''
+        mts_settings = b_scene.mitsuba
+        cameras = [b_scene.camera] if b_scene.camera else []
+        if mts_settings.version != "v3":
+            # Mitsuba 0.6 only renders the active camera
+            return cameras
+        if mts_settings.multiview == "SELECTED":
+            b_objects = [b_object for b_object in b_scene.objects if b_object.select_get()]
+        elif mts_settings.multiview == "COLLECTION" and mts_settings.camera_collection is not None:
+            b_objects = mts_settings.camera_collection.all_objects
+        else:
+            b_objects = []
+        other_cameras = [b_object for b_object in b_objects
+                         if b_object.type == 'CAMERA' and b_object != b_scene.camera and not b_object.hide_render]
+        return cameras + sorted(other_cameras, key=lambda b_camera: b_camera.name_full)
+
+    def get_views(self, b_scene, mts_scene):
+        '''
+        List the (view name, sensor) tuples of the cameras to render. The first
+        view keeps the pass names, the passes of other views are prefixed.
+        '''
+        sensors = {sensor.id(): sensor for sensor in mts_scene.sensors()}
+        views = []
+        for b_camera in self.get_render_cameras(b_scene):
+            sensor = sensors.get(b_camera.name_full)
+            if sensor is None:
+                # Hidden cameras are not exported
+                self.report({"WARNING"}, f"Camera \"{b_camera.name}\" was not exported, it is not rendered")
+                continue
+            views.append(('' if not views else b_camera.name, sensor))
+        return views
+
+    def free_persistent_data(self):
+        self.mts_scene = None
+        self.scene_signature = None
+        if self.persistent_dir is not None:
+            self.persistent_dir.cleanup()
+            self.persistent_dir = None
+
+    def restore_animation_state(self, b_scene):
+        '''
+        Take over the scene kept from the previous frame of the animation
+        '''
+        global _animation_state
+        state = _animation_state
+        _animation_state = None
+        if state is None:
+            return
+        if state['scene'] != b_scene.name_full or state['frame'] >= b_scene.frame_current:
+            # Leftover from another animation render
+            state['persistent_dir'].cleanup()
+            return
+        self.free_persistent_data()
+        self.converter = state['converter']
+        self.mts_scene = state['mts_scene']
+        self.scene_signature = state['signature']
+        self.persistent_dir = state['persistent_dir']
+
+    def store_animation_state(self, b_scene):
+        '''
+        Keep the scene for the next frame of the animation
+        '''
+        global _animation_state
+        if b_scene.frame_current + b_scene.frame_step > b_scene.frame_end:
+            # Last frame
+            self.free_persistent_data()
+            return
+        _animation_state = {
+            'scene': b_scene.name_full,
+            'frame': b_scene.frame_current,
+            'converter': self.converter,
+            'mts_scene': self.mts_scene,
+            'signature': self.scene_signature,
+            'persistent_dir': self.persistent_dir,
+        }
+        # The state now belongs to the next frame's engine
+        self.mts_scene = None
+        self.scene_signature = None
+        self.persistent_dir = None
+
+    def release_animation_state(self):
+        global _animation_state
+        if _animation_state is not None:
+            _animation_state['persistent_dir'].cleanup()
+            _animation_state = None
+
+    def display_results(self, view_results):
+        '''
+        Write the final split Mitsuba bitmaps of each view to a new Blender render result
+
+        view_results: List of (view name, split bitmaps) tuples
+        '''
+        self.add_passes(view_results[0][1], [view for view, _ in view_results])
+        blender_result = self.begin_result(0, 0, self.size_x, self.size_y)
+        for view, render_results in view_results:
+            self.write_results(blender_result, render_results, view)
+        self.end_result(blender_result)
+
+    def get_pass_name(self, view, name):
+        '''
+        Name of the Blender render pass of a Mitsuba bitmap channel group.
+        Passes of additional views are prefixed with the view name.
+        '''
+        buf_name = name.replace("<root>", "Combined")
+        return f"{view} {buf_name}" if view else buf_name
+
+    def add_passes(self, render_results, views=('',)):
+        '''
+        Declare one Blender render pass per Mitsuba bitmap channel group and view.
+        This has to be called before begin_result().
+        '''
+        for view in views:
             for result in render_results:
-                buf_name = result[0].replace("<root>", "Combined")
+                buf_name = self.get_pass_name(view, result[0])
                 channel_count = result[1].channel_count() if result[1].channel_count() != 2 else 3
 
                 self.add_pass(buf_name, channel_count, ''.join([f.name.split('.')[-1] for f in result[1].struct_()]))
 
-            blender_result = self.begin_result(0, 0, self.size_x, self.size_y)
+    def get_pass_buffer(self, name, channel_count):
+        '''
+        Get the preallocated pixel buffer of a Blender render pass.
+        Buffers are reused across the passes of a progressive render.
+        '''
+        shape = (self.size_y, self.size_x, channel_count)
+        buffer = self.pass_buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            # Channels without a Mitsuba counterpart (e.g. alpha) stay at zero
+            buffer = np.zeros(shape, dtype=np.float32)
+            self.pass_buffers[name] = buffer
+        return buffer
 
-            for result in render_results:
-                render_pixels = np.array(result[1])
-                if result[1].channel_count() == 2:
-                    # Add a dummy third channel
-                    render_pixels = np.dstack((render_pixels, np.zeros((*render_pixels.shape[:2], 1))))
-                #render_pixels = np.array(render.convert(Bitmap.PixelFormat.RGBA, Struct.Type.Float32, srgb_gamma=False))
-                # Here we write the pixel values to the RenderResult
-                buf_name = result[0].replace("<root>", "Combined")
-                layer = blender_result.layers[0].passes[buf_name]
-                # print(render_pixels.shape, self.size_x, self.size_y)
-                # https://docs.blender.org/api/current/bpy.types.RenderEngine.html
-                # need array of 3D color vecs
-                # need to add alpha for some reason
-                render_pixels = np.dstack((render_pixels, np.zeros((*render_pixels.shape[:2], 1))))
-                tmp = np.flip(render_pixels, 0).reshape((self.size_x*self.size_y, -1))
-                # adding alpha channel
-                layer.rect = tmp 
+    def write_results(self, blender_result, render_results, view=''):
+        '''
+        Copy the pixels of the split Mitsuba bitmaps to the Blender render passes
+        '''
+        for name, bitmap in render_results:
+            buf_name = self.get_pass_name(view, name)
+            layer = blender_result.layers[0].passes[buf_name]
+            buffer = self.get_pass_buffer(buf_name, layer.channels)
+            # View on the bitmap's memory, this does not copy the pixels
+            pixels = np.asarray(bitmap).reshape((self.size_y, self.size_x, -1))
+            channel_count = min(pixels.shape[2], layer.channels)
+            # Blender stores the rows bottom to top: write through a flipped view
+            # of the buffer instead of flipping a copy of the pixels
+            np.copyto(buffer[::-1, :, :channel_count], pixels[:, :, :channel_count], casting='unsafe')
+            # https://docs.blender.org/api/current/bpy.types.RenderEngine.html
+            layer.rect.foreach_set(buffer.ravel())
+
+    def render_passes(self, mts_scene, sensor, pass_count, view_idx=0, view_count=1, progressive=True):
+        '''
+        Render the scene in several sample passes and yield the split running
+        average after each of them, or only after the last one if not progressive.
+
+        Every pass uses a different seed and a fraction of the sampler's sample
+        count. The developed film of each pass is accumulated, weighted by its
+        sample count, so that the final image uses the full sample budget.
+        Cancellation is checked before each pass, so a cancelled render stops
+        within one pass.
+
+        view_idx and view_count locate this sensor in the list of rendered
+        views, to report the overall progress.
+        '''
+        from mitsuba import Bitmap
+        film = sensor.film()
+        integrator = mts_scene.integrator()
+        spp = sensor.sampler().sample_count()
+        pass_count = max(1, min(pass_count, spp))
+
+        accumulated = None
+        rendered_spp = 0
+        for pass_idx in range(pass_count):
+            if self.test_break():
+                return
+            # Distribute the remainder over the first passes
+            pass_spp = spp // pass_count + (1 if pass_idx < spp % pass_count else 0)
+            integrator.render(mts_scene, sensor, seed=pass_idx, spp=pass_spp)
+            bitmap = film.bitmap()
+            if pass_count > 1:
+                pixels = np.array(bitmap, dtype=np.float32) * pass_spp
+                if accumulated is None:
+                    accumulated = pixels
+                else:
+                    accumulated += pixels
+            rendered_spp += pass_spp
+
+            self.update_progress((view_idx + (pass_idx + 1) / pass_count) / view_count)
+            stats = f"Pass {pass_idx + 1}/{pass_count} | {rendered_spp}/{spp} spp"
+            if view_count > 1:
+                stats = f"View {view_idx + 1}/{view_count} | {stats}"
+            self.update_stats("", stats)
+
+            if pass_count == 1:
+                # Nothing to accumulate
+                yield bitmap.split()
+                return
+            if not progressive and pass_idx < pass_count - 1:
+                continue
+            average = Bitmap(accumulated / rendered_spp,
+                             bitmap.pixel_format(),
+                             [f.name for f in bitmap.struct_()])
+            yield average.split()
+
+    def render_v3(self, mts_scene, views, pass_count, progressive):
+        '''
+        Render a Mitsuba 3 scene in sample passes and write the result to Blender.
+
+        views: List of (view name, sensor) tuples, rendered one after the other.
+        The first view is written to the main passes.
+
+        In progressive mode, the running average is displayed after each pass
+        and a cancelled render keeps the passes rendered so far. Otherwise, the
+        result is only written once all views are done.
+        '''
+        blender_result = None
+        view_results = []
+        for view_idx, (view, sensor) in enumerate(views):
+            render_results = None
+            for render_results in self.render_passes(mts_scene, sensor, pass_count, view_idx, len(views), progressive):
+                if progressive:
+                    if blender_result is None:
+                        # Passes can only be declared once the film's channels are known
+                        self.add_passes(render_results, [view for view, _ in views])
+                        blender_result = self.begin_result(0, 0, self.size_x, self.size_y)
+                    self.write_results(blender_result, render_results, view)
+                    self.update_result(blender_result)
+            if render_results is None or self.test_break():
+                break
+            view_results.append((view, render_results))
+
+        if blender_result is not None:
             self.end_result(blender_result)
+        elif view_results and len(view_results) == len(views) and not self.test_break():
+            self.display_results(view_results)
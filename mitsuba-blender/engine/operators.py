@@ -0,0 +1,102 @@
+import os
+import tempfile
+from concurrent.futures import as_completed, wait
+
+import bpy
+
+from ..io.exporter import SceneConverter
+from . import v1_workers
+
+def export_v1_frame(depsgraph, directory):
+    '''
+    Write the current frame of a scene for Mitsuba 0.6, seen from its active
+    camera, and return the path of the scene file.
+    '''
+    b_scene = depsgraph.scene
+    os.makedirs(directory, exist_ok=True)
+    filepath = os.path.join(directory, "scene.xml")
+    converter = SceneConverter()
+    converter.cameras = {b_scene.camera.name_full}
+    converter.set_path(filepath, xml_version="v1")
+    converter.scene_to_dict(depsgraph)
+    converter.dict_to_xml()
+    return filepath.replace(".xml", "_v1.xml")
+
+def save_v1_frame(b_scene, scene_file, frame):
+    '''
+    Save the image rendered from a scene file to the output path of a frame,
+    in the output format of the scene. Returns False if there is no image.
+    '''
+    image_file = scene_file.replace(".xml", ".exr")
+    if not os.path.isfile(image_file):
+        return False
+    image = bpy.data.images.load(image_file)
+    try:
+        image.save_render(b_scene.render.frame_path(frame=frame), scene=b_scene)
+    finally:
+        bpy.data.images.remove(image)
+    return True
+
+class MITSUBA_OT_render_animation_v1(bpy.types.Operator):
+    '''Render the frames of the animation with Mitsuba 0.6, several of them at the same time'''
+    bl_idname = "mitsuba.render_animation_v1"
+    bl_label = "Render Animation (v1)"
+
+    @classmethod
+    def poll(cls, context):
+        b_scene = context.scene
+        return b_scene.render.engine == 'MITSUBA' and b_scene.mitsuba.version == "v1" and b_scene.camera is not None
+
+    def execute(self, context):
+        b_scene = context.scene
+        mts_settings = b_scene.mitsuba
+        pool = v1_workers.get_pool(mts_settings.mtsv1exe, mts_settings.v1_servers, mts_settings.v1_threads,
+                                   mts_settings.v1_jobs, mts_settings.v1_python)
+        frames = list(range(b_scene.frame_start, b_scene.frame_end + 1, b_scene.frame_step))
+        window_manager = context.window_manager
+        window_manager.progress_begin(0, 2 * len(frames))
+        failed = []
+        with tempfile.TemporaryDirectory() as directory:
+            futures = {}
+            current_frame = b_scene.frame_current
+            try:
+                for frame_idx, frame in enumerate(frames):
+                    b_scene.frame_set(frame)
+                    scene_file = export_v1_frame(context.evaluated_depsgraph_get(),
+                                                 os.path.join(directory, str(frame)))
+                    # The frame renders while the next ones are exported
+                    futures[pool.submit(scene_file)] = (frame, scene_file)
+                    window_manager.progress_update(frame_idx)
+            except Exception:
+                # Do not remove the files of the frames being rendered
+                wait(futures)
+                raise
+            finally:
+                b_scene.frame_set(current_frame)
+
+            for done_count, future in enumerate(as_completed(futures)):
+                frame, scene_file = futures[future]
+                return_code, output = future.result()
+                if return_code != 0 or not save_v1_frame(b_scene, scene_file, frame):
+                    print(output.decode('utf-8', 'replace'))
+                    failed.append(frame)
+                window_manager.progress_update(len(frames) + done_count)
+        window_manager.progress_end()
+
+        if failed:
+            self.report({'WARNING'}, f"Failed to render the frames {', '.join(map(str, sorted(failed)))}")
+        else:
+            self.report({'INFO'}, f"Rendered {len(frames)} frames")
+        return {'FINISHED'}
+
+classes = (
+    MITSUBA_OT_render_animation_v1,
+)
+
+def register():
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+def unregister():
+    for cls in classes:
+        bpy.utils.unregister_class(cls)
@@ -297,6 +297,71 @@ class MitsubaRenderSettings(PropertyGroup):
         default = "/home/arpit/projects/practical-path-guiding/mitsuba/dist/mitsuba"
     )
 
+    v1_servers : IntProperty(
+        name = "v1 Render Servers",
+        description = "Number of Mitsuba 0.6 render servers (mtssrv) kept running between renders. "
+                      "With 0, each render starts a new Mitsuba process",
+        default = 0,
+        min = 0,
+        soft_max = 8
+    )
+
+    v1_threads : IntProperty(
+        name = "Threads per Server",
+        description = "Number of worker threads of each v1 render server, 0 to use all cores",
+        default = 0,
+        min = 0
+    )
+
+    v1_jobs : IntProperty(
+        name = "Concurrent Renders",
+        description = "Maximum number of frames rendered at the same time on the v1 render servers "
+                      "by the Render Animation (v1) operator",
+        default = 1,
+        min = 1,
+        soft_max = 8
+    )
+
+    v1_python : StringProperty(
+        name = "v1 Python",
+        description = "Python interpreter able to load the Mitsuba 0.6 Python bindings, to submit the renders "
+                      "to the v1 render servers from a persistent process. If empty or if it cannot load them, "
+                      "each render starts a new Mitsuba client process",
+        default = "python3"
+    )
+
+    progressive : BoolProperty(
+        name = "Progressive",
+        description = "Render in several sample passes and display the intermediate result after each pass",
+        default = False
+    )
+
+    pass_count : IntProperty(
+        name = "Passes",
+        description = "Number of sample passes the sample budget is split into. Cancellation is checked between passes",
+        default = 8,
+        min = 1,
+        soft_max = 64
+    )
+
+    multiview : EnumProperty(
+        name = "Cameras",
+        description = "Cameras rendered against the same loaded scene. The active camera is written to the main passes, "
+                      "the other ones to passes prefixed with the camera name",
+        items = [
+            ("ACTIVE", "Active Camera", "Only render the active camera"),
+            ("SELECTED", "Selected Cameras", "Render the active camera and the selected cameras"),
+            ("COLLECTION", "Camera Collection", "Render the active camera and the cameras of a collection"),
+        ],
+        default = "ACTIVE"
+    )
+
+    camera_collection : PointerProperty(
+        name = "Camera Collection",
+        description = "Collection of the cameras to render",
+        type = bpy.types.Collection
+    )
+
     # TODO: break variant into its subcomponents (backend/color/polarization/precision)
     enum_integrators = [(name, integrator['label'], integrator['description']) for name, integrator in integrator_data.items()]
 
@@ -447,6 +512,17 @@ def draw_device(self, context):
         col.prop(mts_settings, "variant")
         col.prop(mts_settings, "version")
         col.prop(mts_settings, "mtsv1exe")
+        if mts_settings.version == "v1":
+            col.prop(mts_settings, "v1_servers")
+            col.prop(mts_settings, "v1_threads")
+            col.prop(mts_settings, "v1_jobs")
+            col.prop(mts_settings, "v1_python")
+            col.operator("mitsuba.render_animation_v1")
+        col.prop(mts_settings, "progressive")
+        col.prop(mts_settings, "pass_count")
+        col.prop(mts_settings, "multiview")
+        if mts_settings.multiview == "COLLECTION":
+            col.prop(mts_settings, "camera_collection")
 
 def register():
     bpy.types.RENDER_PT_context.append(draw_device)
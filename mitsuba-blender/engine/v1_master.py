@@ -0,0 +1,143 @@
+'''
+Persistent Mitsuba 0.6 master, started by v1_workers.V1Master.
+
+This script does not run inside Blender: it is started with a Python
+interpreter that can load the Mitsuba 0.6 bindings of the distribution given
+on the command line. It connects once to the render servers over their
+sockets and renders the scene files it receives, so that no Mitsuba process
+has to be started for each render.
+
+Commands are read from the standard input and messages written to the
+standard output, one JSON object per line:
+
+    -> {"id": 1, "scene": "/path/to/scene_v1.xml"}    Render a scene file
+    -> {"id": 1, "cancel": true}                      Cancel a render
+    <- {"ready": true} or {"error": "..."}            Once connected, or not
+    <- {"id": 1, "progress": 0.5}
+    <- {"id": 1, "status": "done", "output": "..."}   Or "failed", "cancelled"
+
+The master cancels its renders and exits when its standard input is closed.
+'''
+
+import argparse
+import json
+import os.path as osp
+import queue
+import sys
+import threading
+
+_output_lock = threading.Lock()
+
+def send(message):
+    with _output_lock:
+        sys.stdout.write(json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+def read_commands(commands):
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            commands.put(json.loads(line))
+    # End of the input, the master has to exit
+    commands.put(None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dist', required=True, help="Directory of the Mitsuba 0.6 distribution")
+    parser.add_argument('--servers', required=True, help="Render servers, as 'host:port;host:port'")
+    args = parser.parse_args()
+
+    # The bindings are shipped for each Python version in the distribution
+    sys.path.insert(0, osp.join(args.dist, 'python', f"{sys.version_info[0]}.{sys.version_info[1]}"))
+    try:
+        from mitsuba.core import (Appender, EWarn, FileResolver, RemoteWorker, Scheduler,
+                                  SocketStream, StringMap, Thread)
+        from mitsuba.render import RenderJob, RenderQueue, SceneHandler
+    except ImportError as e:
+        send({"error": f"Cannot load the Mitsuba 0.6 Python bindings: {e}"})
+        return 1
+
+    # Jobs being rendered, by id
+    jobs = {}
+    # Log messages of the running jobs, sent back when they finish
+    log = []
+
+    class JobAppender(Appender):
+        ''' Forward the log to the jobs instead of the standard output used by the protocol '''
+        def append(self, level, message):
+            if level >= EWarn:
+                log.append(message)
+
+        def logProgress(self, progress, name, formatted, eta):
+            # Progress bars cannot be told apart, they are only reported for a single job
+            if len(jobs) == 1:
+                send({"id": next(iter(jobs)), "progress": min(max(progress / 100.0, 0.0), 1.0)})
+
+    logger = Thread.getThread().getLogger()
+    logger.clearAppenders()
+    logger.addAppender(JobAppender())
+
+    scheduler = Scheduler.getInstance()
+    try:
+        for i, server in enumerate(args.servers.split(';')):
+            host, port = server.rsplit(':', 1)
+            scheduler.registerWorker(RemoteWorker(f"server{i}", SocketStream(host, int(port))))
+        scheduler.start()
+    except Exception as e:
+        send({"error": f"Cannot connect to the render servers: {e}"})
+        return 1
+
+    render_queue = RenderQueue()
+    commands = queue.Queue()
+    threading.Thread(target=read_commands, args=(commands,), daemon=True).start()
+    send({"ready": True})
+
+    running = True
+    cancelled = set()
+    while running or jobs:
+        try:
+            command = commands.get(timeout=0.1)
+        except queue.Empty:
+            command = {}
+        if command is None:
+            running = False
+            for job_id, job in jobs.items():
+                job.cancel()
+                cancelled.add(job_id)
+        elif command.get("cancel"):
+            job = jobs.get(command["id"])
+            if job is not None:
+                job.cancel()
+                cancelled.add(command["id"])
+        elif "scene" in command:
+            scene_file = command["scene"]
+            try:
+                # Resolve the files of the scene next to it, not next to previous scenes
+                file_resolver = FileResolver()
+                file_resolver.prependPath(osp.dirname(scene_file))
+                Thread.getThread().setFileResolver(file_resolver)
+                scene = SceneHandler.loadScene(scene_file, StringMap())
+                # Written next to the scene file, like the mitsuba executable does
+                scene.setDestinationFile(osp.splitext(scene_file)[0])
+                job = RenderJob(f"job{command['id']}", scene, render_queue)
+                job.start()
+            except Exception as e:
+                send({"id": command["id"], "status": "failed", "output": str(e)})
+                continue
+            jobs[command["id"]] = job
+
+        for job_id, job in list(jobs.items()):
+            if job.isRunning():
+                continue
+            del jobs[job_id]
+            status = "cancelled" if job_id in cancelled else "done"
+            cancelled.discard(job_id)
+            send({"id": job_id, "status": status, "output": "\n".join(log)})
+            if not jobs:
+                log.clear()
+
+    scheduler.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,445 @@
+'''
+Warm Mitsuba 0.6 render servers shared by the renders of the v1 path.
+
+Starting the Mitsuba 0.6 executable and loading its plugins has a noticeable
+cost for each frame of an animation. The pool keeps a number of render
+servers (mtssrv) running between renders, and a persistent master process
+(see v1_master.py) connected to them over their sockets, which the renders
+are submitted to. If the master cannot run, e.g. without the Mitsuba 0.6
+Python bindings, each render starts a light scheduling-only client instead.
+'''
+
+import atexit
+import json
+import os
+import os.path as osp
+import re
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Progress bar printed by Mitsuba 0.6, e.g. "Rendering: [+++++      ] (1.2s, ETA: 3.4s)"
+_progress_re = re.compile(rb'\[(\+*)( *)\]')
+
+def v1_environment(exe):
+    '''
+    Environment to run the Mitsuba 0.6 executables found next to 'exe'
+    '''
+    env = os.environ.copy()
+    mit1_dir = osp.dirname(exe)
+    env["PATH"] = mit1_dir + os.pathsep + env.get("PATH", "")
+    env["LD_LIBRARY_PATH"] = mit1_dir + os.pathsep + env.get("LD_LIBRARY_PATH", "")
+    return env
+
+def parse_progress(chunk):
+    '''
+    Return the progress in [0, 1] of the last progress bar in a chunk of
+    output, or None if it does not contain any.
+    '''
+    matches = _progress_re.findall(chunk)
+    if not matches:
+        return None
+    done, todo = matches[-1]
+    if len(done) + len(todo) == 0:
+        return None
+    return len(done) / (len(done) + len(todo))
+
+def run_process(args, env, progress_callback=None, test_break=None):
+    '''
+    Run a Mitsuba 0.6 executable and wait for it to finish.
+
+    The output is read while the process runs and progress bars are reported
+    to progress_callback. The process is killed as soon as test_break()
+    returns True. Both callbacks are called from the calling thread.
+
+    Returns a (return code, output) tuple, the return code being None if the
+    process was cancelled.
+    '''
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    output = []
+    progress = [None]
+
+    def read_output():
+        # Progress bars are updated with carriage returns, do not wait for new lines
+        for chunk in iter(lambda: process.stdout.read1(4096), b''):
+            output.append(chunk)
+            chunk_progress = parse_progress(chunk)
+            if chunk_progress is not None:
+                progress[0] = chunk_progress
+
+    # Drain the output in the background so that the process never blocks on a full pipe
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    reported_progress = None
+    while True:
+        try:
+            return_code = process.wait(timeout=0.1)
+            break
+        except subprocess.TimeoutExpired:
+            if progress_callback is not None and progress[0] != reported_progress:
+                reported_progress = progress[0]
+                progress_callback(reported_progress)
+            if test_break is not None and test_break():
+                process.kill()
+                process.wait()
+                reader.join()
+                return None, b''.join(output)
+    reader.join()
+    if progress_callback is not None and progress[0] != reported_progress:
+        progress_callback(progress[0])
+    return return_code, b''.join(output)
+
+def free_port():
+    '''
+    Find a local port that no other server listens on
+    '''
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class _MasterJob:
+    def __init__(self):
+        self.progress = None
+        self.status = None
+        self.output = ''
+        self.done = threading.Event()
+
+class V1Master:
+    '''
+    Persistent Mitsuba 0.6 master process, connected to the render servers
+    listening on the given local ports. Renders are submitted to it as JSON
+    lines, see v1_master.py for the protocol.
+
+    python: Python interpreter able to load the Mitsuba 0.6 bindings
+    exe: Path to the Mitsuba 0.6 executable, the bindings are looked for next to it
+    '''
+    script = osp.join(osp.dirname(osp.abspath(__file__)), "v1_master.py")
+
+    def __init__(self, python, exe, ports, env):
+        self.python = python
+        self.exe = exe
+        self.ports = ports
+        self.env = env
+        self.process = None
+        self.jobs = {}
+        self.next_id = 0
+        # Messages that are not about a job, i.e. whether the master is ready
+        self.status = []
+        self.status_received = threading.Condition()
+        self.lock = threading.Lock()
+
+    def start(self, timeout=10.0):
+        '''
+        Start the master and wait for it to connect to the servers.
+        Returns False if it could not.
+        '''
+        args = [self.python, self.script, "--dist", osp.dirname(self.exe),
+                "--servers", ";".join(f"127.0.0.1:{port}" for port in self.ports)]
+        try:
+            self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL, env=self.env,
+                                            text=True, bufsize=1)
+        except OSError as e:
+            print(f"Cannot start the Mitsuba 0.6 master: {e}")
+            return False
+        threading.Thread(target=self.read_messages, daemon=True).start()
+        with self.status_received:
+            self.status_received.wait_for(lambda: self.status, timeout)
+            status = self.status[0] if self.status else {"error": "Timed out"}
+        if not status.get("ready"):
+            print(f"Mitsuba 0.6 master failed to start: {status.get('error')}")
+            self.stop()
+            return False
+        return True
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def read_messages(self):
+        for line in self.process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if "id" not in message:
+                with self.status_received:
+                    self.status.append(message)
+                    self.status_received.notify_all()
+                continue
+            with self.lock:
+                job = self.jobs.get(message["id"])
+            if job is None:
+                continue
+            if "progress" in message:
+                job.progress = message["progress"]
+            if "status" in message:
+                job.status = message["status"]
+                job.output = message.get("output", '')
+                job.done.set()
+        # The master exited: jobs still waiting for it failed
+        with self.status_received:
+            self.status.append({"error": "The master exited"})
+            self.status_received.notify_all()
+        with self.lock:
+            for job in self.jobs.values():
+                if job.status is None:
+                    job.status = "failed"
+                    job.output = "The Mitsuba 0.6 master exited"
+                    job.done.set()
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def render(self, scene_file, progress_callback=None, test_break=None):
+        '''
+        Render a Mitsuba 0.6 scene file and wait for it to finish.
+        Same callbacks and result as run_process.
+        '''
+        job = _MasterJob()
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+            self.jobs[job_id] = job
+            try:
+                self.send({"id": job_id, "scene": scene_file})
+            except (OSError, ValueError):
+                # The master exited
+                job.status = "failed"
+                job.done.set()
+        try:
+            reported_progress = None
+            while not job.done.wait(0.1):
+                if progress_callback is not None and job.progress != reported_progress:
+                    reported_progress = job.progress
+                    progress_callback(reported_progress)
+                if test_break is not None and test_break():
+                    with self.lock:
+                        try:
+                            self.send({"id": job_id, "cancel": True})
+                        except (OSError, ValueError):
+                            pass
+                    if not job.done.wait(30):
+                        # The master does not answer anymore
+                        self.stop()
+                    return None, job.output.encode()
+            if progress_callback is not None and job.progress != reported_progress:
+                progress_callback(job.progress)
+            if job.status == "cancelled":
+                return None, job.output.encode()
+            return (0 if job.status == "done" else 1), job.output.encode()
+        finally:
+            with self.lock:
+                del self.jobs[job_id]
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            # The master cancels its renders and exits at the end of its input
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+class V1WorkerPool:
+    '''
+    Pool of Mitsuba 0.6 render servers, listening on free local ports.
+
+    exe: Path to the Mitsuba 0.6 executable, mtssrv is looked for next to it
+    server_count: Number of servers to keep running
+    threads_per_server: Worker threads of each server, 0 to use all cores
+    max_jobs: Maximum number of renders submitted at the same time
+    python: Python interpreter able to load the Mitsuba 0.6 bindings, to run
+        the persistent master. Without it, each render starts a client process.
+    '''
+    # Attempts to start a server, the port picked for it may have been taken in between
+    bind_attempts = 3
+
+    def __init__(self, exe, server_count, threads_per_server=0, max_jobs=1, python=''):
+        self.exe = exe
+        self.server_count = server_count
+        self.threads_per_server = threads_per_server
+        self.max_jobs = max_jobs
+        self.python = python
+        self.env = v1_environment(exe)
+        self.servers = []
+        self.ports = []
+        # Set when the servers failed to start, renders then run locally
+        self.failed = False
+        self.master = None
+        # Set when the master failed to start, renders then start client processes
+        self.master_failed = False
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @property
+    def server_exe(self):
+        return osp.join(osp.dirname(self.exe), "mtssrv")
+
+    @property
+    def settings(self):
+        return (self.exe, self.server_count, self.threads_per_server, self.max_jobs, self.python)
+
+    def start(self, timeout=10.0):
+        '''
+        Start the servers if they are not all running, and wait for them to
+        accept connections. Returns False if they could not be started, in
+        which case they are not tried again by this pool.
+        '''
+        with self.lock:
+            if self.failed:
+                return False
+            if self.servers and all(server.poll() is None for server in self.servers):
+                return True
+            self.stop_servers()
+            if not osp.isfile(self.server_exe):
+                print(f"Cannot find the Mitsuba 0.6 render server at {self.server_exe}")
+                self.failed = True
+                return False
+            deadline = time.monotonic() + timeout
+            for _ in range(self.server_count):
+                server, port = self.start_server(deadline)
+                if server is None:
+                    print("Mitsuba 0.6 render servers failed to start, rendering locally")
+                    self.stop_servers()
+                    self.failed = True
+                    return False
+                self.servers.append(server)
+                self.ports.append(port)
+            return True
+
+    def start_server(self, deadline):
+        '''
+        Start a server on a free port and wait for it to accept connections.
+        Returns a (process, port) tuple, or (None, None) if it did not start.
+        '''
+        for _ in range(self.bind_attempts):
+            # Port picked by the system, not to clash with other servers running on this machine.
+            # Another process may bind it before the server does, the server then exits.
+            port = free_port()
+            args = [self.server_exe, "-i", "127.0.0.1", "-l", str(port), "-q"]
+            if self.threads_per_server > 0:
+                args += ["-p", str(self.threads_per_server)]
+            server = subprocess.Popen(args, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL, env=self.env)
+            while server.poll() is None:
+                if self.is_listening(port):
+                    return server, port
+                if time.monotonic() > deadline:
+                    server.kill()
+                    server.wait()
+                    return None, None
+                time.sleep(0.05)
+        return None, None
+
+    @staticmethod
+    def is_listening(port):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(0.1)
+            return sock.connect_ex(("127.0.0.1", port)) == 0
+
+    def stop_servers(self):
+        # The master is connected to the servers
+        if self.master is not None:
+            self.master.stop()
+            self.master = None
+        for server in self.servers:
+            if server.poll() is None:
+                server.terminate()
+        for server in self.servers:
+            try:
+                server.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        self.servers = []
+        self.ports = []
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        with self.lock:
+            self.stop_servers()
+
+    def get_master(self):
+        '''
+        Get the master connected to the running servers, starting it if needed.
+        Returns None if it cannot run.
+        '''
+        with self.lock:
+            if self.master is not None and not self.master.is_running():
+                self.master.stop()
+                self.master = None
+            if self.master is None and not self.master_failed and self.python:
+                master = V1Master(self.python, self.exe, self.ports, self.env)
+                if master.start():
+                    self.master = master
+                else:
+                    self.master_failed = True
+            return self.master
+
+    def render(self, scene_file, progress_callback=None, test_break=None):
+        '''
+        Render a Mitsuba 0.6 scene file on the servers, through the master if
+        it runs, or else with a client process. Falls back to a local render
+        process if the servers are not available.
+
+        Returns a (return code, output) tuple, see run_process.
+        '''
+        args = [self.exe, scene_file]
+        if self.server_count > 0 and self.start():
+            master = self.get_master()
+            if master is not None:
+                return master.render(scene_file, progress_callback, test_break)
+            connection = ";".join(f"127.0.0.1:{port}" for port in self.ports)
+            # The local process only schedules the work, the servers render it
+            args = [self.exe, "-c", connection, "-p", "0", scene_file]
+        return run_process(args, self.env, progress_callback, test_break)
+
+    def submit(self, scene_file):
+        '''
+        Render a Mitsuba 0.6 scene file in the background. At most max_jobs
+        renders run at the same time, the other ones wait for their turn.
+
+        Returns a future of the (return code, output) tuple of render().
+        '''
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=max(1, self.max_jobs))
+        return self.executor.submit(self.render, scene_file)
+
+_pool = None
+
+def get_pool(exe, server_count, threads_per_server=0, max_jobs=1, python=''):
+    '''
+    Get the shared worker pool, restarting it if its settings changed
+    '''
+    global _pool
+    settings = (exe, server_count, threads_per_server, max_jobs, python)
+    if _pool is not None and _pool.settings != settings:
+        _pool.stop()
+        _pool = None
+    if _pool is None:
+        _pool = V1WorkerPool(exe, server_count, threads_per_server, max_jobs, python)
+    return _pool
+
+def shutdown():
+    '''
+    Stop the servers of the shared pool
+    '''
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+# Do not leave servers behind when Blender quits
+atexit.register(shutdown)
@@ -11,6 +11,8 @@ import bpy
 from bpy.props import (
         StringProperty,
         BoolProperty,
+        EnumProperty,
+        FloatProperty,
     )
 from bpy_extras.io_utils import (
         ImportHelper,
@@ -19,8 +21,6 @@ from bpy_extras.io_utils import (
         axis_conversion
     )
 
-from os import path as osp
-from glob import glob
 from . import bl_utils
 from . import importer
 from . import exporter
@@ -110,6 +110,58 @@ class ExportMitsuba(bpy.types.Operator, ExportHelper):
             default = True
     )
 
+    ply_writer: EnumProperty(
+            name = "PLY Writer",
+            description = "How to write mesh files",
+            items = [
+                ('MITSUBA', "Mitsuba", "Build a Mitsuba mesh for each part and write it with Mitsuba"),
+                ('NUMPY', "NumPy", "Write the mesh buffers directly, without building Mitsuba meshes. "
+                                   "Uses less memory on large meshes"),
+            ],
+            default = 'MITSUBA'
+    )
+
+    mesh_format: EnumProperty(
+            name = "Mesh Format",
+            description = "File format of the exported meshes",
+            items = [
+                ('PLY', "PLY", "One binary PLY file per mesh"),
+                ('SERIALIZED', "Serialized", "All the meshes in one compressed .serialized file"),
+                ('SERIALIZED_COLLECTION', "Serialized per Collection",
+                 "One compressed .serialized file per collection"),
+            ],
+            default = 'PLY'
+    )
+
+    merge_meshes: BoolProperty(
+            name = "Merge Static Meshes",
+            description = "Merge the meshes of the objects that are not instanced nor animated "
+                          "into one shape per material",
+            default = False
+    )
+
+    merge_cell_size: FloatProperty(
+            name = "Merge Cell Size",
+            description = "Only merge meshes whose centers are in the same cell of this size. "
+                          "0 merges all the meshes using the same material",
+            default = 0.0,
+            min = 0.0,
+            subtype = 'DISTANCE'
+    )
+
+    instance_duplicates: BoolProperty(
+            name = "Instance Linked Duplicates",
+            description = "Export meshes shared by several objects only once, and instantiate them for each object",
+            default = False
+    )
+
+    incremental: BoolProperty(
+            name = "Incremental Export",
+            description = "Only write the meshes and textures that changed since the last export to this folder, "
+                          "and remove the ones that are no longer used",
+            default = False
+    )
+
     downgrade: BoolProperty(
             name = "Downgrade",
             description="Downgrade to 0.6v",
@@ -136,6 +188,12 @@ class ExportMitsuba(bpy.types.Operator, ExportHelper):
         self.converter.export_ctx.export_ids = self.export_ids
 
         self.converter.use_selection = self.use_selection
+        self.converter.export_ctx.ply_writer = self.ply_writer
+        self.converter.export_ctx.mesh_format = self.mesh_format
+        self.converter.export_ctx.merge_meshes = self.merge_meshes
+        self.converter.export_ctx.merge_cell_size = self.merge_cell_size
+        self.converter.export_ctx.instance_duplicates = self.instance_duplicates
+        self.converter.incremental = self.incremental
 
         # Set path to scene .xml file
         self.converter.set_path(self.filepath, split_files=self.split_files)
@@ -158,12 +216,8 @@ class ExportMitsuba(bpy.types.Operator, ExportHelper):
         # downgrade
         if self.downgrade:
             print("- -- - ", self.filepath)
-            folder = osp.dirname(self.filepath)
-            fns = glob(osp.join(folder, "*/*.xml"), recursive=True) +\
-                        glob(osp.join(folder, "*.xml"), recursive=True)
-            for fname in fns:
-                print(f"Checking {fname}")
-                exporter.convert(fname)
+            # Only convert the files of this export, not older outputs lying in the folder
+            exporter.convert_files(self.converter.xml_files())
 
         #reset the exporter
         self.reset()
@@ -12,6 +12,14 @@ if "bpy" in locals():
         importlib.reload(lights)
     if "camera" in locals():
         importlib.reload(camera)
+    if "update" in locals():
+        importlib.reload(update)
+    if "xml_v1" in locals():
+        importlib.reload(xml_v1)
+    if "manifest" in locals():
+        importlib.reload(manifest)
+    if "writer" in locals():
+        importlib.reload(writer)
 
 import bpy
 
@@ -20,7 +28,20 @@ from . import materials
 from . import geometry
 from . import lights
 from . import camera
-from .downgrade import convert
+from . import update
+from . import manifest
+from . import writer
+from .downgrade import convert, convert_files
+
+# Object types that are exported by the converter
+_geometry_types = {'MESH', 'FONT', 'SURFACE', 'META'}
+_exported_types = _geometry_types | {'CAMERA', 'LIGHT'}
+
+def _has_instances(b_object):
+    '''
+    Whether an object instances other objects, through particles or instancing
+    '''
+    return b_object.is_instancer or len(b_object.particle_systems) > 0
 
 class SceneConverter:
     '''
@@ -32,17 +53,37 @@ class SceneConverter:
         self.use_selection = False # Only export selection
         self.ignore_background = True
         self.render = render
+        self.export_ctx.render = render
+        # Names of the cameras to export. If None, all of them are exported,
+        # or only the active one in render mode
+        self.cameras = None
+        # Only write the files that changed since the last export to the same folder
+        self.incremental = False
 
-    def set_path(self, name, split_files=False):
+    def set_path(self, name, split_files=False, xml_version="v3"):
+        '''
+        Set the path of the scene file. With xml_version "v1", the scene is
+        written for Mitsuba 0.6, to a file with a "_v1" suffix.
+        '''
         from mitsuba.python.xml import WriteXML
         # Ideally, this should only be created if we want to write a scene.
-        # For now we need it to save meshes and packed textures.
+        # In render mode, meshes are kept in memory, but we still need the
+        # directory to save packed textures.
         # TODO: get rid of all writing to disk when creating the dict
         if not self.render:
-            self.xml_writer = WriteXML(name, self.export_ctx.subfolders,
-                                       split_files=split_files)
+            if xml_version == "v1":
+                from .xml_v1 import WriteXMLv1
+                writer_class = WriteXMLv1
+            else:
+                writer_class = WriteXML
+            self.xml_writer = writer_class(name, self.export_ctx.subfolders,
+                                           split_files=split_files)
         # Give the path to the export context, for saving meshes and files
-        self.export_ctx.directory, _ = os.path.split(name)
+        self.export_ctx.directory, scene_file = os.path.split(name)
+        if self.incremental and not self.render:
+            self.export_ctx.manifest = manifest.ExportManifest(self.export_ctx.directory, scene_file)
+        if not self.render:
+            self.export_ctx.writer = writer.BackgroundWriter()
 
     def scene_to_dict(self, depsgraph, window_manager=None):
         # Switch to object mode before exporting stuff, so everything is defined properly
@@ -65,13 +106,18 @@ class SceneConverter:
         materials.export_world(self.export_ctx, b_scene.world, self.ignore_background)
 
         # Establish list of particle objects
-        particles = []
+        particles = set()
         for particle_sys in bpy.data.particles:
             if particle_sys.render_type == 'OBJECT':
-                particles.append(particle_sys.instance_object.name)
+                particles.add(particle_sys.instance_object.name)
             elif particle_sys.render_type == 'COLLECTION':
                 for obj in particle_sys.instance_collection.objects:
-                    particles.append(obj.name)
+                    particles.add(obj.name)
+
+        # Meshes shared by several objects are exported once and instantiated.
+        # Objects are tracked individually when exporting IDs, for in place updates.
+        if self.export_ctx.instance_duplicates and not self.export_ctx.export_ids:
+            self.export_ctx.linked_meshes = geometry.linked_meshes(depsgraph, particles)
 
         progress_counter = 0
         # Main export loop
@@ -88,27 +134,241 @@ class SceneConverter:
                     and not object_instance.object.parent.original.select_get()):
                     continue
 
-            evaluated_obj = object_instance.object
-            object_type = evaluated_obj.type
-            #type: enum in [‘MESH’, ‘CURVE’, ‘SURFACE’, ‘META’, ‘FONT’, ‘ARMATURE’, ‘LATTICE’, ‘EMPTY’, ‘GPENCIL’, ‘CAMERA’, ‘LIGHT’, ‘SPEAKER’, ‘LIGHT_PROBE’], default ‘EMPTY’, (readonly)
-            if evaluated_obj.hide_render or (object_instance.is_instance
-                and evaluated_obj.parent and evaluated_obj.parent.original.hide_render):
-                self.export_ctx.log("Object: {} is hidden for render. Ignoring it.".format(evaluated_obj.name), 'INFO')
-                continue#ignore it since we don't want it rendered (TODO: hide_viewport)
-            if object_type in {'MESH', 'FONT', 'SURFACE', 'META'}:
+            self.export_ctx.instance_index = progress_counter - 1
+            self.export_object_instance(object_instance, b_scene, particles)
+
+        if self.export_ctx.merged_parts:
+            geometry.export_merged(self.export_ctx)
+        self.export_ctx.export_instances(depsgraph, progress_counter)
+        self.export_ctx.log(f"Materials: {self.export_ctx.material_misses} converted, "
+                            f"{self.export_ctx.material_hits} reused from the conversion cache.", 'INFO')
+
+    def export_object_instance(self, object_instance, b_scene, particles):
+        '''
+        Export a single object instance of the dependency graph
+        '''
+        evaluated_obj = object_instance.object
+        object_type = evaluated_obj.type
+        #type: enum in [‘MESH’, ‘CURVE’, ‘SURFACE’, ‘META’, ‘FONT’, ‘ARMATURE’, ‘LATTICE’, ‘EMPTY’, ‘GPENCIL’, ‘CAMERA’, ‘LIGHT’, ‘SPEAKER’, ‘LIGHT_PROBE’], default ‘EMPTY’, (readonly)
+        if evaluated_obj.hide_render or (object_instance.is_instance
+            and evaluated_obj.parent and evaluated_obj.parent.original.hide_render):
+            self.export_ctx.log("Object: {} is hidden for render. Ignoring it.".format(evaluated_obj.name), 'INFO')
+            return#ignore it since we don't want it rendered (TODO: hide_viewport)
+        if object_type in _geometry_types:
+            group_id = self.export_ctx.instance_groups.get(evaluated_obj.name_full) if object_instance.is_instance else None
+            if group_id is not None:
+                # The shapegroup already exists, only add an instance of it
+                self.export_ctx.add_instance(group_id)
+            else:
                 geometry.export_object(object_instance, self.export_ctx, evaluated_obj.name in particles)
-            elif object_type == 'CAMERA':
-                # When rendering inside blender, export only the active camera
-                if (self.render and evaluated_obj.name_full == b_scene.camera.name_full) or not self.render:
-                    camera.export_camera(object_instance, b_scene, self.export_ctx)
-            elif object_type == 'LIGHT':
-                lights.export_light(object_instance, self.export_ctx)
+        elif object_type == 'CAMERA':
+            # Export the requested cameras, or all of them unless rendering inside blender,
+            # which only needs the active one
+            if self.cameras is not None:
+                exported = evaluated_obj.name_full in self.cameras
+            else:
+                exported = not self.render or evaluated_obj.name_full == b_scene.camera.name_full
+            if exported:
+                camera.export_camera(object_instance, b_scene, self.export_ctx)
+        elif object_type == 'LIGHT':
+            lights.export_light(object_instance, self.export_ctx)
+        else:
+            self.export_ctx.log("Object: %s of type '%s' is not supported!" % (evaluated_obj.name_full, object_type), 'WARN')
+
+    def update_scene(self, depsgraph, mts_scene):
+        '''
+        Patch a Mitsuba scene previously loaded from this converter's scene dict
+        with the changes recorded in the dependency graph, without reloading it.
+
+        Transforms and deformations of meshes are applied to their vertex
+        buffers, while cameras, lights, materials and the world are exported
+        again and the differences with the previous export are pushed to the
+        scene parameters.
+
+        This requires the scene to have been exported with IDs. Returns False
+        if some of the changes cannot be applied in place (e.g. topology changes
+        or new objects), in which case the scene has to be rebuilt.
+        '''
+        exported_objects = self.export_ctx.exported_objects
+
+        transformed = set()
+        deformed = set()
+        materials_changed = set()
+        world_changed = False
+        for deg_update in depsgraph.updates:
+            b_id = deg_update.id.original
+            if isinstance(b_id, bpy.types.Object):
+                if b_id.type not in _exported_types:
+                    continue
+                if b_id.name_full not in exported_objects:
+                    # New or instanced object
+                    return False
+                if (deg_update.is_updated_geometry or deg_update.is_updated_transform) and _has_instances(b_id):
+                    # Instances and particles of the object are not updated in place
+                    return False
+                if deg_update.is_updated_geometry:
+                    deformed.add(b_id.name_full)
+                if deg_update.is_updated_transform:
+                    transformed.add(b_id.name_full)
+            elif isinstance(b_id, (bpy.types.Light, bpy.types.Camera)):
+                # Settings of the data are exported along with the object
+                transformed.update(name for name, record in exported_objects.items() if record['data'] == b_id.name_full)
+            elif isinstance(b_id, bpy.types.Material):
+                materials_changed.add(b_id)
+            elif isinstance(b_id, bpy.types.World):
+                world_changed = True
+            elif isinstance(b_id, bpy.types.Collection):
+                # Objects may have been added, removed or hidden
+                return False
+
+        return self.apply_updates(depsgraph, mts_scene, transformed, deformed, materials_changed, world_changed)
+
+    def update_frame(self, depsgraph, mts_scene):
+        '''
+        Patch a Mitsuba scene previously loaded from this converter's scene dict
+        to show another frame of an animation.
+
+        Unlike update_scene(), this does not rely on the updates recorded in the
+        dependency graph, which may be a new one for each frame. Objects are
+        instead classified by comparing them to their state at the previous
+        frame: static meshes are left untouched, rigidly moving ones get their
+        vertices transformed and deforming ones (see geometry.may_deform) get
+        new vertex buffers. Cameras, lights and animated materials or world are
+        exported again, and only their differences are pushed to the scene.
+
+        Returns False if the scene has to be rebuilt, e.g. if objects appeared
+        or disappeared, or if the scene contains instances.
+        '''
+        exported_objects = self.export_ctx.exported_objects
+
+        transformed = set()
+        deformed = set()
+        current_objects = set()
+        for object_instance in depsgraph.object_instances:
+            b_object = object_instance.object
+            if b_object.type not in _exported_types:
+                continue
+            if object_instance.is_instance:
+                # The transforms of instances are not tracked
+                return False
+            name = b_object.name_full
+            record = exported_objects.get(name)
+            if record is None:
+                if b_object.hide_render or b_object.type == 'CAMERA':
+                    # Hidden objects and inactive cameras are not exported
+                    continue
+                return False
+            current_objects.add(name)
+            if record['type'] not in _geometry_types:
+                # Cheap to export again, unchanged settings will not be patched
+                transformed.add(name)
+            elif record['deforming']:
+                deformed.add(name)
+            elif record['matrix'] != b_object.matrix_world:
+                transformed.add(name)
+        if current_objects != exported_objects.keys():
+            return False
+
+        def is_animated(b_id):
+            node_tree = b_id.node_tree
+            return b_id.animation_data is not None or (node_tree is not None and node_tree.animation_data is not None)
+
+        materials_changed = set()
+        for b_mat in bpy.data.materials:
+            mat_id = f"mat-{b_mat.name}"
+            exported = self.export_ctx.data_get(mat_id) is not None or self.export_ctx.exported_mats.has_mat(mat_id)
+            if exported and is_animated(b_mat):
+                materials_changed.add(b_mat)
+        b_world = depsgraph.scene.world
+        world_changed = b_world is not None and is_animated(b_world)
+
+        return self.apply_updates(depsgraph, mts_scene, transformed, deformed, materials_changed, world_changed)
+
+    def apply_updates(self, depsgraph, mts_scene, transformed, deformed, materials_changed, world_changed):
+        '''
+        Push the changes of the given objects, materials and world to a Mitsuba
+        scene loaded from this converter's scene dict.
+
+        transformed: Names of the objects that moved, or whose settings changed
+        deformed: Names of the objects whose geometry changed
+        materials_changed: Blender materials to export again
+        world_changed: Whether to export the world again
+
+        Returns False if some of the changes cannot be applied in place.
+        '''
+        from mitsuba import traverse
+        exported_objects = self.export_ctx.exported_objects
+        if not (transformed or deformed or materials_changed or world_changed):
+            return True
+
+        # Export the changed cameras, lights, materials and world to a new dict
+        # and compare it to the current one.
+        changes = SceneConverter(render=self.render)
+        changes.export_ctx.export_ids = True
+        changes.export_ctx.axis_mat = self.export_ctx.axis_mat
+        changes.export_ctx.directory = self.export_ctx.directory
+        changes.export_ctx.deg = depsgraph
+        # Same cameras as the scene being patched, not only the active one
+        changes.cameras = self.cameras
+        # Materials whose node tree did not change are not converted nor patched again
+        changes.export_ctx.material_cache = self.export_ctx.material_cache
+
+        params = traverse(mts_scene)
+        b_scene = depsgraph.scene
+        for object_instance in depsgraph.object_instances:
+            if object_instance.is_instance:
+                continue
+            b_object = object_instance.object
+            name = b_object.name_full
+            if name not in transformed and name not in deformed:
+                continue
+            if b_object.hide_render:
+                return False
+            record = exported_objects[name]
+            if record['type'] in _geometry_types:
+                if not geometry.update_object(self.export_ctx, b_object, record, params, name in deformed):
+                    return False
             else:
-                self.export_ctx.log("Object: %s of type '%s' is not supported!" % (evaluated_obj.name_full, object_type), 'WARN')
+                changes.export_object_instance(object_instance, b_scene, [])
+        for b_mat in materials_changed:
+            if self.export_ctx.exported_mats.has_mat(f"mat-{b_mat.name}"):
+                # Emissive materials are stored in the shapes
+                return False
+            materials.export_material(changes.export_ctx, b_mat)
+        if world_changed:
+            materials.export_world(changes.export_ctx, b_scene.world, self.ignore_background)
+
+        for name, new_entry in changes.export_ctx.scene_data.items():
+            if name == 'type':
+                continue
+            old_entry = self.export_ctx.data_get(name)
+            if old_entry is None or not update.patch_params(params, name, old_entry, new_entry):
+                return False
+            self.export_ctx.scene_data[name] = new_entry
+
+        params.update()
+        return True
 
     def dict_to_xml(self):
+        # All the mesh and texture files are written before the scene file
+        self.export_ctx.wait_writes()
+        self.export_ctx.write_serialized()
         self.xml_writer.process(self.export_ctx.scene_data)
+        if self.export_ctx.manifest is not None:
+            # Remove the files of the previous export that are no longer used
+            self.export_ctx.manifest.save()
+
+    def xml_files(self):
+        '''
+        Paths of the XML files written by dict_to_xml(): the main scene file
+        and its fragments when splitting files.
+        '''
+        return [f.name for f in self.xml_writer.files if f is not None]
 
     def dict_to_scene(self):
         from mitsuba import load_dict
-        return load_dict(self.export_ctx.scene_data)
+        self.export_ctx.wait_writes()
+        # Use the objects that were already instantiated during the export
+        loaded_objects = self.export_ctx.loaded_objects
+        scene_data = {name: loaded_objects.get(name, entry) for name, entry in self.export_ctx.scene_data.items()}
+        return load_dict(scene_data)
@@ -68,5 +68,9 @@ def export_camera(camera_instance, b_scene, export_ctx):
 
     if export_ctx.export_ids:
         export_ctx.data_add(params, name=b_camera.name_full)
+        export_ctx.register_object(b_camera, [b_camera.name_full])
+    elif export_ctx.render:
+        # The renderer finds the sensor of each camera by its name
+        export_ctx.data_add(params, name=b_camera.name_full)
     else:
         export_ctx.data_add(params)
@@ -1,94 +1,125 @@
+import os
 from os import path as osp
-import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from xml.sax.saxutils import XMLGenerator
 import xml.etree.ElementTree as ET
 
 # from ipdb import set_trace
 
-def convert(fname, mode="v1"):
+# Target version of each conversion mode
+VERSIONS = {"v1": "0.6.0", "v2": "2.1.0"}
+
+# Names that do not follow the snake_case <-> camelCase rule
+RENAMES = {
+  "v1": {"int_ior": "intIOR", "ext_ior": "extIOR"},
+  "v2": {"intIOR": "int_ior", "extIOR": "ext_ior"},
+}
+
+@lru_cache(maxsize=None)
+def rename(name, mode="v1"):
+  '''
+  Convert a tag, parameter or plugin name to the naming convention of the
+  target version. Results are cached, so every distinct name is only
+  converted once.
+  '''
   from inflection import camelize, underscore
+  if name in RENAMES[mode]:
+    return RENAMES[mode][name]
+  if mode == "v1":
+    # snake_case to camelCase, keeping the case of the first letter
+    return name[:1] + camelize(name)[1:]
+  return underscore(name)
+
+def convert_attrib(tag, attrib, mode="v1"):
+  '''
+  Convert the attributes of an element. File names and IDs are left untouched.
+  '''
+  attrib = dict(attrib)
+  if "name" in attrib:
+    attrib["name"] = rename(attrib["name"], mode)
+  if "type" in attrib:
+    attrib["type"] = rename(attrib["type"], mode)
+  if tag == "string" and "value" in attrib and attrib.get("name") != "filename":
+    attrib["value"] = rename(attrib["value"], mode)
+  if mode == "v1":
+    if tag == "translate" and "value" in attrib:
+      x, y, z = attrib.pop("value").split(" ")
+      attrib["x"] = x
+      attrib["y"] = y
+      attrib["z"] = z
+    elif tag == "include" and "filename" in attrib:
+      # Included files are converted too
+      core, ext = osp.splitext(attrib["filename"])
+      attrib["filename"] = f"{core}_v1{ext}"
+  return attrib
+
+def convert(fname, mode="v1"):
+  '''
+  Convert a Mitsuba 3 scene file to Mitsuba 0.6 ("v1") or the other way
+  around ("v2"). The result is written next to the file, with a "_v1" or
+  "_v2" suffix.
+
+  The file is streamed: each element is renamed and written as soon as it
+  is parsed, and detached from its parent once written so that the parsed
+  tree never grows. Mitsuba scene files do not hold text content, so only
+  elements and attributes are written.
+  '''
   dname = osp.dirname(fname)
   base = osp.basename(fname)
   # check ext
   base, ext = osp.splitext(base)
-  
+
   if ext != ".xml":
     print(f"Wrong file format {ext}")
     return False
-  # check version if already in correct format than do nothing
-  tree = ET.parse(fname)
-  root = tree.getroot()
-  version = root.attrib["version"]
-  MAJOR_VER = int(version[0])
-
-  if mode == "v1":
-    if MAJOR_VER < 2:
-      print(f"Already in correct version {version}")
-      return True
-    else:
-      root.attrib["version"] = "0.6.0"
-  elif mode == "v2":
-    if MAJOR_VER > 0:
-      print(f"Already in correct version {version}")
-      return True
-    else:
-      root.attrib["version"] = "2.1.0"
-
-  # TODO : don't change filenames
-
-  f_str = ET.tostring(root).decode('utf-8')
-  if mode == "v1":
-    # converting to 0.6.0 version
-    # snake_case to camelCase 
-    modified_str = camelize(f_str)
-    root_n = ET.fromstring(modified_str)
-
-    # ior
-    for i, ele_n in enumerate(root_n.findall(".//*[@name='intIor']")):
-      # print("Copying back %s"%ele_n)
-      ele_n.attrib["name"] = "intIOR"
-
-    for i, ele_n in enumerate(root_n.findall(".//*[@name='extIor']")):
-      # print("Copying back %s"%ele_n)
-      ele_n.attrib["name"] = "extIOR"
-
-    # copy back the filename
-    ele_iter = root.findall(".//*[@filename]")
-    for i, ele_n in enumerate(root_n.findall(".//*[@filename]")):
-      # print("Copying back %s"%ele_n)
-      ele = ele_iter[i]
-      ele_n.attrib["filename"] = ele.attrib["filename"]
 
-    ele_iter = root.findall(".//*[@name='filename']")
-    for i, ele_n in enumerate(root_n.findall(".//*[@name='filename']")):
-      # print("Copying back %s"%ele_n)
-      ele = ele_iter[i]
-      ele_n.attrib["value"] = ele.attrib["value"]
-    
-    # translation
-    for ele in root_n.findall(".//translate"):
-      val = ele.attrib.pop("value")
-      x, y, z = val.split(" ")
-      ele.attrib["x"] = x
-      ele.attrib["y"] = y
-      ele.attrib["z"] = z
+  out_file = None
+  # Elements being written, from the root to the current one
+  parents = []
+  try:
+    for event, ele in ET.iterparse(fname, events=("start", "end")):
+      if event == "end":
+        writer.endElement(rename(ele.tag, mode))
+        parents.pop()
+        if parents:
+          # Free the element and its children, they are not needed once written
+          parents[-1].remove(ele)
+        continue
 
-    # include filename
-    for ele in root_n.findall(".//include"):
-      val = ele.attrib["filename"]
-      core, ext = osp.splitext(val)
-      ele.attrib["filename"] = f"{core}_v1{ext}"
+      attrib = convert_attrib(ele.tag, ele.attrib, mode)
+      if out_file is None:
+        # Root element: check version if already in correct format than do nothing
+        version = ele.attrib["version"]
+        MAJOR_VER = int(version[0])
+        if (mode == "v1" and MAJOR_VER < 2) or (mode == "v2" and MAJOR_VER > 0):
+          print(f"Already in correct version {version}")
+          return True
+        attrib["version"] = VERSIONS[mode]
+        out_file = open(osp.join(dname, f"{base}_{mode}.xml"), "w", encoding="utf-8")
+        writer = XMLGenerator(out_file, "utf-8", short_empty_elements=True)
+        writer.startDocument()
+      writer.startElement(rename(ele.tag, mode), attrib)
+      parents.append(ele)
+    writer.endDocument()
+  finally:
+    if out_file is not None:
+      out_file.close()
+  return True
 
-    # lookat -> lookAt
-    # for ele in root.findall(".//transform"):
-    #   ele
+def convert_files(fnames, mode="v1", max_workers=None):
+  '''
+  Convert several independent scene files (e.g. a main file and its
+  fragments) in parallel. Returns True if all of them were converted.
 
-    # write the file
-    modified_str = ET.tostring(root_n).decode('utf-8')
-    with open(osp.join(dname, f"{base}_v1.xml"), "w") as f:
-      f.write(modified_str)
-    # ET.write(osp.join(dname, f"{base}_v1.xml"))
-    
-  elif mode == "v2":
-    modified_str = underscore(f_str)
-    with open(osp.join(dname, f"{base}_v2.xml"), "w") as f:
-      f.write(modified_str)
\ No newline at end of file
+  The conversion is CPU bound, so files are converted in separate processes
+  rather than threads, which would be serialized by the GIL.
+  '''
+  fnames = list(fnames)
+  if len(fnames) <= 1:
+    return all(convert(fname, mode) for fname in fnames)
+  if max_workers is None:
+    max_workers = min(len(fnames), os.cpu_count() or 1)
+  with ProcessPoolExecutor(max_workers=max_workers) as executor:
+    return all(executor.map(convert, fnames, repeat(mode)))
@@ -1,7 +1,9 @@
 from collections import OrderedDict
+import hashlib
 import os
 from shutil import copy2
 from numpy import pi
+import numpy as np
 
 from mathutils import Matrix
 
@@ -26,6 +28,58 @@ convert_format = {
     'IRIS': 'PNG'
 }
 
+# Formats that can be written by mitsuba, when an image has to be converted
+bitmap_exts = {
+    'PNG': '.png',
+    'JPEG': '.jpg',
+    'HDR': '.hdr',
+    'OPEN_EXR': '.exr',
+}
+
+def image_pixels(image):
+    '''
+    Read the pixels of a Blender image in a (height, width, channels) array,
+    top row first
+    '''
+    width, height = image.size
+    pixels = np.empty(width * height * image.channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, image.channels)[::-1]
+
+def write_bitmap(pixels, filepath, is_float, variant):
+    '''
+    Encode pixels read with image_pixels to an image file, with mitsuba.
+    The variant of mitsuba is set per thread, it is given by the exporting thread.
+    '''
+    import mitsuba
+    if mitsuba.variant() != variant:
+        mitsuba.set_variant(variant)
+    from mitsuba import Bitmap
+    ext = os.path.splitext(filepath)[1]
+    if ext in ('.jpg', '.hdr'):
+        # No alpha channel in these formats
+        pixels = pixels[..., :3]
+    if ext in ('.png', '.jpg'):
+        # Byte images, their pixels are already in their color space
+        bitmap = Bitmap(np.ascontiguousarray(np.round(np.clip(pixels, 0, 1) * 255).astype(np.uint8)))
+        bitmap.set_srgb_gamma(not is_float)
+    else:
+        bitmap = Bitmap(np.ascontiguousarray(pixels))
+    bitmap.write(filepath)
+
+def write_bytes(data, filepath):
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+def link_file(source, target):
+    '''
+    Hard link a file, or copy it if links are not supported (e.g. across drives)
+    '''
+    try:
+        os.link(source, target)
+    except OSError:
+        copy2(source, target)
+
 class ExportedMaterialsCache:
     '''
     Store a list of the exported materials, that have both a BSDF and an emitter
@@ -69,6 +123,27 @@ class ExportContext:
         self.exported_mats = ExportedMaterialsCache()
         self.export_ids = False # Export Object IDs in the XML file
         self.exported_ids = set()
+        self.exported_objects = {} # Scene dict entries created for each Blender object, when exporting IDs
+        self.render = False # Instantiate shapes in memory instead of writing them to disk
+        self.loaded_objects = {} # Scene dict entries already instantiated in render mode
+        self.ply_writer = 'MITSUBA' # Write PLY files through mitsuba meshes ('MITSUBA') or directly ('NUMPY')
+        self.instance_duplicates = False # Export meshes shared by several objects as one shapegroup
+        self.linked_meshes = set() # Names of the meshes exported as a shapegroup, see geometry.linked_meshes
+        self.manifest = None # Files of the previous exports to the same folder, to skip unchanged ones
+        self.exported_textures = {} # Texture file names by image pointer and by content hash
+        self.material_cache = {} # IDs of the converted materials, by material pointer and node tree hash
+        self.material_hashes = {} # Node tree hash of the materials met in this export, by pointer
+        self.material_hits = 0 # Material exports skipped thanks to the cache
+        self.material_misses = 0 # Material conversions
+        self.instances = {} # Depsgraph indices of the instances of each shapegroup, exported by export_instances
+        self.instance_index = 0 # Index of the object instance being exported in the depsgraph iteration
+        self.instance_groups = {} # Shapegroup of each instanced object, by object name
+        self.writer = None # Background writing of the mesh and texture files
+        self.mesh_format = 'PLY' # One PLY file per mesh ('PLY'), or .serialized files ('SERIALIZED', 'SERIALIZED_COLLECTION')
+        self.serialized_files = {} # .serialized files being exported, by file name
+        self.merge_meshes = False # Merge the static meshes sharing the same material, see geometry.merge_part
+        self.merge_cell_size = 0.0 # Only merge meshes in the same cell of this size, if not zero
+        self.merged_parts = {} # Mesh parts to merge, by material, cell and vertex attributes
         # All the args defined below are set in the Converter
         self.directory = ''
         self.axis_mat = Matrix() # Coordinate shift
@@ -84,20 +159,23 @@ class ExportContext:
     def data_add(self, mts_dict, name=''):
         '''
         Function to add new elements to the scene dict.
+        Elements are either dicts or, in render mode, Mitsuba objects.
         If a name is provided it will be used as the key of the element.
         Otherwise the Id of the element is used if it exists
         or a new key is generated incrementally.
         '''
-        if mts_dict is None or not isinstance(mts_dict, dict) or len(mts_dict) == 0 or 'type' not in mts_dict:
+        if mts_dict is None:
+            return False
+        is_dict = isinstance(mts_dict, dict)
+        if is_dict and (len(mts_dict) == 0 or 'type' not in mts_dict):
             return False
 
         if not name:
-            try:
+            if is_dict and 'id' in mts_dict:
                 name = mts_dict['id']
                 #remove the corresponding entry
                 del mts_dict['id']
-
-            except KeyError:
+            else: # No Id, or already instantiated Mitsuba object
                 name = '__elm__%i' % self.counter
 
         self.scene_data.update([(name, mts_dict)])
@@ -108,6 +186,38 @@ class ExportContext:
     def data_get(self, name):
         return self.scene_data.get(name)
 
+    def load_object(self, name):
+        '''
+        Instantiate the scene dict entry 'name', so that it can be shared by
+        objects that are instantiated during the export (render mode).
+        The entry is only instantiated once, and the same Mitsuba object is
+        used when loading the scene.
+        '''
+        mts_object = self.loaded_objects.get(name)
+        if mts_object is None:
+            from mitsuba import load_dict
+            mts_object = load_dict(self.scene_data[name])
+            mts_object.set_id(name)
+            self.loaded_objects[name] = mts_object
+        return mts_object
+
+    def register_object(self, b_object, ids, **info):
+        '''
+        Remember which scene dict entries were created for a Blender object,
+        so that they can be updated in place later on.
+
+        b_object: The exported Blender object
+        ids: The names of the scene dict entries created for it
+        info: Additional data needed to update the object
+        '''
+        self.exported_objects[b_object.name_full] = {
+            'type': b_object.type,
+            'data': b_object.data.name_full if b_object.data is not None else '',
+            'ids': ids,
+            'matrix': b_object.matrix_world.copy(),
+            **info
+        }
+
     def log(self, message, level='INFO'):
         '''
         Log something using mitsuba's logging API
@@ -135,29 +245,150 @@ class ExportContext:
         Return the path to a texture.
         Ensure the image is on disk and of a correct type
 
+        Each image is only exported once, and images with the same content
+        share one file. Unmodified source files in a supported format are
+        hard-linked or copied and packed images are written from their packed
+        bytes, without decoding them. Other images are converted from their
+        pixels. The files are written in the background, see write_file.
+
         image : The Blender Image object
         """
-        # TODO: don't save packed images but convert them to a mitsuba texture, and let the XML writer save
+        key = image.as_pointer()
+        if key in self.exported_textures:
+            return self.exported_textures[key]
+        digest = self.image_digest(image)
+        if digest is not None and digest in self.exported_textures:
+            self.exported_textures[key] = self.exported_textures[digest]
+            return self.exported_textures[key]
+
+        # Images that are not modified and in a supported format are used as is
+        copy = digest is not None and image.file_format in texture_exts
+        if copy:
+            ext = texture_exts[image.file_format]
+        else:
+            if image.file_format in bitmap_exts:
+                ext = bitmap_exts[image.file_format]
+            else:
+                ext = '.exr' if image.is_float else '.png'
+            if image.file_format in convert_format:
+                msg = "Image format of '%s' is not supported. Converting it to %s." % (image.name, ext[1:].upper())
+                self.log(msg, 'WARN')
         textures_folder = os.path.join(self.directory, self.subfolders['texture'])
-        if image.file_format in convert_format:
-            msg = "Image format of '%s' is not supported. Converting it to %s." % (image.name, convert_format[image.file_format])
-            self.log(msg, 'WARN')
-            image.file_format = convert_format[image.file_format]
         original_name = os.path.basename(image.filepath)
         if original_name != '' and image.name.startswith(original_name): # Try to remove extensions from names of packed files to avoid stuff like 'Image.png.001.png'
             base_name, _ = os.path.splitext(original_name)
             name = image.name.replace(original_name, base_name, 1) # Remove the extension
-            name += texture_exts[image.file_format]
+            name += ext
         else:
-            name = "%s%s" % (image.name, texture_exts[image.file_format])
+            name = "%s%s" % (image.name, ext)
         target_path = os.path.join(textures_folder, name)
+        filename = f"{self.subfolders['texture']}/{name}"
+        self.exported_textures[key] = filename
+        if digest is not None:
+            self.exported_textures[digest] = filename
+
+        if self.manifest is not None and digest is not None:
+            reused = self.manifest.lookup(filename, digest)
+            if reused is not None:
+                self.manifest.restore(reused, [filename])
+                self.manifest.record(filename, digest, [filename])
+                return filename
         if not os.path.isdir(textures_folder):
             os.makedirs(textures_folder)
-        old_filepath = image.filepath
-        image.filepath_raw = target_path
-        image.save()
-        image.filepath_raw = old_filepath
-        return f"{self.subfolders['texture']}/{name}"
+        # The file may be a link to a source texture, never write through it
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+
+        # Blender data is read here, only the file operations run in the pool
+        if not copy:
+            import mitsuba
+            pixels = image_pixels(image)
+            self.write_file(write_bitmap, pixels, target_path, image.is_float, mitsuba.variant(), size=pixels.nbytes)
+        elif image.packed_file is not None:
+            data = image.packed_file.data
+            self.write_file(write_bytes, data, target_path, size=len(data))
+        else:
+            source_path = bpy.path.abspath(image.filepath, library=image.library)
+            self.write_file(link_file, source_path, target_path)
+        if self.manifest is not None and digest is not None:
+            self.manifest.record(filename, digest, [filename])
+        return filename
+
+    def write_file(self, job, *args, size=0):
+        """
+        Write a file with job(*args), in the background if the context has a
+        writer (see writer.BackgroundWriter). 'size' is the memory held by the
+        arguments until the file is written. In render mode, the files are
+        loaded during the export and are written right away instead.
+        """
+        if self.writer is None:
+            job(*args)
+        else:
+            self.writer.submit(job, *args, size=size)
+
+    def wait_writes(self):
+        """
+        Wait for all the files to be written. Errors of the background jobs
+        are raised here.
+        """
+        if self.writer is not None:
+            self.writer.join()
+
+    def serialized_file(self, b_object):
+        """
+        Return the name and the serialized.SerializedFile to store the meshes
+        of an object in: one file for the whole scene, or one per collection
+        depending on mesh_format. Meshes that are not of a single object
+        (b_object is None) go to the file of the whole scene.
+        """
+        from .serialized import SerializedFile
+        name = 'geometry'
+        if self.mesh_format == 'SERIALIZED_COLLECTION' and b_object is not None:
+            collections = b_object.original.users_collection
+            if collections:
+                name = bpy.path.clean_name(collections[0].name_full)
+        filename = f"{self.subfolders['shape']}/{name}.serialized"
+        if filename not in self.serialized_files:
+            folder = os.path.join(self.directory, self.subfolders['shape'])
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            self.serialized_files[filename] = SerializedFile(os.path.join(folder, f"{name}.serialized"))
+        return filename, self.serialized_files[filename]
+
+    def write_serialized(self):
+        """
+        Write the .serialized files, once all their shapes are encoded (see wait_writes)
+        """
+        for filename, serialized in self.serialized_files.items():
+            if self.manifest is not None:
+                self.manifest.prepare(filename)
+                # Only recorded to be removed once no longer exported
+                self.manifest.record(filename, None, [filename])
+            serialized.write()
+        self.serialized_files = {}
+
+    def image_digest(self, image):
+        """
+        Hash identifying the content of an image, to reuse the file of a
+        previous export: the packed data, or the path and modification time
+        of the source file. Returns None for images modified in Blender and
+        generated images, which are always saved.
+        """
+        if image.is_dirty:
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.file_format} {image.colorspace_settings.name}".encode())
+        if image.packed_file is not None:
+            digest.update(image.packed_file.data)
+        elif image.source == 'FILE':
+            filepath = bpy.path.abspath(image.filepath, library=image.library)
+            if not os.path.isfile(filepath):
+                return None
+            stat = os.stat(filepath)
+            digest.update(f"{filepath} {stat.st_size} {stat.st_mtime_ns}".encode())
+        else:
+            return None
+        return digest.hexdigest()
 
     def spectrum(self, value, mode='rgb'):
         '''
@@ -204,6 +435,61 @@ class ExportContext:
 
         return spec
 
+    def add_instance(self, group_id):
+        '''
+        Add an instance of a shapegroup, at the object instance being exported
+        (see instance_index). Its matrix is read by export_instances.
+        '''
+        indices = self.instances.get(group_id)
+        if indices is None:
+            indices = self.instances[group_id] = []
+        indices.append(self.instance_index)
+
+    def instance_matrices(self, depsgraph, count):
+        '''
+        Read the world matrices of the first 'count' object instances of the
+        depsgraph, as a (count, 4, 4) array
+        '''
+        matrices = np.empty(count * 16, dtype=np.float32)
+        try:
+            depsgraph.object_instances.foreach_get('matrix_world', matrices)
+        except (TypeError, RuntimeError):
+            # Iterate once over the instances instead
+            matrices = matrices.reshape(count, 4, 4)
+            for index, object_instance in enumerate(depsgraph.object_instances):
+                if index == count:
+                    break
+                matrices[index] = object_instance.matrix_world
+            return matrices
+        # Matrices are read column by column
+        return matrices.reshape(count, 4, 4).transpose(0, 2, 1)
+
+    def export_instances(self, depsgraph, count):
+        '''
+        Create the scene dict entries of the instances added with add_instance.
+        The matrices of all the instances are read with one foreach_get call
+        over the 'count' object instances of the depsgraph, and converted to
+        Mitsuba's coordinates with a single product.
+        '''
+        from mitsuba import ScalarTransform4f
+        if not self.instances:
+            return
+        axis_mat = np.array(self.axis_mat, dtype=np.float64)
+        all_matrices = self.instance_matrices(depsgraph, count)
+        for group_id, indices in self.instances.items():
+            to_world = axis_mat @ all_matrices[indices].astype(np.float64)
+            # Each entry needs its own dicts, the XML writer consumes them
+            for matrix in to_world.tolist():
+                self.data_add({
+                    'type': 'instance',
+                    'shape': {
+                        'type': 'ref',
+                        'id': group_id
+                    },
+                    'to_world': ScalarTransform4f(matrix)
+                })
+        self.instances = {}
+
     def transform_matrix(self, matrix):
         '''
         Apply coordinate shift and convert to a mitsuba Transform 4f
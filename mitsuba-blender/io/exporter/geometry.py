@@ -1,102 +1,471 @@
 from .materials import export_material
 from .export_context import Files
+from . import ply
 from mathutils import Matrix
+import numpy as np
+import hashlib
 import os
 import bpy
 
-def convert_mesh(export_ctx, b_mesh, matrix_world, name, mat_nr):
-    '''
-    This method creates a mitsuba mesh from a blender mesh and returns it.
-    It constructs a dictionary containing the necessary info such as
-    pointers to blender's data strucures and then loads the BlenderMesh
-    plugin via load_dict.
+def _get_array(collection, attribute, count, dtype=np.float32):
+    values = np.empty(count, dtype=dtype)
+    collection.foreach_get(attribute, values)
+    return values
 
-    Params
-    ------
-    export_ctx:   The export context.
-    b_mesh:       The blender mesh to export.
-    matrix_world: The mesh's transform matrix.
-    name:         The name to give to the mesh. It will not be saved, so this is mostly
-                  for logging/debug purposes.
-    mat_nr:       The material ID to export.
-    '''
-    from mitsuba import load_dict, Point3i
-    props = {
-        'type': 'blender',
-        # 'version': ".".join(map(str,bpy.app.version))
-    }
-    b_mesh.calc_normals()
+def mesh_arrays(export_ctx, b_mesh, name):
+    """
+    Read the triangulated geometry of a blender mesh in NumPy arrays, with a
+    few bulk foreach_get calls.
+
+    Returns a dict with the per-vertex positions, the per-triangle loop
+    indices, material indices and smooth flags, and the per-loop vertex
+    indices, normals, UVs and vertex colors, or None if the mesh has no faces.
+    """
     # Compute the triangle tesselation
     b_mesh.calc_loop_triangles()
-
-    props['name'] = name
-    loop_tri_count = len(b_mesh.loop_triangles)
-    if loop_tri_count == 0:
+    tri_count = len(b_mesh.loop_triangles)
+    if tri_count == 0:
         export_ctx.log(f"Mesh: {name} has no faces. Skipping.", 'WARN')
-        return
-    props['loop_tri_count'] = loop_tri_count
+        return None
+    loop_count = len(b_mesh.loops)
+
+    arrays = {
+        'positions': _get_array(b_mesh.vertices, 'co', len(b_mesh.vertices) * 3).reshape(-1, 3),
+        'loop_verts': _get_array(b_mesh.loops, 'vertex_index', loop_count, np.int32),
+        'tri_loops': _get_array(b_mesh.loop_triangles, 'loops', tri_count * 3, np.int32).reshape(-1, 3),
+        'tri_mats': _get_array(b_mesh.loop_triangles, 'material_index', tri_count, np.int32),
+        'tri_smooth': _get_array(b_mesh.loop_triangles, 'use_smooth', tri_count, bool),
+    }
+
+    # Split normals account for flat faces, sharp edges and custom normals
+    if hasattr(b_mesh, 'corner_normals'):
+        # Blender 4.1+
+        arrays['normals'] = _get_array(b_mesh.corner_normals, 'vector', loop_count * 3).reshape(-1, 3)
+    else:
+        b_mesh.calc_normals_split()
+        arrays['normals'] = _get_array(b_mesh.loops, 'normal', loop_count * 3).reshape(-1, 3)
 
     if len(b_mesh.uv_layers) > 1:
         export_ctx.log(f"Mesh: '{name}' has multiple UV layers. Mitsuba only supports one. Exporting the one set active for render.", 'WARN')
     for uv_layer in b_mesh.uv_layers:
         if uv_layer.active_render: # If there is only 1 UV layer, it is always active
-            if uv_layer.name in b_mesh.attributes:
-                props['uvs'] = b_mesh.attributes[uv_layer.name].data[0].as_pointer()
-            else:
-                props['uvs'] = uv_layer.data[0].as_pointer()
+            arrays['uvs'] = _get_array(uv_layer.data, 'uv', loop_count * 2).reshape(-1, 2)
             break
 
+    arrays['colors'] = {}
     for color_layer in b_mesh.vertex_colors:
-        if color_layer.name in b_mesh.attributes:
-            props[f'vertex_{color_layer.name}'] = b_mesh.attributes[color_layer.name].data[0].as_pointer()
+        colors = _get_array(color_layer.data, 'color', loop_count * 4).reshape(-1, 4)
+        arrays['colors'][f'vertex_{color_layer.name}'] = colors[:, :3]
+
+    return arrays
+
+def split_mesh(arrays, mat_nrs, mat_count):
+    """
+    Partition the triangles of a mesh by material in a single pass.
+
+    Loops sharing the same vertex, normal, UV and color are merged into one
+    mesh vertex, then each part is compacted to the vertices it uses.
+
+    Params
+    ------
+    arrays:  The mesh data, as returned by mesh_arrays.
+    mat_nrs: The material indices of the parts to extract, -1 for all the triangles.
+    mat_count: The number of material slots of the mesh.
+
+    Returns a dict of (vertex loops, faces) tuples by material index, where
+    vertex loops are the indices of the loops defining each vertex of the
+    part, and faces index these vertices. Empty parts are omitted.
+    """
+    tri_loops = arrays['tri_loops']
+    corner_loops = tri_loops.ravel()
+
+    # One row of bytes per triangle corner, to find the unique vertices
+    columns = [arrays['loop_verts'][corner_loops].reshape(-1, 1).view(np.float32)]
+    if arrays['tri_smooth'].any():
+        columns.append(arrays['normals'][corner_loops])
+    if 'uvs' in arrays:
+        columns.append(arrays['uvs'][corner_loops])
+    for colors in arrays['colors'].values():
+        columns.append(colors[corner_loops])
+    keys = np.ascontiguousarray(np.hstack(columns))
+    keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+    _, first_corner, corner_vertex = np.unique(keys, return_index=True, return_inverse=True)
+    corner_vertex = corner_vertex.reshape(-1, 3)
+    vertex_loops = corner_loops[first_corner]
+
+    # Faces using a material index without a slot use the last slot, like in Blender
+    tri_mats = np.clip(arrays['tri_mats'], 0, max(mat_count - 1, 0))
+    parts = {}
+    for mat_nr in mat_nrs:
+        if mat_nr == -1:
+            part_faces = corner_vertex
         else:
-            props[f'vertex_{color_layer.name}'] = color_layer.data[0].as_pointer()
+            part_faces = corner_vertex[tri_mats == mat_nr]
+        if len(part_faces) == 0:
+            continue
+        # Compact the vertices to the ones used by this part
+        used_vertices, faces = np.unique(part_faces, return_inverse=True)
+        parts[mat_nr] = (vertex_loops[used_vertices], faces.reshape(-1, 3).astype(np.uint32))
+    return parts
 
-    props['loop_tris'] = b_mesh.loop_triangles[0].as_pointer()
+def part_buffers(export_ctx, arrays, matrix_world, vertex_loops, faces):
+    """
+    Gather the vertex buffers of a mesh part, as split by split_mesh.
 
-    if '.corner_vert' in b_mesh.attributes:
-        # Blender 3.6+ layout
-        props['loops'] = b_mesh.attributes['.corner_vert'].data[0].as_pointer()
-    else:
-        props['loops'] = b_mesh.loops[0].as_pointer()
+    Params
+    ------
+    export_ctx:   The export context.
+    arrays:       The mesh data, as returned by mesh_arrays.
+    matrix_world: The mesh's transform matrix, applied to the vertices.
+    vertex_loops: The loop defining each vertex of the part.
+    faces:        The triangles of the part.
 
-    if 'sharp_face' in b_mesh.attributes:
-        props['sharp_face'] = b_mesh.attributes['sharp_face'].data[0].as_pointer()
+    Returns a dict of float32 'positions', optional 'normals' and 'uvs',
+    'colors' by attribute name, and uint32 'faces' arrays.
+    """
+    buffers = {'faces': faces, 'colors': {}}
+    positions = arrays['positions'][arrays['loop_verts'][vertex_loops]]
+    normals = arrays['normals'][vertex_loops] if arrays['tri_smooth'].any() else None
+    # Apply coordinate change
+    if matrix_world:
+        positions, normals = transform_vertices(export_ctx.axis_mat @ matrix_world, positions, normals)
+    buffers['positions'] = np.ascontiguousarray(positions, dtype=np.float32)
+    if normals is not None:
+        buffers['normals'] = np.ascontiguousarray(normals, dtype=np.float32)
+    if 'uvs' in arrays:
+        buffers['uvs'] = np.ascontiguousarray(arrays['uvs'][vertex_loops], dtype=np.float32)
+    for attribute, colors in arrays['colors'].items():
+        buffers['colors'][attribute] = np.ascontiguousarray(colors[vertex_loops], dtype=np.float32)
+    return buffers
 
-    if bpy.app.version >= (3, 6, 0):
-        props['polys'] = b_mesh.loop_triangle_polygons[0].as_pointer()
-    else:
-        props['polys'] = b_mesh.polygons[0].as_pointer()
+def transform_vertices(matrix, positions, normals=None):
+    """
+    Transform object space vertex positions and normals (or None) by a 4x4 matrix.
+    Normals use the inverse transpose, which is the pseudo-inverse for
+    degenerate (e.g. zero scale) matrices.
+    """
+    matrix = np.array(matrix)
+    positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+    if normals is not None:
+        normals = normals @ np.linalg.pinv(matrix[:3, :3])
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    return positions, normals
 
-    if 'position' in b_mesh.attributes:
-        # Blender 3.5+ layout
-        props['verts'] = b_mesh.attributes['position'].data[0].as_pointer()
+def buffers_size(buffers):
+    """
+    Memory held by the buffers of a mesh part, in bytes.
+    """
+    size = sum(buffers[key].nbytes for key in ('positions', 'normals', 'uvs', 'faces') if key in buffers)
+    return size + sum(colors.nbytes for colors in buffers['colors'].values())
+
+def write_part(export_ctx, name, part, serialized=None):
+    """
+    Write a converted mesh part to disk, in the background.
+
+    Params
+    ------
+    export_ctx: The export context.
+    name:       The name of the part.
+    part:       The buffers of the part (see part_buffers) or a mitsuba mesh.
+    serialized: Optional (file name, serialized.SerializedFile) tuple to pack
+                the part in, otherwise it is written as binary PLY.
+
+    Returns the scene dict entry of the shape, without its material.
+    """
+    # Mitsuba does not load vertex colors from .serialized files
+    if serialized is not None and isinstance(part, dict) and not part['colors']:
+        serialized_name, serialized_file = serialized
+        # Pack the mesh in the .serialized file, compressed in the background
+        shape_index = serialized_file.add_shape()
+        export_ctx.write_file(serialized_file.encode_shape, shape_index, name, part, size=buffers_size(part))
+        params = {
+            'type': 'serialized',
+            'filename': serialized_name,
+            'shape_index': shape_index
+        }
+        has_normals = 'normals' in part
     else:
-        props['verts'] = b_mesh.vertices[0].as_pointer()
+        # Save as binary ply
+        mesh_folder = os.path.join(export_ctx.directory, export_ctx.subfolders['shape'])
+        if not os.path.isdir(mesh_folder):
+            os.makedirs(mesh_folder)
+        filepath = os.path.join(mesh_folder,  f"{name}.ply")
+        filename = f"{export_ctx.subfolders['shape']}/{name}.ply"
+        if export_ctx.manifest is not None:
+            export_ctx.manifest.prepare(filename)
+        if isinstance(part, dict):
+            export_ctx.write_file(ply.write_ply, filepath, part, size=buffers_size(part))
+            has_normals = 'normals' in part
+        else:
+            # Positions, normals, UVs and faces
+            size = part.vertex_count() * 32 + part.face_count() * 12
+            export_ctx.write_file(part.write_ply, filepath, size=size)
+            has_normals = part.has_vertex_normals()
+        params = {
+            'type': 'ply',
+            'filename': filename
+        }
 
-    if bpy.app.version > (3, 0, 0):
-        props['normals'] = b_mesh.vertex_normals[0].as_pointer()
+    # Add flat shading flag if needed
+    if not has_normals:
+        params["face_normals"] = True
+    return params
 
-    props['vert_count'] = len(b_mesh.vertices)
-    # Apply coordinate change
+def merge_part(export_ctx, b_mesh, mat_nr, buffers):
+    """
+    Keep the buffers of a mesh part, with the world transform applied, to
+    merge them with the parts of the other objects using the same material
+    (and in the same cell of export_ctx.merge_cell_size, if not zero).
+    Parts are only merged with parts having the same vertex attributes.
+    """
+    material = b_mesh.materials[mat_nr].name_full if mat_nr != -1 else None
+    cell = None
+    if export_ctx.merge_cell_size > 0:
+        positions = buffers['positions']
+        center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+        cell = tuple(np.floor(center / export_ctx.merge_cell_size).astype(int).tolist())
+    key = (material, cell, 'normals' in buffers, 'uvs' in buffers, tuple(sorted(buffers['colors'])))
+    merged = export_ctx.merged_parts.get(key)
+    if merged is None:
+        merged = export_ctx.merged_parts[key] = {
+            'refs': material_refs(export_ctx, b_mesh, mat_nr),
+            'parts': []
+        }
+    merged['parts'].append(buffers)
+
+def merge_buffers(parts):
+    """
+    Concatenate the buffers of several mesh parts into one mesh.
+    """
+    vertex_counts = [len(part['positions']) for part in parts]
+    offsets = np.cumsum([0] + vertex_counts[:-1]).astype(np.uint32)
+    merged = {
+        'positions': np.concatenate([part['positions'] for part in parts]),
+        'faces': np.concatenate([part['faces'] + offset for part, offset in zip(parts, offsets)]),
+        'colors': {name: np.concatenate([part['colors'][name] for part in parts]) for name in parts[0]['colors']}
+    }
+    for key in ('normals', 'uvs'):
+        if key in parts[0]:
+            merged[key] = np.concatenate([part[key] for part in parts])
+    return merged
+
+def export_merged(export_ctx):
+    """
+    Write the static meshes merged by merge_part, and add their shapes to the scene dict.
+    """
+    for index, merged in enumerate(export_ctx.merged_parts.values()):
+        refs = merged['refs']
+        material = refs['bsdf']['id']
+        name = f"merged-{index}-{bpy.path.clean_name(material)}"
+        buffers = merge_buffers(merged['parts'])
+        merged['parts'] = None
+        serialized = export_ctx.serialized_file(None) if export_ctx.mesh_format != 'PLY' else None
+        manifest = export_ctx.manifest
+        if manifest is not None and serialized is None:
+            # Recorded like the other meshes, so that stale merged files are cleaned up
+            filename = f"{export_ctx.subfolders['shape']}/{name}.ply"
+            digest = buffers_digest(buffers)
+            reused = manifest.lookup(name, digest)
+            if reused is not None:
+                manifest.restore(reused, [filename])
+                params = {'type': 'ply', 'filename': filename}
+                if 'normals' not in buffers:
+                    params['face_normals'] = True
+            else:
+                params = write_part(export_ctx, name, buffers)
+            manifest.record(name, digest, [filename])
+        else:
+            params = write_part(export_ctx, name, buffers, serialized)
+        params.update(refs)
+        export_ctx.data_add(params)
+    export_ctx.log(f"Merged static meshes into {len(export_ctx.merged_parts)} shapes.", 'INFO')
+    export_ctx.merged_parts = {}
+
+def build_mesh(name, buffers, material=None):
+    """
+    Create a mitsuba mesh from the buffers of a mesh part.
+
+    Params
+    ------
+    name:     The name to give to the mesh.
+    buffers:  The buffers of the part, as returned by part_buffers.
+    material: Optional dict of already instantiated 'bsdf' and 'emitter' to attach to the mesh.
+    """
+    from mitsuba import Mesh, Properties, load_dict, traverse
+    has_normals = 'normals' in buffers
+    has_uvs = 'uvs' in buffers
+
+    props = Properties()
+    if material:
+        for key, value in material.items():
+            props[key] = load_dict(value) if isinstance(value, dict) else value
+
+    mts_mesh = Mesh(name, len(buffers['positions']), len(buffers['faces']), props, has_normals, has_uvs)
+
+    params = traverse(mts_mesh)
+    params['vertex_positions'] = buffers['positions'].ravel()
+    params['faces'] = buffers['faces'].ravel()
+    if has_normals:
+        params['vertex_normals'] = buffers['normals'].ravel()
+    if has_uvs:
+        params['vertex_texcoords'] = buffers['uvs'].ravel()
+    for attribute, colors in buffers['colors'].items():
+        mts_mesh.add_attribute(attribute, 3, colors.ravel())
+    params.update()
+    return mts_mesh
+
+def convert_mesh_parts(export_ctx, b_mesh, matrix_world, names, materials=None, build=True, arrays=None):
+    """
+    Convert a blender mesh to one mitsuba mesh per material, reading and
+    splitting the mesh data only once.
+
+    Params
+    ------
+    export_ctx:   The export context.
+    b_mesh:       The blender mesh to export.
+    matrix_world: The mesh's transform matrix.
+    names:        Dict of the names of the parts to convert, by material index.
+                  Index -1 converts the whole mesh.
+    materials:    Optional dict of already instantiated materials by material index,
+                  see build_mesh.
+    build:        Whether to build mitsuba meshes, or to return the buffers
+                  of the parts (see part_buffers).
+    arrays:       Optional mesh data already read with mesh_arrays.
+
+    Returns a list of (material index, mitsuba mesh or buffers) tuples for the non-empty parts.
+    """
+    if arrays is None:
+        arrays = mesh_arrays(export_ctx, b_mesh, b_mesh.name)
+    if arrays is None:
+        return []
+    materials = materials or {}
+    converted_parts = []
+    for mat_nr, (vertex_loops, faces) in split_mesh(arrays, list(names), len(b_mesh.materials)).items():
+        buffers = part_buffers(export_ctx, arrays, matrix_world, vertex_loops, faces)
+        if build:
+            converted_parts.append((mat_nr, build_mesh(names[mat_nr], buffers, materials.get(mat_nr))))
+        else:
+            converted_parts.append((mat_nr, buffers))
+    return converted_parts
+
+
+def mesh_digest(export_ctx, arrays, matrix_world, mat_nrs, mat_count):
+    """
+    Hash the data that determines the mesh files of an object: its
+    geometry, its transform and its split by material.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"ply {sorted(mat_nrs)} {mat_count}".encode())
     if matrix_world:
-        props['to_world'] = export_ctx.transform_matrix(matrix_world)
+        digest.update(np.array(export_ctx.axis_mat @ matrix_world, dtype=np.float64))
+    for key in sorted(arrays):
+        if key == 'colors':
+            for name in sorted(arrays['colors']):
+                digest.update(name.encode())
+                digest.update(np.ascontiguousarray(arrays['colors'][name]))
+        else:
+            digest.update(key.encode())
+            digest.update(np.ascontiguousarray(arrays[key]))
+    return digest.hexdigest()
 
-    # material index to export, as only a single material per mesh is suported in mitsuba
-    props['mat_nr'] = mat_nr
-    # if 'material_index' in b_mesh.attributes:
-    #     # Blender 3.4+ layout
-    #     props['mat_indices'] = b_mesh.attributes['material_index'].data[0].as_pointer()
-    # else:
-    #     props['mat_indices'] = 0
+def buffers_digest(buffers):
+    """
+    Hash the buffers of a mesh part, e.g. a merged mesh.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for key in ('positions', 'normals', 'uvs', 'faces'):
+        if key in buffers:
+            digest.update(key.encode())
+            digest.update(np.ascontiguousarray(buffers[key]))
+    for name in sorted(buffers['colors']):
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(buffers['colors'][name]))
+    return digest.hexdigest()
 
-    # Return the mitsuba mesh
-    return load_dict(props)
+def material_refs(export_ctx, b_mesh, mat_nr):
+    """
+    Return the 'bsdf' reference and the optional 'emitter' of a mesh part
+    using the given material slot, or the default BSDF if mat_nr is -1.
+    """
+    if mat_nr == -1:
+        if not export_ctx.data_get('default-bsdf'): # We only need to add it once
+            default_bsdf = {
+                'type': 'twosided',
+                'id': 'default-bsdf',
+                'bsdf': {'type':'diffuse'}
+            }
+            export_ctx.data_add(default_bsdf)
+        return {'bsdf': {'type':'ref', 'id':'default-bsdf'}}
+
+    refs = {}
+    mat_id = f"mat-{b_mesh.materials[mat_nr].name}"
+    if export_ctx.exported_mats.has_mat(mat_id): # Add one emitter *and* one bsdf
+        mixed_mat = export_ctx.exported_mats.mats[mat_id]
+        refs['bsdf'] = {'type':'ref', 'id':mixed_mat['bsdf']}
+        refs['emitter'] = mixed_mat['emitter']
+    else:
+        refs['bsdf'] = {'type':'ref', 'id':mat_id}
+    return refs
+
+def instantiate_material(export_ctx, b_mesh, mat_nr):
+    """
+    In render mode, meshes are instantiated during the export and need their
+    material right away: return the material of a mesh part with its BSDF
+    already instantiated. Return None otherwise.
+    """
+    if not export_ctx.render:
+        return None
+    refs = material_refs(export_ctx, b_mesh, mat_nr)
+    refs['bsdf'] = export_ctx.load_object(refs['bsdf']['id'])
+    return refs
+
+def linked_meshes(depsgraph, particles):
+    """
+    Find the linked duplicates of a scene: the meshes used by several
+    objects with the same geometry and materials, i.e. objects without
+    modifiers or materials linked to the object. Instanced, instancing and particle objects are already exported
+    as shapegroups and are not counted.
+
+    Returns the set of the names of these meshes.
+    """
+    users = {}
+    for object_instance in depsgraph.object_instances:
+        b_object = object_instance.object
+        if object_instance.is_instance or b_object.type != 'MESH' or b_object.hide_render:
+            continue
+        if b_object.name in particles or (b_object.parent is not None and b_object.parent.is_instancer):
+            continue
+        if shows_mesh_data(b_object):
+            name = b_object.original.data.name_full
+            users[name] = users.get(name, 0) + 1
+    return {name for name, count in users.items() if count > 1}
 
+def shows_mesh_data(b_object):
+    """
+    Whether an object renders its mesh as is: without modifiers, and with
+    the materials of the mesh rather than materials linked to the object.
+    """
+    b_object = b_object.original
+    return len(b_object.modifiers) == 0 and all(slot.link == 'DATA' for slot in b_object.material_slots)
+
+def has_emitter(export_ctx, b_mesh):
+    """
+    Whether one of the materials of a mesh is emissive. Emitters are
+    attached to the shapes, and mitsuba does not support them in shapegroups.
+    """
+    for b_mat in b_mesh.materials:
+        if b_mat is not None:
+            export_material(export_ctx, b_mat)
+            if export_ctx.exported_mats.has_mat(f"mat-{b_mat.name}"):
+                return True
+    return False
 
 def export_object(deg_instance, export_ctx, is_particle):
     """
-    Convert a blender object to mitsuba and save it as Binary PLY
+    Convert a blender object to mitsuba and save it as Binary PLY.
+    In render mode, the converted meshes are added to the scene dict directly.
+    Linked duplicates (see linked_meshes) are exported once as a shapegroup,
+    and each of them adds an instance of it.
     """
 
     b_object = deg_instance.object
@@ -107,6 +476,22 @@ def export_object(deg_instance, export_ctx, is_particle):
     is_instance_emitter = b_object.parent is not None and b_object.parent.is_instancer
     is_instance = deg_instance.is_instance
 
+    # Linked duplicates share one shapegroup, named after their mesh
+    is_linked = (not (is_instance or is_instance_emitter or is_particle)
+                 and b_object.type == 'MESH'
+                 and b_object.original.data.name_full in export_ctx.linked_meshes
+                 and shows_mesh_data(b_object))
+    if is_linked:
+        b_data = b_object.original.data
+        name_clean = f"data-{bpy.path.clean_name(b_data.name_full)}"
+        object_id = f"mesh-{name_clean}"
+        if export_ctx.data_get(object_id) is None and has_emitter(export_ctx, b_data):
+            # Export this mesh for each of its objects instead
+            export_ctx.linked_meshes.discard(b_data.name_full)
+            name_clean = bpy.path.clean_name(b_object.name_full)
+            object_id = f"mesh-{name_clean}"
+            is_linked = False
+
     # Only write to file objects that have never been exported before
     if export_ctx.data_get(object_id) is None:
         if b_object.type == 'MESH':
@@ -114,44 +499,70 @@ def export_object(deg_instance, export_ctx, is_particle):
         else: # Metaballs, text, surfaces
             b_mesh = b_object.to_mesh()
 
+        # Use a ShapeGroup for instances and split meshes
+        use_shapegroup = is_instance or is_instance_emitter or is_particle or is_linked
+
         # Convert the mesh into one mitsuba mesh per different material
         mat_count = len(b_mesh.materials)
-        converted_parts = []
-        if is_instance or is_instance_emitter:
+        if is_instance or is_instance_emitter or is_linked:
             transform = None
         else:
             transform = b_object.matrix_world
 
         if mat_count == 0: # No assigned material
-            converted_parts.append((-1, convert_mesh(export_ctx,
-                                                    b_mesh,
-                                                    transform,
-                                                    name_clean,
-                                                    0)))
-        for mat_nr in range(mat_count):
-            if b_mesh.materials[mat_nr]:
-                mts_mesh = convert_mesh(export_ctx,
-                                        b_mesh,
-                                        transform,
-                                        f"{name_clean}-{b_mesh.materials[mat_nr].name}",
-                                        mat_nr)
-                if mts_mesh is not None and mts_mesh.face_count() > 0:
-                    converted_parts.append((mat_nr, mts_mesh))
+            names = {-1: name_clean}
+        else:
+            names = {mat_nr: f"{name_clean}-{b_mesh.materials[mat_nr].name}"
+                     for mat_nr in range(mat_count) if b_mesh.materials[mat_nr]}
+        materials = None
+        if export_ctx.render:
+            # The materials need to exist before the meshes are instantiated
+            for mat_nr in names:
+                if mat_nr != -1:
+                    export_material(export_ctx, b_mesh.materials[mat_nr])
+            materials = {mat_nr: instantiate_material(export_ctx, b_mesh, mat_nr) for mat_nr in names}
+        serialized = None
+        if not export_ctx.render and export_ctx.mesh_format != 'PLY':
+            serialized = export_ctx.serialized_file(b_object)
+        # Static meshes are merged with the others using the same materials
+        is_merged = (export_ctx.merge_meshes and not export_ctx.render and not export_ctx.export_ids
+                     and not use_shapegroup and not is_animated(b_object))
+        # The NumPy PLY writer does not need mitsuba meshes
+        build = export_ctx.render or (export_ctx.ply_writer == 'MITSUBA' and serialized is None and not is_merged)
+        arrays = mesh_arrays(export_ctx, b_mesh, b_mesh.name)
+        manifest = export_ctx.manifest
+        digest = None
+        reused = None
+        # Shapes packed in .serialized files are written again with their file
+        if manifest is not None and arrays is not None and serialized is None and not is_merged:
+            digest = mesh_digest(export_ctx, arrays, transform, names, mat_count)
+            reused = manifest.lookup(object_id, digest)
+        if reused is not None:
+            # The files of a previous export are up to date, only add their entries
+            converted_parts = [(mat_nr, None) for mat_nr in reused['mat_nrs']]
+        elif arrays is not None:
+            converted_parts = convert_mesh_parts(export_ctx, b_mesh, transform, names, materials, build, arrays)
+        else:
+            converted_parts = []
+        if not export_ctx.render:
+            for mat_nr, _ in converted_parts:
+                if mat_nr != -1:
                     export_material(export_ctx, b_mesh.materials[mat_nr])
 
         if b_object.type != 'MESH':
             b_object.to_mesh_clear()
 
         part_count = len(converted_parts)
-        # Use a ShapeGroup for instances and split meshes
-        use_shapegroup = is_instance or is_instance_emitter or is_particle
         # TODO: Check if shapegroups for split meshes is worth it
         if use_shapegroup:
             group = {
                 'type': 'shapegroup'
             }
+        registered_ids = []
+        files = []
+        normals = []
 
-        for (mat_nr, mts_mesh) in converted_parts:
+        for (mat_nr, part) in converted_parts:
             # Determine the file name
             if part_count == 1:
                 name = f"{name_clean}"
@@ -159,41 +570,34 @@ def export_object(deg_instance, export_ctx, is_particle):
                 name = f"{name_clean}-{b_mesh.materials[mat_nr].name}"
             mesh_id = f"mesh-{name}"
 
-            # Save as binary ply
-            mesh_folder = os.path.join(export_ctx.directory, export_ctx.subfolders['shape'])
-            if not os.path.isdir(mesh_folder):
-                os.makedirs(mesh_folder)
-            filepath = os.path.join(mesh_folder,  f"{name}.ply")
-            mts_mesh.write_ply(filepath)
-
-            # Build dictionary entry
-            params = {
-                'type': 'ply',
-                'filename': f"{export_ctx.subfolders['shape']}/{name}.ply"
-            }
-
-            # Add flat shading flag if needed
-            if not mts_mesh.has_vertex_normals():
-                params["face_normals"] = True
-
-            # Add material info
-            if mat_nr == -1:
-                if not export_ctx.data_get('default-bsdf'): # We only need to add it once
-                    default_bsdf = {
-                        'type': 'twosided',
-                        'id': 'default-bsdf',
-                        'bsdf': {'type':'diffuse'}
-                    }
-                    export_ctx.data_add(default_bsdf)
-                params['bsdf'] = {'type':'ref', 'id':'default-bsdf'}
+            if export_ctx.render:
+                # The mitsuba mesh already holds its material, use it directly
+                part.set_id(mesh_id)
+                params = part
+            elif is_merged:
+                # Written with the other meshes using the same material, see export_merged
+                merge_part(export_ctx, b_mesh, mat_nr, part)
+                continue
+            elif part is None:
+                # The file of the previous export is up to date
+                filename = f"{export_ctx.subfolders['shape']}/{name}.ply"
+                has_normals = reused['normals'][len(files)]
+                files.append(filename)
+                normals.append(has_normals)
+                params = {
+                    'type': 'ply',
+                    'filename': filename
+                }
+                if not has_normals:
+                    params["face_normals"] = True
+                params.update(material_refs(export_ctx, b_mesh, mat_nr))
             else:
-                mat_id = f"mat-{b_object.data.materials[mat_nr].name}"
-                if export_ctx.exported_mats.has_mat(mat_id): # Add one emitter *and* one bsdf
-                    mixed_mat = export_ctx.exported_mats.mats[mat_id]
-                    params['bsdf'] = {'type':'ref', 'id':mixed_mat['bsdf']}
-                    params['emitter'] = mixed_mat['emitter']
-                else:
-                    params['bsdf'] = {'type':'ref', 'id':mat_id}
+                params = write_part(export_ctx, name, part, serialized)
+                if params['type'] == 'ply':
+                    files.append(params['filename'])
+                    normals.append(not params.get('face_normals', False))
+                # Add material info
+                params.update(material_refs(export_ctx, b_mesh, mat_nr))
 
             # Add dict to the scene dict
             if use_shapegroup:
@@ -201,19 +605,161 @@ def export_object(deg_instance, export_ctx, is_particle):
             else:
                 if export_ctx.export_ids:
                     export_ctx.data_add(params, name=mesh_id)
+                    registered_ids.append(mesh_id)
                 else:
                     export_ctx.data_add(params)
 
+        if digest is not None:
+            if reused is not None:
+                # Link the files if they were exported under other names
+                manifest.restore(reused, files)
+            manifest.record(object_id, digest, files,
+                            mat_nrs=[mat_nr for mat_nr, _ in converted_parts], normals=normals)
+
         if use_shapegroup:
             export_ctx.data_add(group, name=object_id)
+        elif registered_ids:
+            export_ctx.register_object(b_object, registered_ids,
+                                       mat_nrs=[mat_nr for mat_nr, _ in converted_parts],
+                                       deforming=may_deform(b_object))
 
-    if is_instance or is_particle:
-        params = {
-            'type': 'instance',
-            'shape': {
-                'type': 'ref',
-                'id': object_id
-            },
-            'to_world': export_ctx.transform_matrix(deg_instance.matrix_world)
-        }
-        export_ctx.data_add(params)
+    if is_instance or is_particle or is_linked:
+        # The instance entries are created in one batch, see ExportContext.export_instances
+        export_ctx.add_instance(object_id)
+        if is_instance and not is_linked:
+            export_ctx.instance_groups[b_object.name_full] = object_id
+
+
+def is_animated(b_object):
+    """
+    Whether an object, its mesh data or its shape keys are animated.
+    """
+    b_object = b_object.original
+    if b_object.animation_data is not None:
+        return True
+    b_data = b_object.data
+    if b_data is None:
+        return False
+    if b_data.animation_data is not None:
+        return True
+    shape_keys = getattr(b_data, 'shape_keys', None)
+    return shape_keys is not None and shape_keys.animation_data is not None
+
+# Modifiers that change the geometry over time, or depend on the scene and frame
+_deform_modifiers = {
+    'ARMATURE', 'CAST', 'CLOTH', 'COLLISION', 'CORRECTIVE_SMOOTH', 'CURVE', 'DISPLACE',
+    'DYNAMIC_PAINT', 'EXPLODE', 'FLUID', 'HOOK', 'LAPLACIANDEFORM', 'LATTICE', 'MESH_CACHE',
+    'MESH_DEFORM', 'MESH_SEQUENCE_CACHE', 'NODES', 'OCEAN', 'PARTICLE_INSTANCE',
+    'SHRINKWRAP', 'SIMPLE_DEFORM', 'SOFT_BODY', 'SURFACE', 'SURFACE_DEFORM', 'WARP', 'WAVE',
+}
+# Properties of modifiers referencing another object, whose motion changes the result
+_modifier_object_props = ('object', 'collection', 'mirror_object', 'offset_object', 'target', 'start_cap', 'end_cap')
+
+def _animates_modifiers(animation_data):
+    if animation_data is None:
+        return False
+    if animation_data.action is not None and any(fcurve.data_path.startswith('modifiers[')
+                                                  for fcurve in animation_data.action.fcurves):
+        return True
+    return any(driver.data_path.startswith('modifiers[') for driver in animation_data.drivers)
+
+def may_deform(b_object):
+    """
+    Whether the geometry of an object may change from one frame to the next,
+    i.e. if it has deforming modifiers (armature, lattice...), modifiers with
+    animated or driven settings or depending on other objects, or animated
+    mesh data or shape keys. Other objects can only move rigidly.
+    """
+    b_object = b_object.original
+    for modifier in b_object.modifiers:
+        if modifier.type in _deform_modifiers:
+            return True
+        if any(getattr(modifier, prop, None) is not None for prop in _modifier_object_props):
+            return True
+    if b_object.modifiers and _animates_modifiers(b_object.animation_data):
+        return True
+    b_data = b_object.data
+    if b_data.animation_data is not None:
+        return True
+    shape_keys = getattr(b_data, 'shape_keys', None)
+    return shape_keys is not None and shape_keys.animation_data is not None
+
+def object_space_parts(export_ctx, b_object, record):
+    """
+    Read the object space buffers of the parts of a registered object, in the
+    order of record['ids']. Returns None if the parts changed.
+    """
+    b_mesh = b_object.data if b_object.type == 'MESH' else b_object.to_mesh()
+    names = dict(zip(record['mat_nrs'], record['ids']))
+    converted_parts = dict(convert_mesh_parts(export_ctx, b_mesh, None, names, build=False))
+    if b_object.type != 'MESH':
+        b_object.to_mesh_clear()
+    if converted_parts.keys() != names.keys():
+        return None
+    return [{key: part[key] for key in ('positions', 'normals') if key in part}
+            for part in (converted_parts[mat_nr] for mat_nr in record['mat_nrs'])]
+
+def _set_buffer(params, key, values):
+    params[key] = type(params[key])(values)
+
+def update_object(export_ctx, b_object, record, params, geometry_changed):
+    """
+    Update the vertex buffers of an object already loaded in a Mitsuba scene,
+    to follow a change of its transform or of its geometry.
+
+    Params
+    ------
+    export_ctx:       The export context the object was exported with.
+    b_object:         The evaluated blender object.
+    record:           The entry created for this object by export_ctx.register_object.
+    params:           The traversed parameters of the Mitsuba scene.
+    geometry_changed: Whether the mesh data changed, or only the transform.
+
+    Returns False if the object cannot be updated in place, e.g. if its
+    topology changed. It then needs to be exported again.
+    """
+    from mitsuba import traverse
+    if geometry_changed:
+        if b_object.type != 'MESH':
+            return False
+        # The object space buffers of rigid motion are outdated
+        record.pop('sources', None)
+        names = dict(zip(record['mat_nrs'], record['ids']))
+        converted_parts = dict(convert_mesh_parts(export_ctx, b_object.data, b_object.matrix_world, names))
+        for mesh_id, mat_nr in zip(record['ids'], record['mat_nrs']):
+            mts_mesh = converted_parts.get(mat_nr)
+            if mts_mesh is None:
+                return False
+            mesh_params = traverse(mts_mesh)
+            for buffer in ('vertex_positions', 'vertex_normals', 'vertex_texcoords', 'faces'):
+                key = f"{mesh_id}.{buffer}"
+                if (buffer in mesh_params) != (key in params):
+                    return False
+                if key not in params:
+                    continue
+                # Same buffer sizes means same topology
+                if len(params[key]) != len(mesh_params[buffer]):
+                    return False
+                params[key] = mesh_params[buffer]
+    else:
+        # Rigid motion: the vertices are transformed again from object space
+        # with the new absolute transform, so that errors do not build up over frames
+        sources = record.get('sources')
+        if sources is None:
+            sources = object_space_parts(export_ctx, b_object, record)
+            if sources is None:
+                return False
+            record['sources'] = sources
+        to_world = export_ctx.axis_mat @ b_object.matrix_world
+        for mesh_id, buffers in zip(record['ids'], sources):
+            key = f"{mesh_id}.vertex_positions"
+            if key not in params or len(params[key]) != buffers['positions'].size:
+                return False
+            positions, normals = transform_vertices(to_world, buffers['positions'], buffers.get('normals'))
+            _set_buffer(params, key, positions.ravel())
+            key = f"{mesh_id}.vertex_normals"
+            if normals is not None and key in params and len(params[key]) == normals.size:
+                _set_buffer(params, key, normals.ravel())
+
+    record['matrix'] = b_object.matrix_world.copy()
+    return True
@@ -114,6 +114,7 @@ def export_light(light_instance, export_ctx):
         params = light_converters[b_light.data.type](b_light, export_ctx)
         if export_ctx.export_ids:
             export_ctx.data_add(params, name="emit-%s" % b_light.name_full)
+            export_ctx.register_object(b_light, ["emit-%s" % b_light.name_full])
         else:
             export_ctx.data_add(params)
     except KeyError:
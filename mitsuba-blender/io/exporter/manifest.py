@@ -0,0 +1,134 @@
+'''
+Manifest of the files written by previous exports to a folder, used to only
+write again the meshes and textures that changed.
+
+Each exported asset has a key (e.g. its scene dict ID) and a hash of its
+content. When an asset is exported again with the same hash and its files
+are still on disk, they are reused as is; if another asset with the same
+hash was already exported, its files are hard-linked instead of being
+encoded again. Files that were written by a previous export of the same scene
+and that are no longer used are removed when saving the manifest.
+
+Only the files listed in the manifest are ever removed. Several scenes can be
+exported to the same folder, each with its own entries.
+'''
+
+import json
+import os
+import shutil
+
+class ExportManifest:
+    '''
+    Manifest of an export folder.
+
+    directory: The export folder
+    scene: Name of the exported scene file, to keep track of the files of each scene
+    '''
+    filename = '.mitsuba_manifest.json'
+    version = 1
+
+    def __init__(self, directory, scene):
+        self.directory = directory
+        self.scene = scene
+        self.scenes = {}
+        # Entries of all the scenes and of this export by content hash
+        self.hashes = {}
+        path = os.path.join(directory, self.filename)
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.version:
+                    self.scenes = data['scenes']
+                    for entries in self.scenes.values():
+                        for entry in entries.values():
+                            self.add_hash(entry)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                # Not a valid manifest, everything is written again
+                self.scenes = {}
+                self.hashes = {}
+        self.previous = self.scenes.get(scene, {})
+        self.entries = {}
+
+    def file_path(self, filename):
+        return os.path.join(self.directory, *filename.split('/'))
+
+    def files_exist(self, entry):
+        return all(os.path.isfile(self.file_path(filename)) for filename in entry['files'])
+
+    def lookup(self, key, digest):
+        '''
+        Find previously exported files with the given content hash.
+        The previous entry of 'key' is looked at first, then the entries of
+        all the scenes and of this export with the same hash.
+
+        Returns the entry, with its 'files' list and the additional info it
+        was recorded with, or None if there is none whose files are still on disk.
+        '''
+        entry = self.previous.get(key)
+        if entry is not None and entry['hash'] == digest and self.files_exist(entry):
+            return entry
+        for entry in self.hashes.get(digest, ()):
+            if self.files_exist(entry):
+                return entry
+        return None
+
+    def add_hash(self, entry):
+        self.hashes.setdefault(entry['hash'], []).append(entry)
+
+    def restore(self, entry, files):
+        '''
+        Make the files of a previous entry available under new names, by hard
+        linking them, or copying them if links are not supported.
+        '''
+        for source, target in zip(entry['files'], files):
+            if source == target:
+                continue
+            source_path = self.file_path(source)
+            target_path = self.file_path(target)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            if os.path.lexists(target_path):
+                os.remove(target_path)
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                shutil.copy2(source_path, target_path)
+
+    def prepare(self, filename):
+        '''
+        Remove a file that is about to be written again: it may be hard-linked
+        to other files, which must keep their content.
+        '''
+        path = self.file_path(filename)
+        if os.path.lexists(path):
+            os.remove(path)
+
+    def record(self, key, digest, files, **info):
+        '''
+        Record the files written (or reused) for an asset in this export
+
+        key: Key of the asset
+        digest: Hash of the content of the asset
+        files: Names of the files, relative to the export folder with '/' separators
+        info: Additional data needed to use the files again, must be serializable to JSON
+        '''
+        entry = self.entries[key] = {'hash': digest, 'files': list(files), **info}
+        self.add_hash(entry)
+
+    def save(self):
+        '''
+        Remove the files of the previous export of the scene that are no
+        longer used, and write the manifest.
+        '''
+        self.scenes[self.scene] = self.entries
+        used = {filename for entries in self.scenes.values()
+                for entry in entries.values() for filename in entry['files']}
+        for entry in self.previous.values():
+            for filename in entry['files']:
+                path = self.file_path(filename)
+                if filename not in used and os.path.isfile(path):
+                    os.remove(path)
+        self.previous = self.entries
+        path = os.path.join(self.directory, self.filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'scenes': self.scenes}, f, indent=1)
@@ -1,7 +1,10 @@
+import hashlib
 import numpy as np
 from mathutils import Matrix
 from .export_context import Files
 
+import bpy
+
 RoughnessMode = {'GGX': 'ggx', 'BECKMANN': 'beckmann', 'ASHIKHMIN_SHIRLEY':'beckmann', 'MULTI_GGX':'ggx'}
 #TODO: update when other distributions are supported
 
@@ -362,6 +365,85 @@ def b_material_to_dict(export_ctx, b_mat):
 
     return mat_params
 
+# Properties of nodes that do not change the shading
+_ui_properties = {'rna_type', 'name', 'label', 'location', 'width', 'width_hidden', 'height',
+                  'dimensions', 'select', 'show_options', 'show_preview', 'show_texture',
+                  'hide', 'color', 'use_custom_color', 'parent', 'id_data'}
+
+def _hash_value(digest, value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        digest.update(repr(value).encode())
+    elif isinstance(value, set): # Enum flags
+        digest.update(repr(sorted(value)).encode())
+    else: # Vectors, colors, matrices
+        digest.update(np.array(value, dtype=np.float64).tobytes())
+
+# Collections of nodes that are hashed separately, or that do not change the shading
+_skipped_collections = {'inputs', 'outputs', 'internal_links'}
+# Depth of the settings structs hashed, e.g. node > curve mapping > curves > points
+_max_struct_depth = 4
+
+def _hash_struct(digest, struct, trees, depth=0):
+    '''
+    Hash the editable properties of a node, or of one of its settings structs,
+    including the items of their collections (color ramp elements, curve points...)
+    '''
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in _ui_properties:
+            continue
+        value = getattr(struct, prop.identifier, None)
+        digest.update(prop.identifier.encode())
+        if prop.type == 'COLLECTION':
+            if prop.identifier in _skipped_collections or value is None or depth >= _max_struct_depth:
+                continue
+            digest.update(str(len(value)).encode())
+            for item in value:
+                if isinstance(item, bpy.types.ID):
+                    digest.update(item.name_full.encode())
+                else:
+                    _hash_struct(digest, item, trees, depth + 1)
+        elif prop.type != 'POINTER' or value is None:
+            _hash_value(digest, value)
+        elif isinstance(value, bpy.types.ID):
+            digest.update(value.name_full.encode())
+            if isinstance(value, bpy.types.NodeTree):
+                _hash_node_tree(digest, value, trees)
+        elif depth < _max_struct_depth: # e.g. texture mapping settings
+            _hash_struct(digest, value, trees, depth + 1)
+
+def _hash_node_tree(digest, node_tree, trees):
+    '''
+    Hash the nodes, socket values and links of a node tree, and of the node groups it uses
+    '''
+    if node_tree.name_full in trees:
+        return
+    trees.add(node_tree.name_full)
+    for node in node_tree.nodes:
+        digest.update(f"{node.bl_idname} {node.name}".encode())
+        _hash_struct(digest, node, trees)
+        for socket in node.inputs:
+            digest.update(socket.identifier.encode())
+            if hasattr(socket, 'default_value'):
+                _hash_value(digest, socket.default_value)
+    for link in node_tree.links:
+        digest.update(f"{link.from_node.name} {link.from_socket.identifier} "
+                      f"{link.to_node.name} {link.to_socket.identifier} {link.is_muted}".encode())
+
+def material_hash(export_ctx, b_mat):
+    '''
+    Hash of the settings of a material that are used by its conversion.
+    The hash is computed once per export.
+    '''
+    key = b_mat.as_pointer()
+    if key not in export_ctx.material_hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{b_mat.name_full} {b_mat.use_nodes}".encode())
+        _hash_value(digest, b_mat.diffuse_color)
+        if b_mat.use_nodes and b_mat.node_tree is not None:
+            _hash_node_tree(digest, b_mat.node_tree, set())
+        export_ctx.material_hashes[key] = digest.hexdigest()
+    return export_ctx.material_hashes[key]
+
 def export_material(export_ctx, material):
     mat_params = {}
 
@@ -370,12 +452,18 @@ def export_material(export_ctx, material):
 
     mat_id = "mat-%s" % material.name
 
-    mat_params = b_material_to_dict(export_ctx, material)
-
     #TODO: hide emitters
-    if export_ctx.data_get(mat_id) is not None:
+    # Only convert materials once, their node tree and textures are only
+    # walked again if they changed since they were converted
+    cache_key = (material.as_pointer(), material_hash(export_ctx, material))
+    if cache_key in export_ctx.material_cache or export_ctx.data_get(mat_id) is not None:
         #material was already exported
+        export_ctx.material_hits += 1
         return
+    export_ctx.material_misses += 1
+    export_ctx.material_cache[cache_key] = mat_id
+
+    mat_params = b_material_to_dict(export_ctx, material)
 
     if isinstance(mat_params, list): # Add/mix shader
         mats = {}
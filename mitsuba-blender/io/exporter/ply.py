@@ -0,0 +1,62 @@
+'''
+Binary PLY writer for the vertex buffers gathered by geometry.part_buffers.
+
+This writes the same kind of file as mitsuba's Mesh.write_ply, without
+building a mitsuba mesh first: the vertex and face buffers are interleaved in
+two preallocated NumPy arrays and written with one call each.
+'''
+
+import numpy as np
+
+def _vertex_fields(buffers):
+    '''
+    List the (property names, array) groups of the vertex element
+    '''
+    fields = [(('x', 'y', 'z'), buffers['positions'])]
+    if 'normals' in buffers:
+        fields.append((('nx', 'ny', 'nz'), buffers['normals']))
+    if 'uvs' in buffers:
+        fields.append((('u', 'v'), buffers['uvs']))
+    for attribute, colors in buffers['colors'].items():
+        # Same naming as mitsuba: the fields <name>_0, <name>_1... are loaded as the attribute vertex_<name>
+        name = '_'.join(attribute[len('vertex_'):].split())
+        fields.append((tuple(f'{name}_{i}' for i in range(colors.shape[1])), colors))
+    return fields
+
+def write_ply(filepath, buffers):
+    '''
+    Write a triangle mesh to a binary little-endian PLY file.
+
+    filepath: The path of the file to write
+    buffers: Dict of float32 'positions', optional 'normals' and 'uvs',
+             'colors' by attribute name, and uint32 'faces' arrays, as returned
+             by geometry.part_buffers
+    '''
+    fields = _vertex_fields(buffers)
+    vertex_count = len(buffers['positions'])
+    faces = buffers['faces']
+
+    # Interleave the vertex data
+    column_count = sum(len(names) for names, _ in fields)
+    vertices = np.empty((vertex_count, column_count), dtype='<f4')
+    column = 0
+    for names, values in fields:
+        vertices[:, column:column + len(names)] = values
+        column += len(names)
+
+    face_data = np.empty(len(faces), dtype=[('count', 'u1'), ('indices', '<i4', (3,))])
+    face_data['count'] = 3
+    face_data['indices'] = faces
+
+    header = ['ply',
+              'format binary_little_endian 1.0',
+              f'element vertex {vertex_count}']
+    header += [f'property float {name}' for names, _ in fields for name in names]
+    header += [f'element face {len(faces)}',
+               'property list uchar int vertex_indices',
+               'end_header']
+
+    with open(filepath, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        f.write(vertices.data)
+        f.write(face_data.data)
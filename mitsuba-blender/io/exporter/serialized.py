@@ -0,0 +1,97 @@
+'''
+Writer of Mitsuba's .serialized mesh files, storing several meshes in one
+file. Each mesh is compressed separately with zlib, and an offset table at
+the end of the file lets the renderer load any of them directly (with the
+'shape_index' parameter of the 'serialized' plugin).
+
+Layout of a file (format version 4):
+- For each shape: the uint16 format identifier 0x041C, the uint16 version 4
+  and a zlib stream containing:
+    - uint32 flags (see below)
+    - the UTF-8 name of the shape, null-terminated
+    - uint64 vertex count, uint64 triangle count
+    - float32 positions, normals, texture coordinates and colors
+    - uint32 triangle indices
+- The uint64 offsets of the shapes in the file, then the uint32 shape count.
+'''
+
+import zlib
+import numpy as np
+
+FORMAT_ID = 0x041C
+FORMAT_VERSION = 4
+
+# Shape flags
+HAS_NORMALS = 0x0001
+HAS_TEXCOORDS = 0x0002
+HAS_COLORS = 0x0008
+FACE_NORMALS = 0x0010
+SINGLE_PRECISION = 0x1000
+
+def encode_shape(name, buffers, level=6):
+    '''
+    Encode and compress one shape.
+
+    name: The name of the shape
+    buffers: Dict of float32 'positions', optional 'normals' and 'uvs', 'colors'
+             by attribute name (at most one) and uint32 'faces' arrays, as
+             returned by geometry.part_buffers
+    level: zlib compression level
+
+    Returns the bytes of the shape, header included.
+    '''
+    flags = SINGLE_PRECISION
+    arrays = [buffers['positions']]
+    if 'normals' in buffers:
+        flags |= HAS_NORMALS
+        arrays.append(buffers['normals'])
+    else:
+        flags |= FACE_NORMALS
+    if 'uvs' in buffers:
+        flags |= HAS_TEXCOORDS
+        arrays.append(buffers['uvs'])
+    if buffers['colors']:
+        flags |= HAS_COLORS
+        arrays.append(next(iter(buffers['colors'].values())))
+    arrays.append(buffers['faces'])
+
+    header = np.array([flags], dtype='<u4').tobytes() + name.encode('utf-8') + b'\0'
+    header += np.array([len(buffers['positions']), len(buffers['faces'])], dtype='<u8').tobytes()
+    # zlib releases the GIL, shapes can be compressed in several threads
+    compressor = zlib.compressobj(level)
+    data = [np.array([FORMAT_ID, FORMAT_VERSION], dtype='<u2').tobytes(), compressor.compress(header)]
+    for array in arrays:
+        data.append(compressor.compress(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))))
+    data.append(compressor.flush())
+    return b''.join(data)
+
+class SerializedFile:
+    '''
+    A .serialized file being exported. Shapes are added in order, and their
+    encoding can run in the background; the file is written by write() once
+    all of them are encoded.
+    '''
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.shapes = []
+
+    def add_shape(self):
+        '''
+        Reserve the next shape of the file, returns its index
+        '''
+        self.shapes.append(None)
+        return len(self.shapes) - 1
+
+    def encode_shape(self, index, name, buffers):
+        '''
+        Encode a shape reserved with add_shape(), may be called from another thread
+        '''
+        self.shapes[index] = encode_shape(name, buffers)
+
+    def write(self):
+        offsets = np.cumsum([0] + [len(shape) for shape in self.shapes[:-1]], dtype='<u8')
+        with open(self.filepath, 'wb') as f:
+            for shape in self.shapes:
+                f.write(shape)
+            f.write(offsets.astype('<u8').tobytes())
+            f.write(np.array([len(self.shapes)], dtype='<u4').tobytes())
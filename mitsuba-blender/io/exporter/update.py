@@ -0,0 +1,85 @@
+'''
+Helpers to push the changes of an exported scene dict to an already loaded
+Mitsuba scene, through the parameters returned by mitsuba.traverse().
+'''
+
+import numpy as np
+
+def _is_transform(value):
+    return hasattr(value, 'matrix') and not isinstance(value, dict)
+
+def _values_equal(a, b):
+    if isinstance(a, dict) or isinstance(b, dict):
+        if not (isinstance(a, dict) and isinstance(b, dict)) or a.keys() != b.keys():
+            return False
+        return all(_values_equal(a[k], b[k]) for k in a)
+    if _is_transform(a) and _is_transform(b):
+        return np.allclose(np.array(a.matrix), np.array(b.matrix))
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(_values_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+def _param_name(parent, key):
+    '''
+    Name under which the parameter 'key' of a scene dict entry is traversed
+    '''
+    # Most plugins expose their parameters under the same name as in the dict,
+    # except for a few cases that we remap here.
+    if key == 'bsdf' and parent.get('type') == 'twosided':
+        return 'brdf_0'
+    if key == 'fov' and parent.get('fov_axis', 'x') == 'x':
+        return 'x_fov'
+    return key
+
+def dict_diff(old, new, path=()):
+    '''
+    List the leaves that differ between two scene dict entries.
+
+    Returns a list of (key, new_value) tuples, where key is the traversal key of
+    the leaf, or None if the two entries do not have the same structure
+    (different plugin types or parameters), in which case they cannot be patched.
+    '''
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    if old.keys() != new.keys() or old.get('type') != new.get('type'):
+        return None
+    changes = []
+    for key, new_value in new.items():
+        old_value = old[key]
+        child_path = path + (_param_name(new, key),)
+        if isinstance(new_value, dict) or isinstance(old_value, dict):
+            child_changes = dict_diff(old_value, new_value, child_path)
+            if child_changes is None:
+                return None
+            changes += child_changes
+        elif not _values_equal(old_value, new_value):
+            changes.append(('.'.join(child_path), new_value))
+    return changes
+
+def _cast_like(current, value):
+    if isinstance(value, (list, tuple)):
+        return type(current)(value)
+    return value
+
+def patch_params(params, name, old, new):
+    '''
+    Push the differences between two versions of the scene dict entry 'name' to
+    the traversed scene parameters.
+
+    Returns False if at least one of the changes cannot be applied in place.
+    '''
+    changes = dict_diff(old, new, (name,))
+    if changes is None:
+        return False
+    for key, value in changes:
+        # Scalar inputs of BSDFs and emitters are often converted to uniform textures
+        for candidate in (key, f"{key}.value"):
+            if candidate in params:
+                try:
+                    params[candidate] = _cast_like(params[candidate], value)
+                except (TypeError, RuntimeError):
+                    return False
+                break
+        else:
+            return False
+    return True
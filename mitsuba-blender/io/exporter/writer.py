@@ -0,0 +1,65 @@
+'''
+Background writing of the files of an export (meshes and textures).
+
+The main thread reads the Blender data it needs into buffers and queues the
+writing of the files, so that disk I/O overlaps with the conversion of the
+next objects. The memory held by the queued jobs is bounded: when the queued
+buffers exceed the budget, queueing a new job waits for previous ones to finish.
+'''
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class BackgroundWriter:
+    '''
+    Bounded pool of threads writing files.
+
+    max_workers: Number of writing threads
+    max_pending_bytes: Memory budget of the buffers held by the queued jobs
+    '''
+    def __init__(self, max_workers=None, max_pending_bytes=1 << 30):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.max_pending_bytes = max_pending_bytes
+        self.executor = None
+        self.jobs = []
+        self.pending_bytes = 0
+        self.condition = threading.Condition()
+
+    def submit(self, job, *args, size=0):
+        '''
+        Queue job(*args). 'size' is the memory held by the arguments,
+        released once the job is done.
+        '''
+        with self.condition:
+            # Always accept a job when nothing is pending, even if it is larger than the budget
+            self.condition.wait_for(lambda: self.pending_bytes == 0
+                                    or self.pending_bytes + size <= self.max_pending_bytes)
+            self.pending_bytes += size
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        future = self.executor.submit(job, *args)
+        future.add_done_callback(lambda _: self.release(size))
+        self.jobs.append(future)
+        # Errors are only raised in join(), drop the jobs that went fine
+        if len(self.jobs) > 4 * self.max_workers:
+            self.jobs = [f for f in self.jobs if not f.done() or f.exception() is not None]
+
+    def release(self, size):
+        with self.condition:
+            self.pending_bytes -= size
+            self.condition.notify_all()
+
+    def join(self):
+        '''
+        Wait for all the queued jobs. The first error of a job is raised here.
+        '''
+        if self.executor is None:
+            return
+        try:
+            for job in self.jobs:
+                job.result()
+        finally:
+            self.executor.shutdown()
+            self.executor = None
+            self.jobs = []
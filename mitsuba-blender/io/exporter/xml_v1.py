@@ -0,0 +1,46 @@
+import os
+
+from mitsuba.python.xml import WriteXML
+
+from .downgrade import VERSIONS, rename
+
+class WriteXMLv1(WriteXML):
+    '''
+    XML writer producing Mitsuba 0.6 scene files directly, instead of writing
+    Mitsuba 3 files and converting them with downgrade.convert.
+
+    Elements are renamed on the fly with the same rules as the downgrade
+    converter (camelCase names, intIOR/extIOR, split translations). The main
+    file and the fragments get a "_v1" suffix, so that includes already
+    point to the right files.
+    '''
+
+    def set_filename(self, name):
+        core, ext = os.path.splitext(name)
+        super().set_filename(f"{core}_v1{ext}")
+
+    def convert_element(self, name, attributes):
+        '''
+        Convert the tag and attributes of an element to the 0.6 syntax
+        '''
+        attributes = dict(attributes)
+        if 'version' in attributes:
+            attributes['version'] = VERSIONS['v1']
+        if 'name' in attributes:
+            attributes['name'] = rename(attributes['name'])
+        if 'type' in attributes:
+            attributes['type'] = rename(attributes['type'])
+        if name == 'string' and attributes.get('name') != 'filename':
+            attributes['value'] = rename(str(attributes['value']))
+        if name == 'translate' and 'value' in attributes:
+            x, y, z = str(attributes.pop('value')).split()
+            attributes['x'] = x
+            attributes['y'] = y
+            attributes['z'] = z
+        return rename(name), attributes
+
+    def open_element(self, name, attributes={}, file=None):
+        super().open_element(*self.convert_element(name, attributes), file=file)
+
+    def element(self, name, attributes={}, file=None):
+        super().element(*self.convert_element(name, attributes), file=file)
@@ -2,6 +2,8 @@ import time
 
 if "bpy" in locals():
     import importlib
+    if "loader" in locals():
+        importlib.reload(loader)
     if "common" in locals():
         importlib.reload(common)
     if "materials" in locals():
@@ -383,7 +385,12 @@ def load_mitsuba_scene(bl_context, bl_scene, bl_collection, filepath, global_mat
     mi_context = common.MitsubaSceneImportContext(bl_context, bl_scene, bl_collection, filepath, mi_scene_props, global_mat)
 
     _, mi_props = mi_scene_props.get_first_of_class('Scene')
-    bl_scene_data_node = mi_props_to_bl_data_node(mi_context, 'Scene', mi_props)
+    # Decode the mesh files in the background while the scene is converted
+    shapes.queue_shape_geometry(mi_context)
+    try:
+        bl_scene_data_node = mi_props_to_bl_data_node(mi_context, 'Scene', mi_props)
+    finally:
+        mi_context.geometry_loader.close()
     if bl_scene_data_node is None:
         mi_context.log('Failed to load Mitsuba scene', 'ERROR')
         return
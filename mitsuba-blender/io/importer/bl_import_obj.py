@@ -13,7 +13,9 @@ http://wiki.blender.org/index.php/Scripts/Manual/Import/wavefront_obj
 
 import array
 import os
+import warnings
 import bpy
+import numpy as np
 
 from bpy_extras.io_utils import unpack_list
 
@@ -381,6 +383,264 @@ def any_number_as_int(svalue):
     return int(float(svalue))
 
 
+# Size of the parts of the file parsed at once by the fast path
+FAST_CHUNK_SIZE = 1 << 26
+
+
+def _parse_values(data, dtype):
+    """
+    Parse the numbers of some OBJ lines whose tags were blanked, returns the
+    flat values and the number of values of each line, or None if some
+    values could not be parsed.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    space = buf <= 32
+    token_starts = ~space
+    token_starts[1:] &= space[:-1]
+    line_starts = np.concatenate(([0], np.flatnonzero(buf == 10)[:-1] + 1))
+    counts = np.add.reduceat(token_starts, line_starts, dtype=np.int64) if len(buf) else np.zeros(0, dtype=np.int64)
+    with warnings.catch_warnings():
+        # Unparsable data only raises a warning, and returns the values read so far
+        warnings.simplefilter('error')
+        try:
+            values = np.fromstring(data, dtype=dtype, sep=' ')
+        except (ValueError, DeprecationWarning):
+            return None
+    if len(values) != counts.sum():
+        return None
+    return values, counts
+
+
+def _vector_rows(values, counts, vec_len):
+    """
+    Keep the first vec_len values of each vertex line, as the full parser does.
+    Returns None if a line has fewer values.
+    """
+    if (counts < vec_len).any():
+        return None
+    line_starts = np.cumsum(counts) - counts
+    return values[line_starts[:, None] + np.arange(vec_len)].astype(np.float32)
+
+
+def read_fast(filepath,
+              *,
+              use_smooth_groups=True,
+              use_edges=True,
+              use_split_objects=True,
+              use_split_groups=False,
+              use_groups_as_vgroups=False,
+              ):
+    """
+    Fast path of load() for the common case of a single object made of
+    v/vt/vn lines and triangle or quad faces with absolute indices, without
+    smooth groups, polylines or line continuations.
+    The file is parsed in large chunks with NumPy, each kind of line at once.
+
+    Returns a dict of flat arrays ('positions', 'loop_totals', 'loop_verts',
+    optional 'loop_normals' and 'loop_uvs') and the 'dataname' of the mesh,
+    or None if the file uses features that need the full parser.
+    """
+    split_meshes = bool(use_split_objects or use_split_groups)
+    if split_meshes:
+        use_groups_as_vgroups = False
+
+    verts_loc = []
+    verts_nor = []
+    verts_tex = []
+    face_values = []
+    face_counts = []
+    face_format = None  # Number of '/' in the vertices of faces
+    object_name = None
+    has_faces = False
+
+    with open(filepath, 'rb') as f:
+        remainder = b''
+        while True:
+            data = f.read(FAST_CHUNK_SIZE)
+            if not data:
+                if not remainder:
+                    break
+                chunk, remainder = remainder + b'\n', b''
+            else:
+                end = data.rfind(b'\n') + 1
+                if end == 0:
+                    remainder += data
+                    continue
+                chunk, remainder = remainder + data[:end], data[end:]
+
+            if b'\\' in chunk or b',' in chunk:
+                # Multi-line statements and comma decimal separators
+                return None
+
+            buf = np.frombuffer(bytearray(chunk), dtype=np.uint8)
+            line_ends = np.flatnonzero(buf == 10) + 1
+            line_starts = np.concatenate(([0], line_ends[:-1]))
+            tags = buf[line_starts]
+            # The chunk ends with a newline, the second byte always exists
+            seconds = buf[line_starts + 1]
+            tagged = (seconds == 32) | (seconds == 9)
+
+            if ((tags == 32) | (tags == 9)).any():
+                # Indented lines
+                return None
+
+            # Statements that change the context are rare, look at them one by one
+            for line_idx in np.flatnonzero(tagged & np.isin(tags, np.frombuffer(b'solg', dtype=np.uint8))):
+                line_split = chunk[line_starts[line_idx]:line_ends[line_idx]].split()
+                line_start = line_split[0]
+                if line_start == b's':
+                    if use_smooth_groups and line_value(line_split) not in (None, b'off'):
+                        return None
+                elif line_start == b'o':
+                    if use_split_objects and len(line_split) > 1:
+                        # Only one object, named before any face
+                        if object_name is not None or has_faces or (tagged[:line_idx] & (tags[:line_idx] == ord('f'))).any():
+                            return None
+                        object_name = line_value(line_split)
+                elif line_start == b'g':
+                    if use_split_groups or use_groups_as_vgroups:
+                        return None
+                elif line_start == b'l':
+                    if use_edges:
+                        return None
+
+            is_v = tagged & (tags == ord('v'))
+            is_vt = (tags == ord('v')) & (seconds == ord('t'))
+            is_vn = (tags == ord('v')) & (seconds == ord('n'))
+            is_f = tagged & (tags == ord('f'))
+
+            # Blank the tags, leaving only the numbers of the lines
+            buf[line_starts[is_v | is_vt | is_vn | is_f]] = 32
+            buf[line_starts[is_vt | is_vn] + 1] = 32
+
+            lengths = line_ends - line_starts
+            for is_type, vdata, vdata_len in ((is_v, verts_loc, 3), (is_vt, verts_tex, 2), (is_vn, verts_nor, 3)):
+                if not is_type.any():
+                    continue
+                parsed = _parse_values(buf[np.repeat(is_type, lengths)].tobytes(), np.float64)
+                if parsed is None:
+                    return None
+                rows = _vector_rows(*parsed, vdata_len)
+                if rows is None:
+                    return None
+                vdata.append(rows)
+
+            if is_f.any():
+                data = buf[np.repeat(is_f, lengths)].tobytes()
+                if face_format is None:
+                    face_format = data.split(None, 1)[0].count(b'/')
+                # Missing texture coordinates become the index 0
+                data = data.replace(b'//', b'/0/')
+                slashes = data.count(b'/')
+                parsed = _parse_values(data.replace(b'/', b' '), np.int64)
+                if parsed is None:
+                    return None
+                values, counts = parsed
+                corners, rest = np.divmod(counts, face_format + 1)
+                if rest.any() or ((corners != 3) & (corners != 4)).any() or slashes != face_format * corners.sum():
+                    return None
+                face_values.append(values)
+                face_counts.append(corners)
+                has_faces = True
+
+    if not has_faces:
+        return None
+
+    positions = np.concatenate(verts_loc) if verts_loc else np.zeros((0, 3), dtype=np.float32)
+    loop_totals = np.concatenate(face_counts).astype(np.int32)
+    values = np.concatenate(face_values).reshape(-1, face_format + 1)
+    loop_verts = values[:, 0]
+    if loop_verts.min() < 1 or loop_verts.max() > len(positions):
+        # Relative indices, or invalid ones
+        return None
+    loop_verts = (loop_verts - 1).astype(np.int32)
+
+    # Faces using a vertex more than once need to be tessellated
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    for total in (3, 4):
+        corners = loop_verts[loop_starts[loop_totals == total][:, None] + np.arange(total)]
+        corners = np.sort(corners, axis=1)
+        if (corners[:, 1:] == corners[:, :-1]).any():
+            return None
+
+    mesh_data = {'loop_totals': loop_totals}
+    for index, vdata, name in ((1, verts_tex, 'loop_uvs'), (2, verts_nor, 'loop_normals')):
+        if not vdata:
+            continue
+        vdata = np.concatenate(vdata)
+        # Missing indices refer to the first item, as in the full parser
+        if face_format < index:
+            indices = np.zeros(len(values), dtype=np.int64)
+        elif values[:, index].min() < 0:
+            return None
+        else:
+            indices = np.maximum(values[:, index] - 1, 0)
+        if len(vdata) == 0 or indices.max() >= len(vdata):
+            return None
+        mesh_data[name] = vdata[indices]
+
+    filename = os.path.splitext((os.path.basename(filepath)))[0]
+    if split_meshes:
+        # Only keep the vertices used by the faces, in the order of their first use
+        used, first_use = np.unique(loop_verts, return_index=True)
+        used = used[np.argsort(first_use, kind='stable')]
+        remap = np.empty(len(positions), dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        positions = positions[used]
+        loop_verts = remap[loop_verts]
+        dataname = object_name.decode('utf-8', 'replace') if object_name else filename
+    else:
+        dataname = filename
+
+    mesh_data['positions'] = positions
+    mesh_data['loop_verts'] = loop_verts
+    mesh_data['dataname'] = dataname
+    return mesh_data
+
+
+def create_mesh_fast(mesh_data):
+    """
+    Create the mesh of the data returned by read_fast, with one foreach_set
+    call per attribute
+    """
+    loop_totals = mesh_data['loop_totals']
+    loop_verts = mesh_data['loop_verts']
+
+    me = bpy.data.meshes.new(mesh_data['dataname'])
+
+    me.vertices.add(len(mesh_data['positions']))
+    me.loops.add(len(loop_verts))
+    me.polygons.add(len(loop_totals))
+
+    me.vertices.foreach_set("co", mesh_data['positions'].ravel())
+    me.loops.foreach_set("vertex_index", loop_verts)
+    me.polygons.foreach_set("loop_start", (np.cumsum(loop_totals) - loop_totals).astype(np.int32))
+    me.polygons.foreach_set("loop_total", loop_totals)
+    me.polygons.foreach_set("use_smooth", np.zeros(len(loop_totals), dtype=bool))
+
+    use_normals = 'loop_normals' in mesh_data
+    if use_normals:
+        # Same as create_mesh: custom normals can only be set after validate()
+        me.create_normals_split()
+        me.loops.foreach_set("normal", mesh_data['loop_normals'].ravel())
+
+    if 'loop_uvs' in mesh_data:
+        me.uv_layers.new(do_init=False)
+        me.uv_layers[0].data.foreach_set("uv", mesh_data['loop_uvs'].ravel())
+
+    me.validate(clean_customdata=False)  # *Very* important to not remove lnors here!
+    me.update(calc_edges=False, calc_edges_loose=False)
+
+    if use_normals:
+        clnors = np.empty(len(me.loops) * 3, dtype=np.float32)
+        me.loops.foreach_get("normal", clnors)
+        me.polygons.foreach_set("use_smooth", np.ones(len(me.polygons), dtype=bool))
+        me.normals_split_custom_set(clnors.reshape(-1, 3))
+        me.use_auto_smooth = True
+
+    return me
+
+
 def load(filepath,
          *,
          use_smooth_groups=True,
@@ -388,12 +648,14 @@ def load(filepath,
          use_split_objects=True,
          use_split_groups=False,
          use_groups_as_vgroups=False,
+         use_fast_path=True,
          ):
     """
     Called by the user interface or another script.
     load_obj(path) - should give acceptable results.
     This function passes the file and sends the data off
         to be split into objects and then converted into mesh objects
+    use_fast_path: try read_fast first, set to False when it already failed on this file
     """
     def unique_name(existing_names, name_orig):
         i = 0
@@ -429,6 +691,18 @@ def load(filepath,
             [],  # If non-empty, that face is a Blender-invalid ngon (holes...), need a mutable object for that...
         )
 
+    mesh_data = None
+    if use_fast_path:
+        mesh_data = read_fast(filepath,
+                              use_smooth_groups=use_smooth_groups,
+                              use_edges=use_edges,
+                              use_split_objects=use_split_objects,
+                              use_split_groups=use_split_groups,
+                              use_groups_as_vgroups=use_groups_as_vgroups,
+                              )
+    if mesh_data is not None:
+        return [create_mesh_fast(mesh_data)]
+
     if use_split_objects or use_split_groups:
         use_groups_as_vgroups = False
 
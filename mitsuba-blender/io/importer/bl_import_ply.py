@@ -18,6 +18,8 @@
 
 # <pep8 compliant>
 
+import numpy as np
+
 
 class ElementSpec:
     __slots__ = (
@@ -42,6 +44,56 @@ class ElementSpec:
                 return i
         return -1
 
+    def load_array(self, format, stream, offset, file_size):
+        """
+        Read all the items of this element from a binary file with a single
+        NumPy call, as a structured array with one field per property.
+
+        This requires a fixed item size: list properties must have the same
+        length in all items (e.g. a triangle-only face list). Their lengths
+        are read from the first item and checked on all of them.
+
+        Returns the array and the offset of the next element in the file, or
+        (None, None) if the element cannot be read this way.
+        """
+        fields = []
+        record_size = 0
+        for prop in self.properties:
+            if prop.numeric_type == 's' or prop.list_type == 's':
+                return None, None
+            name = prop.name.decode('latin-1')
+            if prop.list_type is None:
+                fields.append((name, format + prop.numeric_type))
+            else:
+                # Peek at the length of the list in the first item
+                count_dtype = np.dtype(format + prop.list_type)
+                if self.count == 0 or offset + record_size + count_dtype.itemsize > file_size:
+                    return None, None
+                stream.seek(offset + record_size)
+                length = int(np.frombuffer(stream.read(count_dtype.itemsize), count_dtype)[0])
+                fields.append((name + '\0count', count_dtype))
+                fields.append((name, format + prop.numeric_type, (length,)))
+            record_size = np.dtype(fields).itemsize
+
+        dtype = np.dtype(fields)
+        end = offset + self.count * dtype.itemsize
+        if end > file_size:
+            return None, None
+        if self.count * dtype.itemsize >= _memmap_threshold:
+            # Large elements are paged in from the file when they are used
+            data = np.memmap(stream.name, dtype=dtype, mode='r', offset=offset, shape=(self.count,))
+        else:
+            stream.seek(offset)
+            data = np.frombuffer(stream.read(self.count * dtype.itemsize), dtype=dtype)
+
+        for prop in self.properties:
+            if prop.list_type is not None:
+                name = prop.name.decode('latin-1')
+                if not (data[name + '\0count'] == data.dtype[name].shape[0]).all():
+                    # Lists of different lengths, e.g. triangles and quads
+                    return None, None
+        return data[[prop.name.decode('latin-1') for prop in self.properties]], end
+
 
 class PropertySpec:
     __slots__ = (
@@ -117,8 +169,42 @@ class ObjectSpec:
             for i in self.specs
         }
 
-
-def read(filepath):
+    def load_arrays(self, format, stream):
+        """
+        Fast path for binary files: read each element as a NumPy structured
+        array (see ElementSpec.load_array). Returns None if one of the
+        elements cannot be read this way, the stream is then back at the
+        start of the data.
+        """
+        import os
+
+        start = stream.tell()
+        file_size = os.fstat(stream.fileno()).st_size
+        offset = start
+        arrays = {}
+        for spec in self.specs:
+            array, offset = spec.load_array(format, stream, offset, file_size)
+            if array is None:
+                stream.seek(start)
+                return None
+            arrays[spec.name] = array
+        return arrays
+
+
+# Elements larger than this are memory-mapped instead of read in memory
+_memmap_threshold = 1 << 28
+
+
+def read_arrays(filepath):
+    """
+    Read a PLY file, returns the (ObjectSpec, data, texture) tuple.
+
+    Binary files with a fixed item size in each element are read with one
+    NumPy call per element, data then contains a structured array per
+    element, with one field per property. Other files (ASCII, polygons of
+    various sizes...) are read with the generic reader, and data contains
+    lists of rows instead.
+    """
     import re
 
     format = b''
@@ -244,162 +330,176 @@ def read(filepath):
             print("Invalid header ('end_header' line not found!)")
             return invalid_ply
 
-        obj = obj_spec.load(format_specs[format], plyf)
+        obj = None
+        if format != b'ascii':
+            obj = obj_spec.load_arrays(format_specs[format], plyf)
+        if obj is None:
+            obj = obj_spec.load(format_specs[format], plyf)
 
     return obj_spec, obj, texture
 
 
-def load_ply_mesh(filepath, ply_name):
-    import bpy
-
-    obj_spec, obj, texture = read(filepath)
+def _columns(spec, data):
+    """
+    Return the values of each property of an element, by property name:
+    1D arrays for scalar properties, (counts, flat values) tuples for lists.
+    'data' is the structured array or the rows of the element returned by read_arrays.
+    """
+    from itertools import chain
+
+    columns = {}
+    for i, prop in enumerate(spec.properties):
+        if not isinstance(data, list):
+            values = data[prop.name.decode('latin-1')]
+            if prop.list_type is None:
+                columns[prop.name] = np.asarray(values)
+            else:
+                values = np.asarray(values)
+                columns[prop.name] = (np.full(len(values), values.shape[1], dtype=np.int32), values.ravel())
+        elif prop.list_type is None:
+            columns[prop.name] = np.array([row[i] for row in data])
+        else:
+            counts = np.fromiter((len(row[i]) for row in data), dtype=np.int32, count=len(data))
+            values = np.fromiter(chain.from_iterable(row[i] for row in data), dtype=np.int64, count=int(counts.sum()))
+            columns[prop.name] = (counts, values)
+    return columns
+
+
+def _strips_to_triangles(counts, indices):
+    """
+    Convert triangle strips to triangles, as (counts, flat indices)
+    """
+
+    triangles = []
+    starts = np.cumsum(counts) - counts
+    for start, count in zip(starts.tolist(), counts.tolist()):
+        if count < 3:
+            continue
+        first = start + np.arange(count - 2)
+        triangles.append(np.stack((indices[first], indices[first + 1], indices[first + 2]), axis=1).ravel())
+    if not triangles:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+    indices = np.concatenate(triangles)
+    return np.full(len(indices) // 3, 3, dtype=np.int32), indices
+
+
+def _fix_face_order(counts, indices):
+    """
+    Rotate the triangles and quads whose third or fourth vertex is the
+    vertex 0, in place (EVIL EEKADOODLE - face order annoyance).
+    """
+    starts = np.cumsum(counts) - counts
+    # Fancy indexing copies, the right-hand sides are read before any assignment
+    tris = starts[counts == 3]
+    tris = tris[indices[tris + 2] == 0]
+    indices[tris], indices[tris + 1], indices[tris + 2] = indices[tris + 1], indices[tris + 2], indices[tris]
+    quads = starts[counts == 4]
+    quads = quads[(indices[quads + 2] == 0) | (indices[quads + 3] == 0)]
+    indices[quads], indices[quads + 1], indices[quads + 2], indices[quads + 3] = \
+        indices[quads + 2], indices[quads + 3], indices[quads], indices[quads + 1]
+
+
+def read_mesh(filepath):
+    """
+    Read the mesh data of a PLY file in flat NumPy arrays: float32 'positions'
+    (N, 3), face 'loop_totals' and 'loop_verts', and optional per-vertex 'uvs'
+    and 'colors' (RGBA), and 'edges'. Returns None if the file is invalid.
+    """
+    obj_spec, obj, texture = read_arrays(filepath)
     # XXX28: use texture
     if obj is None:
-        print("Invalid file")
-        return
+        return None
+
+    mesh = {}
+    face_data = []
+    for spec in obj_spec.specs:
+        columns = _columns(spec, obj[spec.name])
+        if spec.name == b'vertex':
+            mesh['positions'] = np.stack([columns[b'x'], columns[b'y'], columns[b'z']], axis=1).astype(np.float32)
+            # TODO import normals
+            for u, v in ((b's', b't'), (b'u', b'v')):
+                if u in columns and v in columns:
+                    mesh['uvs'] = np.stack([columns[u], columns[v]], axis=1).astype(np.float32)
+                    break
+            channels = [b'red', b'green', b'blue']
+            if b'alpha' in columns:
+                channels.append(b'alpha')
+            if all(c in columns for c in channels):
+                colors = np.ones((len(mesh['positions']), 4), dtype=np.float32)
+                for i, c in enumerate(channels):
+                    # if not a float assume uchar
+                    scale = 1.0 if columns[c].dtype.kind == 'f' else 1.0 / 255.0
+                    colors[:, i] = columns[c] * scale
+                mesh['colors'] = colors
+            elif any(c in columns for c in channels):
+                print("Warning: At least one obligatory color channel is missing, ignoring vertex colors.")
+        elif spec.name == b'face' and b'vertex_indices' in columns:
+            face_data.append(columns[b'vertex_indices'])
+        elif spec.name == b'tristrips' and b'vertex_indices' in columns:
+            face_data.append(_strips_to_triangles(*columns[b'vertex_indices']))
+        elif spec.name == b'edge' and b'vertex1' in columns and b'vertex2' in columns:
+            mesh['edges'] = np.stack([columns[b'vertex1'], columns[b'vertex2']], axis=1).astype(np.int32)
+
+    if 'positions' not in mesh:
+        return None
+    if face_data:
+        counts = np.concatenate([counts for counts, _ in face_data]).astype(np.int32)
+        indices = np.concatenate([indices for _, indices in face_data]).astype(np.int32)
+        if 'uvs' in mesh or 'colors' in mesh:
+            # If we have Cols or UVs then we need to check the face order.
+            _fix_face_order(counts, indices)
+        mesh['loop_totals'] = counts
+        mesh['loop_verts'] = indices
+    return mesh
 
-    uvindices = colindices = None
-    colmultiply = None
-
-    # TODO import normals
-    # noindices = None
-
-    for el in obj_spec.specs:
-        if el.name == b'vertex':
-            vindices_x, vindices_y, vindices_z = el.index(b'x'), el.index(b'y'), el.index(b'z')
-            # noindices = (el.index('nx'), el.index('ny'), el.index('nz'))
-            # if -1 in noindices: noindices = None
-            uvindices = (el.index(b's'), el.index(b't'))
-            if -1 in uvindices:
-                uvindices = (el.index(b'u'), el.index(b'v'))
-                if -1 in uvindices:
-                    uvindices = None
-            # ignore alpha if not present
-            if el.index(b'alpha') == -1:
-                colindices = el.index(b'red'), el.index(b'green'), el.index(b'blue')
-            else:
-                colindices = el.index(b'red'), el.index(b'green'), el.index(b'blue'), el.index(b'alpha')
-            if -1 in colindices:
-                if any(idx > -1 for idx in colindices):
-                    print("Warning: At least one obligatory color channel is missing, ignoring vertex colors.")
-                colindices = None
-            else:  # if not a float assume uchar
-                colmultiply = [1.0 if el.properties[i].numeric_type in {'f', 'd'} else (1.0 / 255.0) for i in colindices]
-
-        elif el.name == b'face':
-            findex = el.index(b'vertex_indices')
-        elif el.name == b'tristrips':
-            trindex = el.index(b'vertex_indices')
-        elif el.name == b'edge':
-            eindex1, eindex2 = el.index(b'vertex1'), el.index(b'vertex2')
-
-    mesh_faces = []
-    mesh_uvs = []
-    mesh_colors = []
-
-    def add_face(vertices, indices, uvindices, colindices):
-        mesh_faces.append(indices)
-        if uvindices:
-            mesh_uvs.extend([(vertices[index][uvindices[0]], vertices[index][uvindices[1]]) for index in indices])
-        if colindices:
-            if len(colindices) == 3:
-                mesh_colors.extend([
-                    (
-                        vertices[index][colindices[0]] * colmultiply[0],
-                        vertices[index][colindices[1]] * colmultiply[1],
-                        vertices[index][colindices[2]] * colmultiply[2],
-                        1.0,
-                    )
-                    for index in indices
-                ])
-            elif len(colindices) == 4:
-                mesh_colors.extend([
-                    (
-                        vertices[index][colindices[0]] * colmultiply[0],
-                        vertices[index][colindices[1]] * colmultiply[1],
-                        vertices[index][colindices[2]] * colmultiply[2],
-                        vertices[index][colindices[3]] * colmultiply[3],
-                    )
-                    for index in indices
-                ])
-
-    if uvindices or colindices:
-        # If we have Cols or UVs then we need to check the face order.
-        add_face_simple = add_face
-
-        # EVIL EEKADOODLE - face order annoyance.
-        def add_face(vertices, indices, uvindices, colindices):
-            if len(indices) == 4:
-                if indices[2] == 0 or indices[3] == 0:
-                    indices = indices[2], indices[3], indices[0], indices[1]
-            elif len(indices) == 3:
-                if indices[2] == 0:
-                    indices = indices[1], indices[2], indices[0]
-
-            add_face_simple(vertices, indices, uvindices, colindices)
-
-    verts = obj[b'vertex']
-
-    if b'face' in obj:
-        for f in obj[b'face']:
-            ind = f[findex]
-            add_face(verts, ind, uvindices, colindices)
-
-    if b'tristrips' in obj:
-        for t in obj[b'tristrips']:
-            ind = t[trindex]
-            len_ind = len(ind)
-            for j in range(len_ind - 2):
-                add_face(verts, (ind[j], ind[j + 1], ind[j + 2]), uvindices, colindices)
-
-    mesh = bpy.data.meshes.new(name=ply_name)
-
-    mesh.vertices.add(len(obj[b'vertex']))
-
-    mesh.vertices.foreach_set("co", [a for v in obj[b'vertex'] for a in (v[vindices_x], v[vindices_y], v[vindices_z])])
-
-    if b'edge' in obj:
-        mesh.edges.add(len(obj[b'edge']))
-        mesh.edges.foreach_set("vertices", [a for e in obj[b'edge'] for a in (e[eindex1], e[eindex2])])
-
-    if mesh_faces:
-        loops_vert_idx = []
-        faces_loop_start = []
-        faces_loop_total = []
-        lidx = 0
-        for f in mesh_faces:
-            nbr_vidx = len(f)
-            loops_vert_idx.extend(f)
-            faces_loop_start.append(lidx)
-            faces_loop_total.append(nbr_vidx)
-            lidx += nbr_vidx
-
-        mesh.loops.add(len(loops_vert_idx))
-        mesh.polygons.add(len(mesh_faces))
-
-        mesh.loops.foreach_set("vertex_index", loops_vert_idx)
-        mesh.polygons.foreach_set("loop_start", faces_loop_start)
-        mesh.polygons.foreach_set("loop_total", faces_loop_total)
-
-        if uvindices:
+
+def create_mesh(name, mesh_data):
+    """
+    Create a Blender mesh from the arrays returned by read_mesh, with one
+    foreach_set call per attribute.
+    """
+    import bpy
+
+    positions = mesh_data['positions']
+    mesh = bpy.data.meshes.new(name=name)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", positions.ravel())
+
+    if 'edges' in mesh_data:
+        mesh.edges.add(len(mesh_data['edges']))
+        mesh.edges.foreach_set("vertices", mesh_data['edges'].ravel())
+
+    if 'loop_totals' in mesh_data and len(mesh_data['loop_totals']):
+        loop_totals = mesh_data['loop_totals']
+        loop_verts = mesh_data['loop_verts']
+        loop_starts = (np.cumsum(loop_totals) - loop_totals).astype(np.int32)
+
+        mesh.loops.add(len(loop_verts))
+        mesh.polygons.add(len(loop_totals))
+        mesh.loops.foreach_set("vertex_index", loop_verts)
+        mesh.polygons.foreach_set("loop_start", loop_starts)
+        mesh.polygons.foreach_set("loop_total", loop_totals)
+
+        # Per-vertex attributes are stored per loop in Blender
+        if 'uvs' in mesh_data:
             uv_layer = mesh.uv_layers.new()
-            for i, uv in enumerate(uv_layer.data):
-                uv.uv = mesh_uvs[i]
+            uv_layer.data.foreach_set("uv", mesh_data['uvs'][loop_verts].ravel())
 
-        if colindices:
+        if 'colors' in mesh_data:
             vcol_lay = mesh.vertex_colors.new()
-
-            for i, col in enumerate(vcol_lay.data):
-                col.color[0] = mesh_colors[i][0]
-                col.color[1] = mesh_colors[i][1]
-                col.color[2] = mesh_colors[i][2]
-                col.color[3] = mesh_colors[i][3]
+            vcol_lay.data.foreach_set("color", mesh_data['colors'][loop_verts].ravel())
 
     mesh.update()
     mesh.validate()
 
-    if texture and uvindices:
-        # TODO add support for using texture.
-        pass
-
     return mesh
+
+
+def load_ply_mesh(filepath, ply_name):
+    mesh_data = read_mesh(filepath)
+    if mesh_data is None:
+        print("Invalid file")
+        return
+
+    # TODO add support for using texture.
+    return create_mesh(ply_name, mesh_data)
@@ -0,0 +1,139 @@
+'''
+Reader of Mitsuba's .serialized mesh files.
+
+A file is read once, and each of its shapes is decompressed when it is
+requested, so that scenes referencing many shapes of the same file do not
+open and parse it again for each of them. Meshes are built from the decoded
+arrays with foreach_set.
+'''
+
+import zlib
+import numpy as np
+
+FORMAT_ID = 0x041C
+
+# Shape flags
+HAS_NORMALS = 0x0001
+HAS_TEXCOORDS = 0x0002
+HAS_COLORS = 0x0008
+FACE_NORMALS = 0x0010
+SINGLE_PRECISION = 0x1000
+DOUBLE_PRECISION = 0x2000
+
+class SerializedFile:
+    '''
+    The content of a .serialized file and its table of shapes.
+
+    filepath: Path of the file
+    '''
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self.data = f.read()
+        if len(self.data) < 8:
+            raise ValueError(f'"{filepath}" is not a serialized mesh file')
+        format_id, self.version = np.frombuffer(self.data, dtype='<u2', count=2)
+        if format_id != FORMAT_ID or self.version not in (3, 4):
+            raise ValueError(f'"{filepath}" is not a serialized mesh file (version 3 or 4)')
+        shape_count = int(np.frombuffer(self.data, dtype='<u4', count=1, offset=len(self.data) - 4)[0])
+        # Version 4 stores 64 bit offsets, version 3 32 bit ones
+        offset_dtype = np.dtype('<u8' if self.version == 4 else '<u4')
+        table_start = len(self.data) - 4 - shape_count * offset_dtype.itemsize
+        if shape_count == 0 or table_start < 4:
+            raise ValueError(f'"{filepath}" has an invalid table of shapes')
+        self.offsets = np.frombuffer(self.data, dtype=offset_dtype, count=shape_count, offset=table_start).tolist()
+        self.ends = self.offsets[1:] + [table_start]
+        if any(not 0 <= start < end <= table_start for start, end in zip(self.offsets, self.ends)):
+            raise ValueError(f'"{filepath}" has an invalid table of shapes')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def shape(self, index):
+        '''
+        Decode a shape of the file.
+
+        Returns a dict with its 'name' (None before version 4), 'face_normals'
+        flag, float32 'positions', optional 'normals', 'uvs' and 'colors'
+        arrays, and int32 'faces' array.
+        '''
+        if not 0 <= index < len(self.offsets):
+            raise IndexError(f'"{self.filepath}" has no shape {index}')
+        start, end = self.offsets[index], self.ends[index]
+        if end - start < 4:
+            raise ValueError(f'Invalid shape {index} in "{self.filepath}"')
+        format_id, version = np.frombuffer(self.data, dtype='<u2', count=2, offset=start)
+        if format_id != FORMAT_ID:
+            raise ValueError(f'Invalid shape {index} in "{self.filepath}"')
+        data = zlib.decompress(self.data[start + 4:end])
+
+        flags = int(np.frombuffer(data, dtype='<u4', count=1)[0])
+        offset = 4
+        name = None
+        if version == 4:
+            name_end = data.index(b'\0', offset)
+            name = data[offset:name_end].decode('utf-8', 'replace')
+            offset = name_end + 1
+        vertex_count, face_count = np.frombuffer(data, dtype='<u8', count=2, offset=offset).tolist()
+        offset += 16
+
+        float_dtype = np.dtype('<f8' if flags & DOUBLE_PRECISION else '<f4')
+        index_dtype = np.dtype('<u8' if vertex_count > 0xFFFFFFFF else '<u4')
+
+        def read(dtype, count, width):
+            nonlocal offset
+            array = np.frombuffer(data, dtype=dtype, count=count * width, offset=offset).reshape(count, width)
+            offset += array.nbytes
+            return array
+
+        shape = {'name': name, 'face_normals': bool(flags & FACE_NORMALS)}
+        shape['positions'] = read(float_dtype, vertex_count, 3).astype(np.float32)
+        if flags & HAS_NORMALS:
+            shape['normals'] = read(float_dtype, vertex_count, 3).astype(np.float32)
+        if flags & HAS_TEXCOORDS:
+            shape['uvs'] = read(float_dtype, vertex_count, 2).astype(np.float32)
+        if flags & HAS_COLORS:
+            shape['colors'] = read(float_dtype, vertex_count, 3).astype(np.float32)
+        shape['faces'] = read(index_dtype, face_count, 3).astype(np.int32)
+        return shape
+
+def create_mesh(name, shape):
+    '''
+    Create a Blender mesh from a shape decoded by SerializedFile.shape
+    '''
+    import bpy
+
+    positions = shape['positions']
+    faces = shape['faces']
+    loop_verts = faces.ravel()
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(positions))
+    mesh.loops.add(len(loop_verts))
+    mesh.polygons.add(len(faces))
+
+    mesh.vertices.foreach_set('co', positions.ravel())
+    mesh.loops.foreach_set('vertex_index', loop_verts)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, len(loop_verts), 3, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_total', np.full(len(faces), 3, dtype=np.int32))
+
+    # Per-vertex attributes are stored per loop in Blender
+    if 'uvs' in shape:
+        uv_layer = mesh.uv_layers.new()
+        uv_layer.data.foreach_set('uv', shape['uvs'][loop_verts].ravel())
+    if 'colors' in shape:
+        colors = np.ones((len(loop_verts), 4), dtype=np.float32)
+        colors[:, :3] = shape['colors'][loop_verts]
+        color_layer = mesh.vertex_colors.new()
+        color_layer.data.foreach_set('color', colors.ravel())
+
+    mesh.validate()
+    mesh.update()
+
+    use_normals = 'normals' in shape and not shape['face_normals']
+    mesh.polygons.foreach_set('use_smooth', np.full(len(mesh.polygons), use_normals, dtype=bool))
+    if use_normals:
+        mesh.normals_split_custom_set_from_vertices(shape['normals'])
+        mesh.use_auto_smooth = True
+
+    return mesh
@@ -2,6 +2,8 @@ from enum import Enum
 from collections import OrderedDict
 import os
 
+from .loader import GeometryLoader
+
 class BlenderNodeType(Enum):
     NONE = 0,
     SCENE = 1,
@@ -212,6 +214,7 @@ class MitsubaSceneImportContext:
         self.axis_matrix_inv = axis_matrix.inverted()
         self.bl_material_cache = {}
         self.bl_image_cache = {}
+        self.geometry_loader = GeometryLoader()
 
     def log(self, message, level='INFO'):
         '''
@@ -0,0 +1,99 @@
+'''
+Concurrent decoding of the mesh files of a scene being imported.
+
+Blender data can only be created on the main thread, but reading and decoding
+mesh files into NumPy arrays does not need Blender. The files of all the
+shapes of the scene are queued before the scene is converted, and decoded in a
+pool of threads while the main thread creates the Blender meshes from the
+arrays already decoded. File reads, zlib and most NumPy operations release
+the GIL.
+
+Only a bounded number of files are decoded ahead of the conversion, so that
+the decoded arrays of the whole scene are never held in memory at once.
+'''
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import bl_import_serialized
+
+class GeometryLoader:
+    '''
+    Pool of threads decoding mesh files, in the order they were queued.
+
+    max_workers: Number of decoding threads
+    max_ahead: Number of results decoded ahead of their use
+    '''
+    def __init__(self, max_workers=None, max_ahead=None):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.max_ahead = max_ahead or 4 * self.max_workers
+        self.executor = None
+        self.jobs = OrderedDict()
+        self.futures = {}
+        self.serialized_files = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, job, *args):
+        '''
+        Queue job(*args), its result is retrieved with load(key)
+        '''
+        self.jobs[key] = (job, args)
+
+    def start(self):
+        '''
+        Start decoding the queued jobs in the background
+        '''
+        if self.executor is None and self.jobs:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self.submit()
+
+    def submit(self):
+        while self.jobs and len(self.futures) < self.max_ahead:
+            key, (job, args) = self.jobs.popitem(last=False)
+            self.futures[key] = self.executor.submit(job, *args)
+
+    def load(self, key, job, *args):
+        '''
+        Get the result of the job queued for 'key', waiting for it if needed.
+        If nothing was queued for 'key', job(*args) is run now.
+        Errors of the job are raised here.
+        '''
+        future = self.futures.pop(key, None)
+        if future is None:
+            job, args = self.jobs.pop(key, (job, args))
+        try:
+            return future.result() if future is not None else job(*args)
+        finally:
+            if self.executor is not None:
+                self.submit()
+
+    def serialized_file(self, filepath):
+        '''
+        Get the content of a .serialized file, read once for all its shapes.
+        May be called from several threads.
+        '''
+        with self.lock:
+            future = self.serialized_files.get(filepath)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.serialized_files[filepath] = future
+        if owner:
+            try:
+                future.set_result(bl_import_serialized.SerializedFile(filepath))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def close(self):
+        '''
+        Cancel the jobs that were not used, and release the files read
+        '''
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.jobs.clear()
+        self.futures.clear()
+        self.serialized_files.clear()
@@ -1,4 +1,6 @@
+import os
 import time
+import zlib
 
 if "bpy" in locals():
     import importlib
@@ -8,6 +10,8 @@ if "bpy" in locals():
         importlib.reload(bl_import_ply)
     if "bl_import_obj" in locals():
         importlib.reload(bl_import_obj)
+    if "bl_import_serialized" in locals():
+        importlib.reload(bl_import_serialized)
 
 import bpy
 import bmesh
@@ -17,6 +21,7 @@ import numpy as np
 from . import bl_transform_utils
 from . import bl_import_ply
 from . import bl_import_obj
+from . import bl_import_serialized
 
 ######################
 ##    Utilities     ##
@@ -42,6 +47,27 @@ def _set_bl_mesh_shading(bl_mesh, flat_shading=True, flip_normals=False):
         bl_mesh.flip_normals()
     bl_mesh.update()
 
+def _read_serialized_shape(loader, abs_path, shape_index):
+    return loader.serialized_file(abs_path).shape(shape_index)
+
+def _geometry_job(mi_context, mi_shape, abs_path):
+    ''' Get the function decoding the mesh file of a shape into arrays, and its arguments.
+    It does not use Blender, and can run on another thread.
+    '''
+    shape_type = mi_shape.plugin_name()
+    if shape_type == 'ply':
+        return bl_import_ply.read_mesh, (abs_path,)
+    if shape_type == 'obj':
+        return bl_import_obj.read_fast, (abs_path,)
+    if shape_type == 'serialized':
+        return _read_serialized_shape, (mi_context.geometry_loader, abs_path, mi_shape.get('shape_index', 0))
+    return None, None
+
+def _load_geometry(mi_context, mi_shape, abs_path):
+    ''' Get the decoded mesh file of a shape, decoded in the background if it was queued '''
+    job, args = _geometry_job(mi_context, mi_shape, abs_path)
+    return mi_context.geometry_loader.load(mi_shape.id(), job, *args)
+
 ######################
 ##    Converters    ##
 ######################
@@ -53,7 +79,8 @@ def mi_ply_to_bl_shape(mi_context, mi_shape):
     abs_path = mi_context.resolve_scene_relative_path(filename)
 
     # Load .PLY mesh from file
-    bl_mesh = bl_import_ply.load_ply_mesh(abs_path, mi_shape.id())
+    mesh_data = _load_geometry(mi_context, mi_shape, abs_path)
+    bl_mesh = bl_import_ply.create_mesh(mi_shape.id(), mesh_data) if mesh_data is not None else None
     if not bl_mesh:
         mi_context.log(f'Cannot load PLY mesh file "{filename}".', 'ERROR')
         return None
@@ -73,8 +100,12 @@ def mi_obj_to_bl_shape(mi_context, mi_shape):
     filename = mi_shape.get('filename')
     abs_path = mi_context.resolve_scene_relative_path(filename)
 
-    # Load the mesh from the file
-    bl_meshes = bl_import_obj.load(abs_path)
+    # Load the mesh from the file, with the full parser if the fast path cannot read it
+    mesh_data = _load_geometry(mi_context, mi_shape, abs_path)
+    if mesh_data is not None:
+        bl_meshes = [bl_import_obj.create_mesh_fast(mesh_data)]
+    else:
+        bl_meshes = bl_import_obj.load(abs_path, use_fast_path=False)
     # FIXME: Handle multiple objects if supported by Mistuba.
     if len(bl_meshes) > 1:
         mi_context.log('OBJ file containing more than one mesh. Only the first one will be loaded.', 'WARN')
@@ -165,47 +196,26 @@ def mi_cube_to_bl_shape(mi_context, mi_shape):
     return bl_mesh, mi_context.mi_space_to_bl_space(world_matrix)
 
 def mi_serialized_to_bl_shape(mi_context, mi_shape):
-    import mitsuba as mi
-    from mitsuba.python import traverse
     start_time = time.time()
 
-    # only safe way is to create a shape using mitsuba
     assert mi_shape.has_property('filename')
 
     filename = mi_shape.get('filename')
     abs_path = mi_context.resolve_scene_relative_path(filename)
+    if abs_path is None:
+        return None
 
-    # no need to parse the trafo as this is taken care of after the mesh is loaded
-    mi_shape_dict = {
-        "type": mi_shape.plugin_name(),
-        "filename": abs_path,
-        "shape_index": mi_shape.get('shape_index')
-    }
-
-    mi_shape_inst = mi.load_dict(mi_shape_dict)
-    params = traverse(mi_shape_inst)
-    vert_count = params["vertex_count"]
-    face_count = params["face_count"]
-    verts = np.array(params["vertex_positions"])
-    faces = np.array(params["faces"])
+    # All the shapes of a file are read from the same copy of it. Truncated or
+    # corrupt files fail with IndexError (missing shape) or zlib.error.
+    try:
+        shape = _load_geometry(mi_context, mi_shape, abs_path)
+    except (OSError, ValueError, IndexError, zlib.error) as e:
+        mi_context.log(f'Cannot load serialized mesh file "{filename}": {e}', 'ERROR')
+        return None
+    if mi_shape.get('face_normals', False):
+        shape['face_normals'] = True
+    bl_mesh = bl_import_serialized.create_mesh(mi_shape.id(), shape)
 
-    bl_mesh = bpy.data.meshes.new(mi_shape.id())
-    
-    # https://docs.blender.org/api/current/bpy.types.Mesh.html#bpy.types.Mesh.from_pydata
-    verts = verts.reshape((vert_count, 3))
-    faces = faces.reshape((face_count, 3))
-    verts_pydata = []
-    for i in range(vert_count):
-        verts_pydata.append(tuple(verts[i]))
-    face_pydata = []
-    for i in range(face_count):
-        face_pydata.append(tuple(faces[i]))
-
-    # When an empty iterable is passed in, the edges are inferred from the polygons
-    edges = []
-    bl_mesh.from_pydata(verts_pydata, edges, face_pydata)
-    bl_mesh.calc_normals()
-    
     end_time = time.time()
     mi_context.log(f'Loaded serialized mesh "{mi_shape.id()}". Took {end_time-start_time:.2f}s.', 'INFO')
 
@@ -227,6 +237,23 @@ _shape_converters = {
     "serialized": mi_serialized_to_bl_shape
 }
 
+def queue_shape_geometry(mi_context):
+    ''' Queue the decoding of the mesh files of all the shapes of the scene,
+    in the order of the scene properties, and start decoding them in the background.
+    '''
+    for cls, mi_shape in mi_context.mi_scene_props:
+        if cls != 'Shape' or mi_shape.plugin_name() not in ('ply', 'obj', 'serialized'):
+            continue
+        if not mi_shape.has_property('filename'):
+            continue
+        # Missing files are reported when the shape is converted
+        abs_path = os.path.join(mi_context.directory, mi_shape.get('filename'))
+        if not os.path.exists(abs_path):
+            continue
+        job, args = _geometry_job(mi_context, mi_shape, abs_path)
+        mi_context.geometry_loader.add(mi_shape.id(), job, *args)
+    mi_context.geometry_loader.start()
+
 def mi_shape_to_bl_shape(mi_context, mi_shape):
     shape_type = mi_shape.plugin_name()
     if shape_type not in _shape_converters:
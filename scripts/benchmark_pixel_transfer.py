@@ -0,0 +1,98 @@
+'''
+Micro-benchmark of the copy of Mitsuba bitmaps into Blender render passes.
+
+Compares the former readback (np.array + np.dstack + np.flip per pass) with
+the preallocated buffers used by MitsubaRenderEngine.write_results. Blender
+is not needed: the render passes are replaced by flat float32 arrays, the
+final copy into Blender's memory being the same for both methods.
+
+Usage: python scripts/benchmark_pixel_transfer.py [--width W] [--height H]
+'''
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+def make_frame(width, height, aov_count):
+    '''
+    Split bitmaps of a frame: RGB, 2-channel and single-channel AOVs,
+    stored as float32 like Mitsuba's film.
+    '''
+    frame = [('<root>', 3)] + [(f'aov_{i}', (3, 2, 1)[i % 3]) for i in range(aov_count)]
+    return [(name, np.random.rand(height, width, channels).astype(np.float32)) for name, channels in frame]
+
+def pass_channels(channels):
+    # Same as MitsubaRenderEngine.add_passes, with an alpha channel for the combined pass
+    return 4 if channels == 3 else (3 if channels == 2 else channels)
+
+class CopyCounter:
+    def __init__(self):
+        self.bytes = 0
+
+    def __call__(self, array):
+        self.bytes += array.nbytes
+        return array
+
+def write_results_old(frame, rects, count):
+    for name, bitmap in frame:
+        width, height = bitmap.shape[1], bitmap.shape[0]
+        render_pixels = count(np.array(bitmap))
+        if bitmap.shape[2] == 2:
+            render_pixels = count(np.dstack((render_pixels, np.zeros((*render_pixels.shape[:2], 1)))))
+        render_pixels = count(np.dstack((render_pixels, np.zeros((*render_pixels.shape[:2], 1)))))
+        tmp = count(np.flip(render_pixels, 0).reshape((width * height, -1)))
+        # layer.rect = tmp
+        rect = rects[name]
+        rect[:] = count(tmp[:, :rect.size // (width * height)]).ravel()
+
+def write_results_new(frame, rects, buffers, count):
+    for name, bitmap in frame:
+        height, width = bitmap.shape[:2]
+        rect = rects[name]
+        buffer = buffers.get(name)
+        if buffer is None:
+            buffer = buffers[name] = np.zeros((height, width, rect.size // (width * height)), dtype=np.float32)
+        pixels = np.asarray(bitmap)
+        channel_count = min(pixels.shape[2], buffer.shape[2])
+        np.copyto(buffer[::-1, :, :channel_count], pixels[:, :, :channel_count], casting='unsafe')
+        count(buffer[:, :, :channel_count])
+        # layer.rect.foreach_set(buffer.ravel())
+        rect[:] = count(buffer).ravel()
+
+def measure(method, repeat):
+    count = CopyCounter()
+    method(count)
+    copied = count.bytes
+    tracemalloc.start()
+    method(CopyCounter())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        method(CopyCounter())
+    elapsed = (time.perf_counter() - start) / repeat
+    return copied, peak, elapsed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--aovs', type=int, default=12, help='Number of AOVs in addition to the combined pass')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    frame = make_frame(args.width, args.height, args.aovs)
+    rects = {name: np.empty(args.width * args.height * pass_channels(bitmap.shape[2]), dtype=np.float32)
+             for name, bitmap in frame}
+    buffers = {}
+
+    methods = {
+        'before': lambda count: write_results_old(frame, rects, count),
+        'after': lambda count: write_results_new(frame, rects, buffers, count),
+    }
+    print(f'{args.width}x{args.height}, {len(frame)} passes per frame')
+    for label, method in methods.items():
+        copied, peak, elapsed = measure(method, args.repeat)
+        print(f'{label:>6}: {copied / 2**20:9.1f} MiB copied, '
+              f'{peak / 2**20:9.1f} MiB peak temporary memory, {elapsed * 1e3:8.1f} ms per frame')
@@ -0,0 +1,169 @@
+'''
+Benchmark of the PLY importer on a large triangle mesh.
+
+Writes a grid with UVs (2 (N-1)^2 triangles) with the exporter's PLY writer,
+then times:
+- rows: the previous row-based reader, one struct.unpack call per property
+  and one Python list per vertex and face (kept below as the baseline)
+- arrays: read_mesh, returning flat NumPy arrays
+and, when run inside Blender, the creation of the mesh:
+- per_loop: the previous mesh creation from the rows, with per-loop UVs
+- foreach_set: create_mesh on the arrays
+
+Usage:
+  python scripts/benchmark_ply_import.py [--resolution N] [--skip-rows]
+  blender -b --python scripts/benchmark_ply_import.py -- [--resolution N] [--skip-rows]
+'''
+import argparse
+import importlib.util
+import os
+import struct
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from benchmark_ply_writer import make_buffers, write_numpy
+
+def load_module(name, *path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'mitsuba-blender', *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f'{label:>12}: {time.perf_counter() - start:7.3f} s')
+    return result
+
+##################################
+##   Previous row-based reader  ##
+##################################
+
+# Binary files only, which is what the benchmark writes
+_row_formats = {b'binary_little_endian': '<', b'binary_big_endian': '>'}
+_row_types = {
+    b'char': 'b', b'uchar': 'B', b'int8': 'b', b'uint8': 'B',
+    b'int16': 'h', b'uint16': 'H', b'short': 'h', b'ushort': 'H',
+    b'int': 'i', b'int32': 'i', b'uint': 'I', b'uint32': 'I',
+    b'float': 'f', b'float32': 'f', b'float64': 'd', b'double': 'd',
+}
+
+def _read_format(format, count, num_type, stream):
+    fmt = '%s%i%s' % (format, count, num_type)
+    return struct.unpack(fmt, stream.read(struct.calcsize(fmt)))
+
+def _read_property(format, prop, stream):
+    name, list_type, numeric_type = prop
+    if list_type is not None:
+        count = int(_read_format(format, 1, list_type, stream)[0])
+        return _read_format(format, count, numeric_type, stream)
+    return _read_format(format, 1, numeric_type, stream)[0]
+
+def read_rows(filepath):
+    '''
+    Read the elements of a PLY file as lists of rows, with one struct.unpack
+    call per property, like the importer did before read_arrays.
+    Returns the (name, count, properties) element specs and the rows by element name.
+    '''
+    specs = []
+    with open(filepath, 'rb') as plyf:
+        for line in plyf:
+            tokens = line.split()
+            if tokens[0] == b'end_header':
+                break
+            if tokens[0] == b'format':
+                format = _row_formats[tokens[1]]
+            elif tokens[0] == b'element':
+                specs.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == b'property':
+                if tokens[1] == b'list':
+                    specs[-1][2].append((tokens[4], _row_types[tokens[2]], _row_types[tokens[3]]))
+                else:
+                    specs[-1][2].append((tokens[2], None, _row_types[tokens[1]]))
+        rows = {name: [[_read_property(format, prop, plyf) for prop in properties] for _ in range(count)]
+                for name, count, properties in specs}
+    return specs, rows
+
+def create_rows_mesh(name, rows):
+    '''
+    Create a Blender mesh from the rows of read_rows, like the importer did
+    before create_mesh: faces and UVs are gathered loop by loop in lists,
+    and the UVs set one loop at a time.
+    '''
+    import bpy
+    specs, obj = rows
+    vertex_props = [prop[0] for prop in specs[0][2]]
+    ix, iy, iz = (vertex_props.index(axis) for axis in (b'x', b'y', b'z'))
+    iu, iv = vertex_props.index(b'u'), vertex_props.index(b'v')
+    vertices = obj[b'vertex']
+
+    mesh_faces = []
+    mesh_uvs = []
+    for face in obj[b'face']:
+        indices = face[0]
+        # Face order fix-up of the vertex 0, for UVs
+        if len(indices) == 4:
+            if indices[2] == 0 or indices[3] == 0:
+                indices = indices[2], indices[3], indices[0], indices[1]
+        elif len(indices) == 3:
+            if indices[2] == 0:
+                indices = indices[1], indices[2], indices[0]
+        mesh_faces.append(indices)
+        mesh_uvs.extend([(vertices[index][iu], vertices[index][iv]) for index in indices])
+
+    mesh = bpy.data.meshes.new(name=name)
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", [a for v in vertices for a in (v[ix], v[iy], v[iz])])
+
+    loops_vert_idx = []
+    faces_loop_start = []
+    faces_loop_total = []
+    lidx = 0
+    for f in mesh_faces:
+        loops_vert_idx.extend(f)
+        faces_loop_start.append(lidx)
+        faces_loop_total.append(len(f))
+        lidx += len(f)
+    mesh.loops.add(len(loops_vert_idx))
+    mesh.polygons.add(len(mesh_faces))
+    mesh.loops.foreach_set("vertex_index", loops_vert_idx)
+    mesh.polygons.foreach_set("loop_start", faces_loop_start)
+    mesh.polygons.foreach_set("loop_total", faces_loop_total)
+
+    uv_layer = mesh.uv_layers.new()
+    for i, uv in enumerate(uv_layer.data):
+        uv.uv = mesh_uvs[i]
+
+    mesh.update()
+    mesh.validate()
+    return mesh
+
+if __name__ == '__main__':
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolution', type=int, default=1500, help='Grid resolution, the mesh has 2 (N-1)^2 triangles')
+    parser.add_argument('--skip-rows', action='store_true', help='Only time the NumPy path')
+    args = parser.parse_args(argv)
+
+    try:
+        import bpy
+    except ImportError:
+        bpy = None
+    ply = load_module('bl_import_ply', 'io', 'importer', 'bl_import_ply.py')
+
+    print(f'{2 * (args.resolution - 1) ** 2} triangles, {args.resolution ** 2} vertices')
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, 'mesh.ply')
+        write_numpy(filepath, make_buffers(args.resolution))
+        if not args.skip_rows:
+            rows = timed('rows', read_rows, filepath)
+            if bpy is not None:
+                timed('per_loop', create_rows_mesh, 'rows', rows)
+            del rows
+        mesh_data = timed('arrays', ply.read_mesh, filepath)
+        if bpy is not None:
+            timed('foreach_set', ply.create_mesh, 'arrays', mesh_data)
@@ -0,0 +1,95 @@
+'''
+Benchmark of the two PLY writers of the exporter, without Blender.
+
+Writes the same triangle mesh (a grid with normals and UVs) with:
+- mitsuba: building a mitsuba Mesh from the buffers, then Mesh.write_ply
+- numpy: io/exporter/ply.py, writing the buffers directly
+
+Each method runs in its own process, to report its peak memory on top of the
+mesh buffers themselves.
+
+Usage: python scripts/benchmark_ply_writer.py [--resolution N]
+'''
+import argparse
+import importlib.util
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PLY_MODULE = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                          'mitsuba-blender', 'io', 'exporter', 'ply.py')
+
+def make_buffers(resolution):
+    '''
+    Buffers of a resolution x resolution grid, as returned by geometry.part_buffers
+    '''
+    u, v = np.meshgrid(np.linspace(0, 1, resolution, dtype=np.float32),
+                       np.linspace(0, 1, resolution, dtype=np.float32))
+    positions = np.column_stack((u.ravel(), v.ravel(), np.zeros(u.size, dtype=np.float32)))
+    normals = np.zeros_like(positions)
+    normals[:, 2] = 1
+    uvs = np.column_stack((u.ravel(), v.ravel()))
+    idx = np.arange(resolution * resolution, dtype=np.uint32).reshape(resolution, resolution)
+    a, b = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel()
+    c, d = idx[1:, 1:].ravel(), idx[1:, :-1].ravel()
+    faces = np.concatenate((np.column_stack((a, b, c)), np.column_stack((a, c, d))))
+    return {'positions': positions, 'normals': normals, 'uvs': uvs, 'faces': faces, 'colors': {}}
+
+def write_mitsuba(filepath, buffers):
+    import mitsuba as mi
+    mi.set_variant('scalar_rgb')
+    mesh = mi.Mesh('benchmark', len(buffers['positions']), len(buffers['faces']), mi.Properties(), True, True)
+    params = mi.traverse(mesh)
+    params['vertex_positions'] = buffers['positions'].ravel()
+    params['vertex_normals'] = buffers['normals'].ravel()
+    params['vertex_texcoords'] = buffers['uvs'].ravel()
+    params['faces'] = buffers['faces'].ravel()
+    params.update()
+    mesh.write_ply(filepath)
+
+def write_numpy(filepath, buffers):
+    spec = importlib.util.spec_from_file_location('ply', PLY_MODULE)
+    ply = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(ply)
+    ply.write_ply(filepath, buffers)
+
+def peak_memory():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def run_method(method, resolution):
+    '''
+    Run one writer in this process and print its time, peak memory and file size
+    '''
+    if method == 'mitsuba':
+        # Load mitsuba before measuring, its libraries are not part of the cost
+        import mitsuba as mi
+        mi.set_variant('scalar_rgb')
+    buffers = make_buffers(resolution)
+    baseline = peak_memory()
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, 'mesh.ply')
+        start = time.perf_counter()
+        {'mitsuba': write_mitsuba, 'numpy': write_numpy}[method](filepath, buffers)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(filepath)
+    print(f'{method:>8}: {elapsed:7.3f} s, {(peak_memory() - baseline) / 2**20:8.1f} MiB peak over the buffers, '
+          f'{size / 2**20:8.1f} MiB file')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolution', type=int, default=1000, help='Grid resolution, the mesh has 2 (N-1)^2 triangles')
+    parser.add_argument('--method', choices=['mitsuba', 'numpy'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        run_method(args.method, args.resolution)
+    else:
+        print(f'{2 * (args.resolution - 1) ** 2} triangles, {args.resolution ** 2} vertices')
+        for method in ('mitsuba', 'numpy'):
+            subprocess.run([sys.executable, __file__, '--method', method, '--resolution', str(args.resolution)], check=True)
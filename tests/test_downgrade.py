@@ -0,0 +1,71 @@
+import importlib
+
+import pytest
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.exporter.{name}')
+
+_v3_scene = '''<scene version="3.0.0">
+    <integrator type="path">
+        <integer name="max_depth" value="8"/>
+    </integrator>
+    <bsdf type="dielectric" id="glass">
+        <float name="int_ior" value="1.5"/>
+    </bsdf>
+    <shape type="ply">
+        <string name="filename" value="meshes/my_mesh.ply"/>
+        <transform name="to_world">
+            <translate value="1 2 3"/>
+        </transform>
+    </shape>
+</scene>
+'''
+
+def test_downgrade_convert(tmp_path):
+    pytest.importorskip('inflection')
+    import xml.etree.ElementTree as ET
+    downgrade = _import('downgrade')
+    scene_file = tmp_path / 'scene.xml'
+    scene_file.write_text(_v3_scene)
+
+    assert downgrade.convert(str(scene_file))
+    root = ET.parse(str(tmp_path / 'scene_v1.xml')).getroot()
+    assert root.tag == 'scene' and root.attrib['version'] == '0.6.0'
+    assert root.find('integrator/integer').attrib == {'name': 'maxDepth', 'value': '8'}
+    assert root.find('bsdf/float').attrib['name'] == 'intIOR'
+    # File names are not renamed
+    assert root.find('shape/string').attrib == {'name': 'filename', 'value': 'meshes/my_mesh.ply'}
+    assert root.find('shape/transform/translate').attrib == {'x': '1', 'y': '2', 'z': '3'}
+
+def test_downgrade_convert_already_converted(tmp_path):
+    pytest.importorskip('inflection')
+    downgrade = _import('downgrade')
+    scene_file = tmp_path / 'scene.xml'
+    scene_file.write_text('<scene version="0.6.0"/>')
+
+    assert downgrade.convert(str(scene_file))
+    assert not (tmp_path / 'scene_v1.xml').exists()
+
+def test_downgrade_convert_files(tmp_path):
+    pytest.importorskip('inflection')
+    downgrade = _import('downgrade')
+    scene_files = []
+    for name in ('scene', 'fragment_a', 'fragment_b'):
+        scene_file = tmp_path / f'{name}.xml'
+        scene_file.write_text(_v3_scene)
+        scene_files.append(str(scene_file))
+
+    assert downgrade.convert_files(scene_files)
+    for name in ('scene', 'fragment_a', 'fragment_b'):
+        assert (tmp_path / f'{name}_v1.xml').read_text() == (tmp_path / 'scene_v1.xml').read_text()
+
+def test_downgrade_convert_files_wrong_format(tmp_path):
+    pytest.importorskip('inflection')
+    downgrade = _import('downgrade')
+    scene_file = tmp_path / 'scene.xml'
+    scene_file.write_text(_v3_scene)
+    other_file = tmp_path / 'scene.txt'
+    other_file.write_text(_v3_scene)
+
+    assert not downgrade.convert_files([str(scene_file), str(other_file)])
+    assert (tmp_path / 'scene_v1.xml').exists()
@@ -0,0 +1,253 @@
+import importlib
+import types
+
+import numpy as np
+
+import pytest
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.engine.{name}')
+
+class _Engine:
+    ''' Records the calls to the RenderEngine API made by the render loop '''
+    def __init__(self, break_after=None):
+        self.break_after = break_after
+        self.break_checks = 0
+        self.progress = []
+        self.stats = []
+
+    def test_break(self):
+        self.break_checks += 1
+        return self.break_after is not None and self.break_checks > self.break_after
+
+    def update_progress(self, progress):
+        self.progress.append(progress)
+
+    def update_stats(self, stats, info):
+        self.stats.append(info)
+
+class _Film:
+    def __init__(self):
+        self.value = 0.0
+
+    def bitmap(self):
+        from mitsuba import Bitmap
+        return Bitmap(np.full((2, 3, 3), self.value, dtype=np.float32))
+
+class _Sampler:
+    def __init__(self, sample_count):
+        self.count = sample_count
+
+    def sample_count(self):
+        return self.count
+
+class _Sensor:
+    def __init__(self, sample_count):
+        self.film_ = _Film()
+        self.sampler_ = _Sampler(sample_count)
+
+    def film(self):
+        return self.film_
+
+    def sampler(self):
+        return self.sampler_
+
+class _Integrator:
+    ''' Renders an image whose value is the seed + 1 '''
+    def __init__(self):
+        self.passes = []
+
+    def render(self, scene, sensor, seed, spp):
+        self.passes.append((seed, spp))
+        sensor.film().value = float(seed + 1)
+
+class _Scene:
+    def __init__(self):
+        self.integrator_ = _Integrator()
+
+    def integrator(self):
+        return self.integrator_
+
+def _render_passes(engine, scene, sensor, pass_count, progressive=True):
+    final = _import('final')
+    return list(final.MitsubaRenderEngine.render_passes(engine, scene, sensor, pass_count, progressive=progressive))
+
+def test_render_passes_progressive():
+    engine, scene, sensor = _Engine(), _Scene(), _Sensor(10)
+    results = _render_passes(engine, scene, sensor, 4)
+    # The remainder of the sample count goes to the first passes, each pass has its own seed
+    assert scene.integrator().passes == [(0, 3), (1, 3), (2, 2), (3, 2)]
+    assert len(results) == 4
+    # Running average of the passes, weighted by their sample count
+    weighted = np.cumsum([1 * 3, 2 * 3, 3 * 2, 4 * 2]) / np.cumsum([3, 3, 2, 2])
+    for result, expected in zip(results, weighted):
+        assert np.allclose(np.array(result[0][1]), expected)
+    assert engine.progress == pytest.approx([0.25, 0.5, 0.75, 1.0])
+    assert engine.stats[-1] == "Pass 4/4 | 10/10 spp"
+
+def test_render_passes_more_passes_than_samples():
+    engine, scene, sensor = _Engine(), _Scene(), _Sensor(2)
+    results = _render_passes(engine, scene, sensor, 8)
+    assert scene.integrator().passes == [(0, 1), (1, 1)]
+    assert len(results) == 2
+
+def test_render_passes_single_pass():
+    engine, scene, sensor = _Engine(), _Scene(), _Sensor(16)
+    results = _render_passes(engine, scene, sensor, 1)
+    assert scene.integrator().passes == [(0, 16)]
+    assert len(results) == 1
+    assert np.allclose(np.array(results[0][0][1]), 1.0)
+
+def test_render_passes_views_progress():
+    final = _import('final')
+    engine, scene, sensor = _Engine(), _Scene(), _Sensor(4)
+    list(final.MitsubaRenderEngine.render_passes(engine, scene, sensor, 2, view_idx=1, view_count=2))
+    # Progress of the second of two views
+    assert engine.progress == pytest.approx([0.75, 1.0])
+    assert engine.stats[-1] == "View 2/2 | Pass 2/2 | 4/4 spp"
+
+def test_render_passes_not_progressive():
+    engine, scene, sensor = _Engine(), _Scene(), _Sensor(16)
+    results = _render_passes(engine, scene, sensor, 4, progressive=False)
+    # The render is still split in passes, only the final average is returned
+    assert scene.integrator().passes == [(0, 4), (1, 4), (2, 4), (3, 4)]
+    assert len(results) == 1
+    name, bitmap = results[0][0]
+    assert name == '<root>'
+    assert np.allclose(np.array(bitmap), 2.5)
+    assert engine.progress[-1] == pytest.approx(1.0)
+
+@pytest.mark.parametrize("progressive", [True, False])
+def test_render_passes_cancel(progressive):
+    engine, scene, sensor = _Engine(break_after=2), _Scene(), _Sensor(16)
+    results = _render_passes(engine, scene, sensor, 4, progressive)
+    # Cancellation is checked before each pass
+    assert len(scene.integrator().passes) == 2
+    assert len(results) == (2 if progressive else 0)
+
+def test_render_passes_cancel_single_pass():
+    engine, scene, sensor = _Engine(break_after=0), _Scene(), _Sensor(16)
+    assert _render_passes(engine, scene, sensor, 1, progressive=False) == []
+    assert scene.integrator().passes == []
+
+class _RenderPass:
+    def __init__(self, channels):
+        self.channels = channels
+        self.rect = self
+        self.pixels = None
+
+    def foreach_set(self, pixels):
+        self.pixels = pixels.copy()
+
+class _RenderResult:
+    def __init__(self, passes):
+        self.layers = [types.SimpleNamespace(passes=passes)]
+
+def _pass_engine(size_x, size_y):
+    final = _import('final')
+    engine = _Engine()
+    engine.size_x, engine.size_y = size_x, size_y
+    engine.pass_buffers = {}
+    for name in ('get_pass_name', 'get_pass_buffer'):
+        setattr(engine, name, types.MethodType(getattr(final.MitsubaRenderEngine, name), engine))
+    return engine
+
+def test_write_results_flips_rows():
+    from mitsuba import Bitmap
+    final = _import('final')
+    engine = _pass_engine(3, 2)
+    pixels = np.arange(2 * 3 * 3, dtype=np.float32).reshape((2, 3, 3))
+    # The Blender pass has an alpha channel, Mitsuba's bitmap does not
+    render_pass = _RenderPass(4)
+    final.MitsubaRenderEngine.write_results(engine, _RenderResult({'Combined': render_pass}), [('<root>', Bitmap(pixels))])
+
+    written = render_pass.pixels.reshape((2, 3, 4))
+    assert np.array_equal(written[:, :, :3], pixels[::-1])
+    assert not written[:, :, 3].any()
+
+def test_write_results_reuses_buffers():
+    from mitsuba import Bitmap
+    final = _import('final')
+    engine = _pass_engine(3, 2)
+    render_pass = _RenderPass(3)
+    result = _RenderResult({'Camera.001 Combined': render_pass})
+    final.MitsubaRenderEngine.write_results(engine, result, [('<root>', Bitmap(np.zeros((2, 3, 3), dtype=np.float32)))], 'Camera.001')
+    buffer = engine.pass_buffers['Camera.001 Combined']
+
+    # The passes of a progressive render are written to the same buffer
+    final.MitsubaRenderEngine.write_results(engine, result, [('<root>', Bitmap(np.ones((2, 3, 3), dtype=np.float32)))], 'Camera.001')
+    assert engine.pass_buffers['Camera.001 Combined'] is buffer
+    assert np.array_equal(render_pass.pixels, np.ones(2 * 3 * 3))
+
+class _ViewEngine(_Engine):
+    def __init__(self):
+        super().__init__()
+        self.reports = []
+
+    def report(self, level, message):
+        self.reports.append(message)
+
+class _SensorScene:
+    ''' Loaded scene with a sensor per exported camera '''
+    def __init__(self, names):
+        self.sensors_ = [types.SimpleNamespace(id=lambda name=name: name) for name in names]
+
+    def sensors(self):
+        return self.sensors_
+
+def _add_cameras(*names):
+    import bpy
+    b_cameras = []
+    for name in names:
+        bpy.ops.object.camera_add()
+        bpy.context.object.name = name
+        b_cameras.append(bpy.context.object)
+    return b_cameras
+
+def _get_views(b_scene, exported):
+    final = _import('final')
+    engine = _ViewEngine()
+    engine.get_render_cameras = types.MethodType(final.MitsubaRenderEngine.get_render_cameras, engine)
+    views = final.MitsubaRenderEngine.get_views(engine, b_scene, _SensorScene(exported))
+    return [name for name, _ in views], engine.reports
+
+def test_render_cameras_multiview():
+    import bpy
+    b_scene = bpy.context.scene
+    b_scene.render.engine = 'MITSUBA'
+    b_active, b_second, b_third, b_unselected = _add_cameras('Active', 'B', 'A', 'Unselected')
+    b_scene.camera = b_active
+    for b_camera in (b_active, b_second, b_third):
+        b_camera.select_set(True)
+    b_unselected.select_set(False)
+    b_scene.mitsuba.multiview = 'SELECTED'
+
+    final = _import('final')
+    cameras = final.MitsubaRenderEngine.get_render_cameras(_Engine(), b_scene)
+    # The active camera comes first, the other ones are sorted by name
+    assert cameras == [b_active, b_third, b_second]
+    # Mitsuba 0.6 only renders the active camera
+    b_scene.mitsuba.version = 'v1'
+    assert final.MitsubaRenderEngine.get_render_cameras(_Engine(), b_scene) == [b_active]
+
+def test_views_pass_names():
+    import bpy
+    b_scene = bpy.context.scene
+    b_scene.render.engine = 'MITSUBA'
+    b_active, b_other = _add_cameras('Active', 'Other')
+    b_scene.camera = b_active
+    b_scene.mitsuba.multiview = 'SELECTED'
+    b_active.select_set(True)
+    b_other.select_set(True)
+
+    names, reports = _get_views(b_scene, ['Active', 'Other'])
+    assert names == ['', 'Other']
+    assert not reports
+    final = _import('final')
+    assert final.MitsubaRenderEngine.get_pass_name(None, names[0], '<root>') == 'Combined'
+    assert final.MitsubaRenderEngine.get_pass_name(None, names[1], '<root>') == 'Other Combined'
+
+    # When the active camera is not exported, the first exported one uses the main passes
+    names, reports = _get_views(b_scene, ['Other'])
+    assert names == ['']
+    assert len(reports) == 1
@@ -0,0 +1,442 @@
+import importlib
+import os
+
+import bpy
+import numpy as np
+
+import pytest
+
+from utils.mesh_utils import grid_buffers
+
+def _exporter():
+    return importlib.import_module('mitsuba-blender.io.exporter')
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.exporter.{name}')
+
+def _export(directory, render=False):
+    ''' Export the current Blender scene to a scene dict '''
+    converter = _exporter().SceneConverter(render=render)
+    converter.set_path(os.path.join(directory, 'scene.xml'))
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    return converter
+
+def _shapes(mts_scene):
+    return sorted((shape.vertex_count(), shape.face_count()) for shape in mts_scene.shapes())
+
+##########################
+##   In-memory export   ##
+##########################
+
+def test_render_export_writes_no_meshes(tmp_path):
+    import mitsuba
+    bpy.ops.mesh.primitive_cube_add()
+    bpy.ops.mesh.primitive_uv_sphere_add(location=(3, 0, 0))
+    converter = _export(str(tmp_path / 'render'), render=True)
+    mts_scene = converter.dict_to_scene()
+    # Meshes are built in memory, without writing PLY files
+    assert not (tmp_path / 'render').exists() or not os.listdir(tmp_path / 'render')
+
+    # Same meshes as the files written when exporting the scene
+    reference = _export(str(tmp_path / 'files'))
+    reference.dict_to_xml()
+    mesh_dir = tmp_path / 'files' / 'meshes'
+    meshes = [mitsuba.load_dict({'type': 'ply', 'filename': str(mesh_dir / name)}) for name in os.listdir(mesh_dir)]
+    assert _shapes(mts_scene) == sorted((mesh.vertex_count(), mesh.face_count()) for mesh in meshes)
+
+#################
+##   Cameras   ##
+#################
+
+def _exported_cameras(converter):
+    return sorted(name for name, entry in converter.export_ctx.scene_data.items()
+                  if isinstance(entry, dict) and entry.get('type') == 'perspective')
+
+def _add_cameras():
+    b_scene = bpy.context.scene
+    bpy.ops.object.camera_add()
+    b_scene.camera = bpy.context.object
+    b_scene.camera.name = 'Active'
+    bpy.ops.object.camera_add()
+    bpy.context.object.name = 'Other'
+
+@pytest.mark.parametrize("render", [True, False])
+def test_export_requested_cameras(tmp_path, render):
+    _add_cameras()
+    converter = _exporter().SceneConverter(render=render)
+    converter.cameras = {'Active'}
+    converter.set_path(str(tmp_path / 'scene.xml'))
+    # Name the entries after the cameras
+    converter.export_ctx.export_ids = True
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    assert _exported_cameras(converter) == ['Active']
+
+def test_export_default_cameras(tmp_path):
+    _add_cameras()
+    # Scene files get all the cameras, renders only the active one
+    assert len(_exported_cameras(_export(str(tmp_path / 'file')))) == 2
+    assert len(_exported_cameras(_export(str(tmp_path / 'render'), render=True))) == 1
+
+################
+##   Meshes   ##
+################
+
+def _quads_arrays(tri_mats=(0, 0, 1, 1), smooth=False, uvs=None):
+    '''
+    Mesh data of two quads sharing an edge, in the layout of geometry.mesh_arrays:
+
+    3---4---5
+    | / | / |
+    0---1---2
+    '''
+    positions = np.array([[0, 0, 0], [1, 0, 0], [2, 0, 0], [0, 1, 0], [1, 1, 0], [2, 1, 0]], dtype=np.float32)
+    loop_verts = np.array([0, 1, 4, 3, 1, 2, 5, 4], dtype=np.int32)
+    arrays = {
+        'positions': positions,
+        'loop_verts': loop_verts,
+        'tri_loops': np.array([[0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7]], dtype=np.int32),
+        'tri_mats': np.array(tri_mats, dtype=np.int32),
+        'tri_smooth': np.full(4, smooth),
+        'normals': np.tile(np.array([0, 0, 1], dtype=np.float32), (8, 1)),
+        'colors': {},
+    }
+    if uvs is not None:
+        arrays['uvs'] = np.array(uvs, dtype=np.float32)
+    return arrays
+
+def _part_triangles(arrays, part):
+    ''' Positions of the corners of the triangles of a split part '''
+    vertex_loops, faces = part
+    return arrays['positions'][arrays['loop_verts'][vertex_loops]][faces]
+
+def test_split_mesh_by_material():
+    geometry = _import('geometry')
+    arrays = _quads_arrays()
+    parts = geometry.split_mesh(arrays, [0, 1], 2)
+    assert sorted(parts) == [0, 1]
+    for mat_nr, first_loop in ((0, 0), (1, 4)):
+        vertex_loops, faces = parts[mat_nr]
+        # Each part only keeps the vertices it uses
+        assert len(vertex_loops) == 4
+        assert faces.dtype == np.uint32
+        expected = arrays['positions'][arrays['loop_verts'][arrays['tri_loops'][first_loop // 2:first_loop // 2 + 2]]]
+        assert np.array_equal(_part_triangles(arrays, parts[mat_nr]), expected)
+
+def test_split_mesh_whole_mesh():
+    geometry = _import('geometry')
+    arrays = _quads_arrays()
+    vertex_loops, faces = geometry.split_mesh(arrays, [-1], 2)[-1]
+    # Loops of the shared edge are merged
+    assert len(vertex_loops) == 6
+    assert len(faces) == 4
+
+def test_split_mesh_skips_empty_parts():
+    geometry = _import('geometry')
+    # Material indices without a slot use the last one
+    parts = geometry.split_mesh(_quads_arrays(tri_mats=(0, 0, 5, 5)), [0, 1, 2], 2)
+    assert sorted(parts) == [0, 1]
+    assert len(parts[1][1]) == 2
+
+def test_split_mesh_uv_seams():
+    geometry = _import('geometry')
+    # The two quads do not share their UVs along the shared edge
+    uvs = [[0, 0], [1, 0], [1, 1], [0, 1], [2, 0], [3, 0], [3, 1], [2, 1]]
+    vertex_loops, faces = geometry.split_mesh(_quads_arrays(uvs=uvs), [-1], 1)[-1]
+    assert len(vertex_loops) == 8
+    uvs = np.array(uvs)
+    # Each corner keeps the UV of its loop
+    corner_loops = vertex_loops[faces]
+    assert np.array_equal(uvs[corner_loops], uvs[_quads_arrays()['tri_loops']])
+
+def test_mesh_parts_from_blender_mesh():
+    geometry = _import('geometry')
+    exporter = _exporter()
+    bpy.ops.mesh.primitive_cube_add()
+    b_mesh = bpy.context.object.data
+    # UV seams would split the vertices too
+    b_mesh.uv_layers.remove(b_mesh.uv_layers[0])
+    for name in ('Red', 'Blue'):
+        b_mesh.materials.append(bpy.data.materials.new(name))
+    # Two opposite faces use the second material
+    b_mesh.polygons.foreach_set('material_index', [0, 1, 0, 1, 0, 0])
+
+    export_ctx = exporter.SceneConverter(render=True).export_ctx
+    arrays = geometry.mesh_arrays(export_ctx, b_mesh, b_mesh.name)
+    assert arrays['positions'].shape == (8, 3)
+    assert arrays['tri_loops'].shape == (12, 3)
+    parts = dict(geometry.convert_mesh_parts(export_ctx, b_mesh, None, {0: 'red', 1: 'blue'}, arrays=arrays))
+    # Flat faces do not share their vertices with the faces of another part
+    assert (parts[0].face_count(), parts[1].face_count()) == (8, 4)
+    assert (parts[0].vertex_count(), parts[1].vertex_count()) == (8, 8)
+    assert not parts[0].has_vertex_normals()
+
+###########################
+##   Linked duplicates   ##
+###########################
+
+def _add_linked_duplicates(count):
+    bpy.ops.mesh.primitive_cube_add()
+    b_object = bpy.context.object
+    b_objects = [b_object]
+    for i in range(1, count):
+        b_duplicate = bpy.data.objects.new(f'{b_object.name}.{i}', b_object.data)
+        b_duplicate.location = (3 * i, 0, 0)
+        bpy.context.collection.objects.link(b_duplicate)
+        b_objects.append(b_duplicate)
+    return b_objects
+
+def _entry_types(converter):
+    types = [entry.get('type') for entry in converter.export_ctx.scene_data.values() if isinstance(entry, dict)]
+    return {name: types.count(name) for name in set(types)}
+
+def test_linked_meshes():
+    geometry = _import('geometry')
+    b_objects = _add_linked_duplicates(3)
+    # Objects with modifiers have their own geometry
+    b_objects[2].modifiers.new('Subdivision', 'SUBSURF')
+    bpy.ops.mesh.primitive_uv_sphere_add()
+    assert geometry.linked_meshes(bpy.context.evaluated_depsgraph_get(), set()) == {b_objects[0].data.name_full}
+
+def test_export_linked_duplicates(tmp_path):
+    b_objects = _add_linked_duplicates(3)
+    b_objects[2].modifiers.new('Subdivision', 'SUBSURF')
+    converter = _exporter().SceneConverter()
+    converter.export_ctx.instance_duplicates = True
+    converter.set_path(str(tmp_path / 'scene.xml'))
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    converter.dict_to_xml()
+
+    types = _entry_types(converter)
+    # One shapegroup instantiated twice, the modified object is a shape of its own
+    assert types.get('shapegroup') == 1
+    assert types.get('instance') == 2
+    assert types.get('ply') == 1
+    assert len(os.listdir(tmp_path / 'meshes')) == 2
+
+def test_export_linked_duplicates_render(tmp_path):
+    import mitsuba
+    b_objects = _add_linked_duplicates(2)
+    converter = _exporter().SceneConverter(render=True)
+    converter.export_ctx.instance_duplicates = True
+    converter.set_path(str(tmp_path / 'scene.xml'))
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    mts_scene = converter.dict_to_scene()
+
+    assert _entry_types(converter).get('instance') == 2
+    # Both instances are rendered at their object's location
+    bbox = mts_scene.bbox()
+    assert np.allclose(np.array(bbox.min), [-1, -1, -1]) and np.allclose(np.array(bbox.max), [4, 1, 1])
+
+##################
+##   Textures   ##
+##################
+
+def _texture_ctx(directory):
+    converter = _exporter().SceneConverter()
+    converter.set_path(os.path.join(directory, 'scene.xml'))
+    return converter.export_ctx
+
+def _write_png(path):
+    from mitsuba import Bitmap
+    pixels = np.random.default_rng(0).integers(0, 255, (8, 8, 3), dtype=np.uint8)
+    Bitmap(pixels).write(str(path))
+    return str(path)
+
+def test_export_texture_copies_source(tmp_path):
+    source = _write_png(tmp_path / 'wood.png')
+    export_ctx = _texture_ctx(str(tmp_path / 'export'))
+    filename = export_ctx.export_texture(bpy.data.images.load(source))
+    export_ctx.wait_writes()
+    # The file is not encoded again
+    assert filename == 'textures/wood.png'
+    assert (tmp_path / 'export' / filename).read_bytes() == (tmp_path / 'wood.png').read_bytes()
+
+def test_export_texture_dedupe(tmp_path):
+    source = _write_png(tmp_path / 'wood.png')
+    export_ctx = _texture_ctx(str(tmp_path / 'export'))
+    b_images = [bpy.data.images.load(source, check_existing=False) for _ in range(2)]
+    packed = [bpy.data.images.load(source, check_existing=False) for _ in range(2)]
+    for b_image in packed:
+        b_image.pack()
+    filenames = [export_ctx.export_texture(b_image) for b_image in b_images + packed]
+    export_ctx.wait_writes()
+    # Images with the same content share one file
+    assert filenames[0] == filenames[1]
+    assert filenames[2] == filenames[3]
+    assert len(os.listdir(tmp_path / 'export' / 'textures')) == 2
+    # Exporting the same image again does not write anything
+    assert export_ctx.export_texture(b_images[0]) == filenames[0]
+
+def test_export_texture_generated(tmp_path):
+    from mitsuba import Bitmap
+    export_ctx = _texture_ctx(str(tmp_path))
+    b_image = bpy.data.images.new('Generated', 4, 2)
+    b_image.pixels.foreach_set(np.full(4 * 2 * 4, 0.5, dtype=np.float32))
+    filename = export_ctx.export_texture(b_image)
+    export_ctx.wait_writes()
+    # Images without a source file are written from their pixels
+    assert filename == 'textures/Generated.png'
+    assert np.array(Bitmap(str(tmp_path / filename))).shape[:2] == (2, 4)
+
+###################
+##   Materials   ##
+###################
+
+def _diffuse_material(name):
+    b_mat = bpy.data.materials.new(name)
+    b_mat.use_nodes = True
+    nodes = b_mat.node_tree.nodes
+    nodes.remove(nodes['Principled BSDF'])
+    b_diffuse = nodes.new('ShaderNodeBsdfDiffuse')
+    b_mat.node_tree.links.new(b_diffuse.outputs['BSDF'], nodes['Material Output'].inputs['Surface'])
+    return b_mat
+
+def _add_material_cubes(count):
+    b_mat = _diffuse_material('Shared')
+    for i in range(count):
+        bpy.ops.mesh.primitive_cube_add(location=(3 * i, 0, 0))
+        bpy.context.object.data.materials.append(b_mat)
+    return b_mat
+
+def _material_hash(b_mat):
+    materials = _import('materials')
+    return materials.material_hash(_exporter().SceneConverter().export_ctx, b_mat)
+
+def test_export_shared_material(tmp_path):
+    _add_material_cubes(3)
+    export_ctx = _export(str(tmp_path)).export_ctx
+    # The material is converted once, for the first object using it
+    assert export_ctx.material_misses == 1
+    assert export_ctx.material_hits == 2
+
+def test_material_hash():
+    b_mat = _add_material_cubes(1)
+    digest = _material_hash(b_mat)
+    assert _material_hash(b_mat) == digest
+
+    b_mat.node_tree.nodes['Diffuse BSDF'].inputs['Color'].default_value = (1, 0, 0, 1)
+    assert _material_hash(b_mat) != digest
+
+    # Settings held by the nodes, and not by their sockets
+    digest = _material_hash(b_mat)
+    ramp = b_mat.node_tree.nodes.new('ShaderNodeValToRGB')
+    assert _material_hash(b_mat) != digest
+    digest = _material_hash(b_mat)
+    ramp.color_ramp.elements[1].position = 0.5
+    assert _material_hash(b_mat) != digest
+
+def test_material_cache_across_exports(tmp_path):
+    b_mat = _add_material_cubes(1)
+    material_cache = _export(str(tmp_path)).export_ctx.material_cache
+
+    def export_again():
+        converter = _exporter().SceneConverter()
+        converter.export_ctx.material_cache = material_cache
+        converter.set_path(os.path.join(str(tmp_path), 'scene.xml'))
+        converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+        return converter.export_ctx
+
+    export_ctx = export_again()
+    assert (export_ctx.material_hits, export_ctx.material_misses) == (1, 0)
+    b_mat.node_tree.nodes['Diffuse BSDF'].inputs['Roughness'].default_value = 0.1
+    export_ctx = export_again()
+    assert (export_ctx.material_hits, export_ctx.material_misses) == (0, 1)
+
+###################
+##   Instances   ##
+###################
+
+def _add_collection_instances(count):
+    ''' Instances of a collection holding a cube, which is not in the scene itself '''
+    b_collection = bpy.data.collections.new('Group')
+    bpy.ops.mesh.primitive_cube_add()
+    b_cube = bpy.context.object
+    b_collection.objects.link(b_cube)
+    bpy.context.scene.collection.objects.unlink(b_cube)
+    for i in range(count):
+        b_empty = bpy.data.objects.new(f'Instance{i}', None)
+        b_empty.instance_type = 'COLLECTION'
+        b_empty.instance_collection = b_collection
+        b_empty.location = (3 * i, i, 0)
+        b_empty.rotation_euler = (0, 0, 0.3 * i)
+        b_empty.scale = (1, 1, 1 + i)
+        bpy.context.scene.collection.objects.link(b_empty)
+
+def _instance_count(depsgraph):
+    return sum(1 for _ in depsgraph.object_instances)
+
+def test_instance_matrices():
+    _add_collection_instances(3)
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    count = _instance_count(depsgraph)
+    export_ctx = _exporter().SceneConverter().export_ctx
+    expected = [np.array(object_instance.matrix_world) for object_instance in depsgraph.object_instances]
+    assert np.allclose(export_ctx.instance_matrices(depsgraph, count), expected, atol=1e-6)
+
+def test_export_instances(tmp_path):
+    _add_collection_instances(3)
+    converter = _export(str(tmp_path))
+    export_ctx = converter.export_ctx
+    instances = [entry for entry in export_ctx.scene_data.values()
+                 if isinstance(entry, dict) and entry.get('type') == 'instance']
+    assert len(instances) == 3
+    assert len({entry['shape']['id'] for entry in instances}) == 1
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    axis_mat = np.array(export_ctx.axis_mat)
+    expected = sorted((axis_mat @ np.array(object_instance.matrix_world)).tolist()
+                      for object_instance in depsgraph.object_instances if object_instance.is_instance)
+    exported = sorted(np.array(entry['to_world'].matrix).tolist() for entry in instances)
+    assert np.allclose(exported, expected, atol=1e-5)
+
+#######################
+##   Merged meshes   ##
+#######################
+
+def test_merge_buffers():
+    geometry = _import('geometry')
+    first = grid_buffers(3)
+    second = grid_buffers(4)
+    merged = geometry.merge_buffers([first, second])
+    assert np.array_equal(merged['positions'], np.concatenate([first['positions'], second['positions']]))
+    assert np.array_equal(merged['normals'], np.concatenate([first['normals'], second['normals']]))
+    # The faces of the second part index its vertices after the ones of the first part
+    assert np.array_equal(merged['faces'], np.concatenate([first['faces'], second['faces'] + 9]))
+    assert merged['colors'] == {}
+
+def _add_merged_cubes():
+    b_first = _diffuse_material('First')
+    b_second = _diffuse_material('Second')
+    for i, b_mat in enumerate((b_first, b_first, b_first, b_second)):
+        bpy.ops.mesh.primitive_cube_add(location=(10 * i, 0, 0))
+        bpy.context.object.data.materials.append(b_mat)
+
+def _export_merged(directory, merge_cell_size=0):
+    import mitsuba
+    converter = _exporter().SceneConverter()
+    converter.export_ctx.merge_meshes = True
+    converter.export_ctx.merge_cell_size = merge_cell_size
+    converter.set_path(os.path.join(directory, 'scene.xml'))
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    converter.dict_to_xml()
+    mesh_dir = os.path.join(directory, 'meshes')
+    return {name: mitsuba.load_dict({'type': 'ply', 'filename': os.path.join(mesh_dir, name)})
+            for name in sorted(os.listdir(mesh_dir))}
+
+def test_export_merged_meshes(tmp_path):
+    _add_merged_cubes()
+    meshes = _export_merged(str(tmp_path))
+    # One mesh per material
+    assert list(meshes) == ['merged-0-mat-First.ply', 'merged-1-mat-Second.ply']
+    first = meshes['merged-0-mat-First.ply']
+    assert first.face_count() == 36
+    # The world transforms are applied to the merged vertices
+    bbox = first.bbox()
+    assert bbox.max.x - bbox.min.x == pytest.approx(22)
+    assert meshes['merged-1-mat-Second.ply'].face_count() == 12
+
+def test_export_merged_meshes_cells(tmp_path):
+    _add_merged_cubes()
+    meshes = _export_merged(str(tmp_path), merge_cell_size=15)
+    # The first two cubes are in the same cell, the third one in the next
+    assert sorted(mesh.face_count() for mesh in meshes.values()) == [12, 12, 24]
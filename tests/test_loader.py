@@ -0,0 +1,79 @@
+import importlib
+
+import pytest
+
+from utils.mesh_utils import grid_buffers
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.{name}')
+
+def _write_serialized(filepath, shapes):
+    serialized = _import('exporter.serialized')
+    serialized_file = serialized.SerializedFile(filepath)
+    for name, buffers in shapes:
+        serialized_file.encode_shape(serialized_file.add_shape(), name, buffers)
+    serialized_file.write()
+
+def test_geometry_loader_order():
+    loader = _import('importer.loader')
+    geometry_loader = loader.GeometryLoader(max_workers=2, max_ahead=2)
+    for i in range(10):
+        geometry_loader.add(i, lambda x: x * x, i)
+    geometry_loader.start()
+    try:
+        assert [geometry_loader.load(i, None) for i in range(10)] == [i * i for i in range(10)]
+        # Keys that were not queued are loaded synchronously
+        assert geometry_loader.load('other', lambda x: -x, 3) == -3
+    finally:
+        geometry_loader.close()
+
+def test_geometry_loader_errors():
+    loader = _import('importer.loader')
+
+    def fail(path):
+        raise OSError(f'Cannot read "{path}"')
+
+    geometry_loader = loader.GeometryLoader(max_workers=1)
+    geometry_loader.add('missing', fail, 'missing.ply')
+    geometry_loader.start()
+    try:
+        with pytest.raises(OSError):
+            geometry_loader.load('missing', fail, 'missing.ply')
+    finally:
+        geometry_loader.close()
+
+def test_geometry_loader_serialized_file_is_read_once(tmp_path):
+    loader = _import('importer.loader')
+    filepath = str(tmp_path / 'shapes.serialized')
+    _write_serialized(filepath, [('first', grid_buffers(3)), ('second', grid_buffers(4))])
+
+    geometry_loader = loader.GeometryLoader(max_workers=2)
+    for index in range(2):
+        geometry_loader.add(index, lambda index: geometry_loader.serialized_file(filepath).shape(index), index)
+    geometry_loader.start()
+    try:
+        assert geometry_loader.load(0, None)['name'] == 'first'
+        assert geometry_loader.load(1, None)['name'] == 'second'
+        assert list(geometry_loader.serialized_files) == [filepath]
+    finally:
+        geometry_loader.close()
+    assert not geometry_loader.serialized_files
+
+def test_import_scene_geometry(tmp_path):
+    import bpy
+    ply = _import('exporter.ply')
+    sizes = (3, 4, 5, 6)
+    for n in sizes[:2]:
+        ply.write_ply(str(tmp_path / f'grid{n}.ply'), grid_buffers(n, normals=False))
+    _write_serialized(str(tmp_path / 'grids.serialized'),
+                      [(f'grid{n}', grid_buffers(n, normals=False)) for n in sizes[2:]])
+    shapes = [f'<shape type="ply"><string name="filename" value="grid{n}.ply"/></shape>' for n in sizes[:2]]
+    shapes += [f'<shape type="serialized"><string name="filename" value="grids.serialized"/>'
+               f'<integer name="shape_index" value="{index}"/></shape>' for index in range(2)]
+    scene_file = tmp_path / 'scene.xml'
+    scene_file.write_text('<scene version="2.1.0">\n' + '\n'.join(shapes) + '\n</scene>\n')
+
+    assert bpy.ops.import_scene.mitsuba(filepath=str(scene_file)) == {'FINISHED'}
+    # Each mesh file is decoded in the background, then created on the main thread
+    meshes = [b_object.data for b_object in bpy.context.scene.objects if b_object.type == 'MESH']
+    assert sorted(len(mesh.polygons) for mesh in meshes) == [2 * (n - 1) ** 2 for n in sizes]
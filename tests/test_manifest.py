@@ -0,0 +1,122 @@
+import importlib
+import os
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.exporter.{name}')
+
+def _write(directory, filename, content):
+    path = os.path.join(directory, filename)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+def _read(directory, filename):
+    with open(os.path.join(directory, filename)) as f:
+        return f.read()
+
+def test_manifest_reuses_files(tmp_path):
+    manifest = _import('manifest')
+    directory = str(tmp_path)
+    first = manifest.ExportManifest(directory, 'scene.xml')
+    assert first.lookup('mesh', 'abc') is None
+    _write(directory, 'mesh.ply', 'mesh')
+    first.record('mesh', 'abc', ['mesh.ply'], shape_index=0)
+    first.save()
+
+    second = manifest.ExportManifest(directory, 'scene.xml')
+    entry = second.lookup('mesh', 'abc')
+    assert entry['files'] == ['mesh.ply']
+    assert entry['shape_index'] == 0
+    assert second.lookup('mesh', 'other hash') is None
+
+    # Entries whose files were deleted are not reused
+    os.remove(os.path.join(directory, 'mesh.ply'))
+    assert second.lookup('mesh', 'abc') is None
+
+def test_manifest_restore_links_files(tmp_path):
+    manifest = _import('manifest')
+    directory = str(tmp_path)
+    export = manifest.ExportManifest(directory, 'scene.xml')
+    _write(directory, 'first.ply', 'mesh')
+    export.record('first', 'abc', ['first.ply'])
+
+    # Another asset with the same content
+    entry = export.lookup('second', 'abc')
+    assert entry['files'] == ['first.ply']
+    export.restore(entry, ['meshes/second.ply'])
+    export.record('second', 'abc', ['meshes/second.ply'])
+    assert _read(directory, 'meshes/second.ply') == 'mesh'
+
+    # Writing one of the files again must not change the other one
+    export.prepare('meshes/second.ply')
+    _write(directory, 'meshes/second.ply', 'new mesh')
+    assert _read(directory, 'first.ply') == 'mesh'
+
+def test_manifest_removes_unused_files(tmp_path):
+    manifest = _import('manifest')
+    directory = str(tmp_path)
+    first = manifest.ExportManifest(directory, 'scene.xml')
+    for name in ('kept', 'removed'):
+        _write(directory, f'{name}.ply', name)
+        first.record(name, name, [f'{name}.ply'])
+    first.save()
+    # Files written by the user are not listed in the manifest
+    _write(directory, 'user.ply', 'user')
+    # Files of another scene exported to the same folder
+    other = manifest.ExportManifest(directory, 'other.xml')
+    _write(directory, 'other.ply', 'other')
+    other.record('other', 'other', ['other.ply'])
+    other.save()
+
+    second = manifest.ExportManifest(directory, 'scene.xml')
+    second.record('kept', 'kept', ['kept.ply'])
+    second.save()
+    assert sorted(f for f in os.listdir(directory) if f.endswith('.ply')) == ['kept.ply', 'other.ply', 'user.ply']
+
+def test_manifest_keeps_files_shared_with_other_scenes(tmp_path):
+    manifest = _import('manifest')
+    directory = str(tmp_path)
+    first = manifest.ExportManifest(directory, 'scene.xml')
+    _write(directory, 'shared.ply', 'shared')
+    first.record('mesh', 'abc', ['shared.ply'])
+    first.save()
+    other = manifest.ExportManifest(directory, 'other.xml')
+    other.record('mesh', 'abc', ['shared.ply'])
+    other.save()
+
+    second = manifest.ExportManifest(directory, 'scene.xml')
+    second.save()
+    assert os.path.isfile(os.path.join(directory, 'shared.ply'))
+
+def test_manifest_invalid_file(tmp_path):
+    manifest = _import('manifest')
+    directory = str(tmp_path)
+    _write(directory, manifest.ExportManifest.filename, '{not json')
+    _write(directory, 'mesh.ply', 'mesh')
+
+    export = manifest.ExportManifest(directory, 'scene.xml')
+    assert export.lookup('mesh', 'abc') is None
+    export.save()
+    # Files are only removed when they are listed in a valid manifest
+    assert os.path.isfile(os.path.join(directory, 'mesh.ply'))
+
+
+def test_manifest_lookup_by_hash(tmp_path, monkeypatch):
+    manifest = _import('manifest')
+    directory = str(tmp_path)
+    first = manifest.ExportManifest(directory, 'scene.xml')
+    for i in range(100):
+        _write(directory, f'mesh_{i}.ply', str(i))
+        first.record(f'mesh_{i}', f'hash_{i}', [f'mesh_{i}.ply'])
+    first.save()
+
+    second = manifest.ExportManifest(directory, 'other.xml')
+    second.record('new', 'new_hash', ['mesh_0.ply'])
+    checked = []
+    files_exist = second.files_exist
+    monkeypatch.setattr(second, 'files_exist', lambda entry: checked.append(entry) or files_exist(entry))
+    # Only the entries with the same hash are looked at
+    assert second.lookup('other', 'hash_50')['files'] == ['mesh_50.ply']
+    assert second.lookup('other', 'new_hash')['files'] == ['mesh_0.ply']
+    assert second.lookup('other', 'missing') is None
+    assert len(checked) == 2
@@ -0,0 +1,107 @@
+import importlib
+
+import numpy as np
+
+import pytest
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.{name}')
+
+_obj_quad = b'''o Quad
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vt 1 1
+vt 0 1
+vn 0 0 1
+f 1/1/1 2/2/1 3/3/1 4/4/1
+'''
+
+def test_obj_read_fast(tmp_path):
+    bl_import_obj = _import('importer.bl_import_obj')
+    filepath = tmp_path / 'quad.obj'
+    filepath.write_bytes(_obj_quad)
+
+    mesh = bl_import_obj.read_fast(str(filepath))
+    assert mesh is not None
+    assert mesh['dataname'] == 'Quad'
+    assert mesh['loop_totals'].tolist() == [4]
+    assert mesh['loop_verts'].tolist() == [0, 1, 2, 3]
+    assert np.array_equal(mesh['positions'], np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=np.float32))
+    assert np.array_equal(mesh['loop_uvs'], np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32))
+    assert np.array_equal(mesh['loop_normals'], np.tile(np.array([0, 0, 1], dtype=np.float32), (4, 1)))
+
+def test_obj_read_fast_without_uvs(tmp_path):
+    bl_import_obj = _import('importer.bl_import_obj')
+    filepath = tmp_path / 'triangles.obj'
+    filepath.write_bytes(b'v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0 1 1 1\nvn 0 0 1\nf 1//1 2//1 3//1\nf 1//1 3//1 4//1\n')
+
+    mesh = bl_import_obj.read_fast(str(filepath))
+    assert mesh is not None
+    assert mesh['dataname'] == 'triangles'
+    assert mesh['loop_totals'].tolist() == [3, 3]
+    assert mesh['loop_verts'].tolist() == [0, 1, 2, 0, 2, 3]
+    # Vertex colors after the position are ignored
+    assert mesh['positions'].shape == (4, 3)
+    assert 'loop_uvs' not in mesh
+    assert len(mesh['loop_normals']) == 6
+
+@pytest.mark.parametrize("content", [
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\nf -3 -2 -1\n',                       # Relative indices
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\ns 1\nf 1 2 3\n',                     # Smooth groups
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\nl 1 2\nf 1 2 3\n',                   # Polylines
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\nf 1 2 \\\n3\n',                      # Line continuations
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nv 2 0 0\nf 1 2 3 4 5\n',    # N-gons
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\nf 1 2 2\n',                          # Degenerate faces
+    b'o A\nv 0 0 0\nv 1 0 0\nv 1 1 0\nf 1 2 3\no B\nf 1 2 3\n',       # Several objects
+    b'v 0 0 0\nv 1 0 0\nv 1 1 0\nf 1 2 4\n',                          # Invalid indices
+    b'v 0 0 0\n',                                                     # No faces
+    b'',                                                              # Empty file
+])
+def test_obj_read_fast_fallback(tmp_path, content):
+    bl_import_obj = _import('importer.bl_import_obj')
+    filepath = tmp_path / 'fallback.obj'
+    filepath.write_bytes(content)
+    assert bl_import_obj.read_fast(str(filepath)) is None
+
+def test_obj_read_fast_chunks(tmp_path, monkeypatch):
+    bl_import_obj = _import('importer.bl_import_obj')
+    filepath = tmp_path / 'quad.obj'
+    filepath.write_bytes(_obj_quad)
+    expected = bl_import_obj.read_fast(str(filepath))
+
+    # Lines split across chunks must give the same result
+    monkeypatch.setattr(bl_import_obj, 'FAST_CHUNK_SIZE', 7)
+    mesh = bl_import_obj.read_fast(str(filepath))
+    assert mesh.keys() == expected.keys()
+    for key in expected:
+        assert np.array_equal(mesh[key], expected[key]), key
+
+def _loop_data(bl_mesh):
+    loop_verts = np.empty(len(bl_mesh.loops), dtype=np.int32)
+    bl_mesh.loops.foreach_get('vertex_index', loop_verts)
+    positions = np.empty(3 * len(bl_mesh.vertices), dtype=np.float32)
+    bl_mesh.vertices.foreach_get('co', positions)
+    loop_uvs = np.empty(2 * len(bl_mesh.loops), dtype=np.float32)
+    bl_mesh.uv_layers[0].data.foreach_get('uv', loop_uvs)
+    # Per loop, so that meshes with different vertex orders can be compared
+    return positions.reshape(-1, 3)[loop_verts], loop_uvs.reshape(-1, 2)
+
+def test_obj_load_fast_matches_full_parser(tmp_path):
+    bl_import_obj = _import('importer.bl_import_obj')
+    filepath = tmp_path / 'faces.obj'
+    filepath.write_bytes(b'o Faces\nv 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nv 2 0 0\nv 2 1 0\n'
+                         b'vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\nvt 2 0\nvt 2 1\n'
+                         b'f 1/1 2/2 3/3 4/4\nf 2/2 5/5 6/6 3/3\nf 3/3 6/6 4/4\n')
+
+    assert bl_import_obj.read_fast(str(filepath)) is not None
+    fast_meshes = bl_import_obj.load(str(filepath))
+    full_meshes = bl_import_obj.load(str(filepath), use_fast_path=False)
+    assert len(fast_meshes) == len(full_meshes) == 1
+    fast, full = fast_meshes[0], full_meshes[0]
+    assert len(fast.polygons) == len(full.polygons) == 3
+    for fast_data, full_data in zip(_loop_data(fast), _loop_data(full)):
+        assert np.allclose(fast_data, full_data)
@@ -0,0 +1,135 @@
+import importlib
+
+import numpy as np
+
+import pytest
+
+from utils.mesh_utils import grid_buffers
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.{name}')
+
+def _write_ply(filepath, format, vertices, faces, vertex_props=('x', 'y', 'z')):
+    ''' Write a PLY file with float vertex properties and uchar/int face lists '''
+    header = ['ply', f'format {format} 1.0', f'element vertex {len(vertices)}']
+    header += [f'property float {name}' for name in vertex_props]
+    header += [f'element face {len(faces)}', 'property list uchar int vertex_indices', 'end_header']
+    with open(filepath, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        if format == 'ascii':
+            for vertex in vertices:
+                f.write((' '.join(str(v) for v in vertex) + '\n').encode('ascii'))
+            for face in faces:
+                f.write((' '.join(str(v) for v in [len(face), *face]) + '\n').encode('ascii'))
+        else:
+            order = '<' if format == 'binary_little_endian' else '>'
+            f.write(np.asarray(vertices, dtype=f'{order}f4').tobytes())
+            for face in faces:
+                f.write(np.array([len(face)], dtype='u1').tobytes())
+                f.write(np.asarray(face, dtype=f'{order}i4').tobytes())
+
+@pytest.mark.parametrize("format", ["ascii", "binary_little_endian", "binary_big_endian"])
+def test_ply_read_mesh_formats(tmp_path, format):
+    ply_reader = _import('importer.bl_import_ply')
+    vertices = [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0], [2, 0, 0]]
+    faces = [[0, 1, 2, 3], [1, 4, 2]]
+    filepath = str(tmp_path / f'{format}.ply')
+    _write_ply(filepath, format, vertices, faces)
+
+    mesh = ply_reader.read_mesh(filepath)
+    assert mesh is not None
+    assert mesh['positions'].dtype == np.float32
+    assert np.array_equal(mesh['positions'], np.array(vertices, dtype=np.float32))
+    assert mesh['loop_totals'].tolist() == [4, 3]
+    assert mesh['loop_verts'].tolist() == [0, 1, 2, 3, 1, 4, 2]
+    assert 'uvs' not in mesh and 'colors' not in mesh
+
+@pytest.mark.parametrize("format", ["ascii", "binary_little_endian", "binary_big_endian"])
+def test_ply_read_mesh_same_result_for_all_formats(tmp_path, format):
+    ply_reader = _import('importer.bl_import_ply')
+    buffers = grid_buffers(normals=False)
+    vertices = np.concatenate([buffers['positions'], buffers['uvs']], axis=1)
+    reference = str(tmp_path / 'reference.ply')
+    filepath = str(tmp_path / f'{format}.ply')
+    _write_ply(reference, 'binary_little_endian', vertices, buffers['faces'], ('x', 'y', 'z', 's', 't'))
+    _write_ply(filepath, format, vertices, buffers['faces'], ('x', 'y', 'z', 's', 't'))
+
+    expected = ply_reader.read_mesh(reference)
+    mesh = ply_reader.read_mesh(filepath)
+    assert mesh.keys() == expected.keys()
+    for key in expected:
+        assert np.array_equal(mesh[key], expected[key]), key
+
+@pytest.mark.parametrize("format", ["ascii", "binary_little_endian"])
+def test_ply_read_mesh_empty(tmp_path, format):
+    ply_reader = _import('importer.bl_import_ply')
+    filepath = str(tmp_path / 'empty.ply')
+    _write_ply(filepath, format, [], [])
+
+    mesh = ply_reader.read_mesh(filepath)
+    assert mesh is not None
+    assert len(mesh['positions']) == 0
+    assert len(mesh.get('loop_totals', [])) == 0
+
+def test_ply_read_mesh_colors(tmp_path):
+    ply_reader = _import('importer.bl_import_ply')
+    colors = np.random.default_rng(0).random((3, 3), dtype=np.float32)
+    vertices = np.concatenate([np.eye(3, dtype=np.float32), colors], axis=1)
+    filepath = str(tmp_path / 'colors.ply')
+    _write_ply(filepath, 'binary_little_endian', vertices, [[0, 1, 2]], ('x', 'y', 'z', 'red', 'green', 'blue'))
+
+    mesh = ply_reader.read_mesh(filepath)
+    # Float channels are kept as is, with an opaque alpha
+    assert np.array_equal(mesh['colors'][:, :3], colors)
+    assert np.all(mesh['colors'][:, 3] == 1)
+
+def test_ply_read_mesh_invalid(tmp_path):
+    ply_reader = _import('importer.bl_import_ply')
+    filepath = tmp_path / 'invalid.ply'
+    filepath.write_bytes(b'not a ply file\n')
+    assert ply_reader.read_mesh(str(filepath)) is None
+
+def test_ply_read_mesh_fix_face_order(tmp_path):
+    ply_reader = _import('importer.bl_import_ply')
+    vertices = [[0, 0, 0, 0, 0], [1, 0, 0, 1, 0], [1, 1, 0, 1, 1], [0, 1, 0, 0, 1]]
+    faces = [[1, 2, 0], [1, 2, 3, 0]]
+    filepath = str(tmp_path / 'order.ply')
+    _write_ply(filepath, 'binary_little_endian', vertices, faces, ('x', 'y', 'z', 'u', 'v'))
+
+    mesh = ply_reader.read_mesh(filepath)
+    # The vertex 0 must not be the last vertex of a triangle, or the third or fourth of a quad
+    assert mesh['loop_verts'].tolist() == [2, 0, 1, 3, 0, 1, 2]
+
+def test_ply_create_mesh(tmp_path):
+    import bpy
+    ply_writer = _import('exporter.ply')
+    ply_reader = _import('importer.bl_import_ply')
+    buffers = grid_buffers()
+    filepath = str(tmp_path / 'grid.ply')
+    ply_writer.write_ply(filepath, buffers)
+
+    bl_mesh = ply_reader.create_mesh('grid', ply_reader.read_mesh(filepath))
+    assert isinstance(bl_mesh, bpy.types.Mesh)
+    assert len(bl_mesh.vertices) == len(buffers['positions'])
+    assert len(bl_mesh.polygons) == len(buffers['faces'])
+    assert len(bl_mesh.uv_layers) == 1
+
+def test_ply_create_mesh_loop_attributes(tmp_path):
+    ply_reader = _import('importer.bl_import_ply')
+    colors = np.random.default_rng(0).random((4, 3), dtype=np.float32)
+    vertices = np.concatenate([np.array([[0, 0, 0, 0, 0], [1, 0, 0, 1, 0], [1, 1, 0, 1, 1], [0, 1, 0, 0, 1]],
+                                        dtype=np.float32), colors], axis=1)
+    filepath = str(tmp_path / 'quad.ply')
+    _write_ply(filepath, 'binary_little_endian', vertices, [[0, 1, 2, 3]],
+               ('x', 'y', 'z', 'u', 'v', 'red', 'green', 'blue'))
+
+    bl_mesh = ply_reader.create_mesh('quad', ply_reader.read_mesh(filepath))
+    loop_verts = np.empty(len(bl_mesh.loops), dtype=np.int32)
+    bl_mesh.loops.foreach_get('vertex_index', loop_verts)
+    # The vertex attributes are copied to the loops of each vertex
+    loop_uvs = np.empty(2 * len(bl_mesh.loops), dtype=np.float32)
+    bl_mesh.uv_layers[0].data.foreach_get('uv', loop_uvs)
+    assert np.array_equal(loop_uvs.reshape(-1, 2), vertices[loop_verts, 3:5])
+    loop_colors = np.empty(4 * len(bl_mesh.loops), dtype=np.float32)
+    bl_mesh.vertex_colors[0].data.foreach_get('color', loop_colors)
+    assert np.allclose(loop_colors.reshape(-1, 4)[:, :3], colors[loop_verts], atol=1e-2)
@@ -0,0 +1,64 @@
+import importlib
+
+import numpy as np
+
+from utils.mesh_utils import grid_buffers
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.exporter.{name}')
+
+def _load_ply(filepath):
+    import mitsuba
+    mesh = mitsuba.load_dict({'type': 'ply', 'filename': filepath})
+    return mesh, mitsuba.traverse(mesh)
+
+def test_ply_writer_loads_in_mitsuba(tmp_path):
+    ply = _import('ply')
+    buffers = grid_buffers()
+    filepath = str(tmp_path / 'grid.ply')
+    ply.write_ply(filepath, buffers)
+
+    mesh, params = _load_ply(filepath)
+    assert mesh.vertex_count() == len(buffers['positions'])
+    assert mesh.face_count() == len(buffers['faces'])
+    assert np.allclose(np.array(params['vertex_positions']), buffers['positions'].ravel())
+    assert np.allclose(np.array(params['vertex_normals']), buffers['normals'].ravel())
+    assert np.allclose(np.array(params['vertex_texcoords']), buffers['uvs'].ravel())
+    assert np.array_equal(np.array(params['faces']), buffers['faces'].ravel())
+
+def test_ply_writer_matches_mitsuba_mesh(tmp_path):
+    geometry = _import('geometry')
+    ply = _import('ply')
+    buffers = grid_buffers(5, uvs=False)
+    # Same file as the one written through a mitsuba mesh
+    geometry.build_mesh('grid', buffers).write_ply(str(tmp_path / 'mitsuba.ply'))
+    ply.write_ply(str(tmp_path / 'numpy.ply'), buffers)
+
+    _, expected = _load_ply(str(tmp_path / 'mitsuba.ply'))
+    _, params = _load_ply(str(tmp_path / 'numpy.ply'))
+    for key in ('vertex_positions', 'vertex_normals', 'faces'):
+        assert np.array_equal(np.array(params[key]), np.array(expected[key])), key
+
+def test_ply_writer_vertex_colors(tmp_path):
+    ply = _import('ply')
+    buffers = grid_buffers(3, normals=False, uvs=False)
+    colors = np.random.default_rng(0).random((9, 3), dtype=np.float32)
+    buffers['colors'] = {'vertex_Color Attribute': colors}
+    filepath = str(tmp_path / 'colors.ply')
+    ply.write_ply(filepath, buffers)
+
+    mesh, _ = _load_ply(filepath)
+    # Spaces are not allowed in PLY property names
+    assert mesh.has_attribute('vertex_Color_Attribute')
+
+def test_ply_writer_empty_mesh(tmp_path):
+    ply = _import('ply')
+    buffers = {
+        'positions': np.zeros((0, 3), dtype=np.float32),
+        'colors': {},
+        'faces': np.zeros((0, 3), dtype=np.uint32),
+    }
+    filepath = tmp_path / 'empty.ply'
+    ply.write_ply(str(filepath), buffers)
+    # Only the header is written
+    assert filepath.read_bytes().endswith(b'element face 0\nproperty list uchar int vertex_indices\nend_header\n')
@@ -0,0 +1,158 @@
+import importlib
+import os
+import zlib
+
+import numpy as np
+
+import pytest
+
+from utils.mesh_utils import grid_buffers
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.{name}')
+
+def _write_serialized(filepath, shapes):
+    serialized = _import('exporter.serialized')
+    serialized_file = serialized.SerializedFile(filepath)
+    for name, buffers in shapes:
+        serialized_file.encode_shape(serialized_file.add_shape(), name, buffers)
+    serialized_file.write()
+
+def test_serialized_matches_mitsuba(tmp_path):
+    import mitsuba
+    filepath = str(tmp_path / 'grid.serialized')
+    buffers = grid_buffers()
+    _write_serialized(filepath, [('grid', buffers)])
+
+    mi_mesh = mitsuba.load_dict({'type': 'serialized', 'filename': filepath})
+    params = mitsuba.traverse(mi_mesh)
+    assert np.allclose(np.array(params['vertex_positions']), buffers['positions'].ravel())
+    assert np.array_equal(np.array(params['faces']), buffers['faces'].ravel())
+
+def test_serialized_round_trip(tmp_path):
+    bl_import_serialized = _import('importer.bl_import_serialized')
+    with_normals = grid_buffers(3)
+    with_colors = grid_buffers(4, normals=False, uvs=False)
+    with_colors['colors'] = {'vertex_color': np.random.default_rng(0).random((16, 3), dtype=np.float32)}
+    filepath = str(tmp_path / 'shapes.serialized')
+    _write_serialized(filepath, [('first', with_normals), ('second', with_colors)])
+
+    serialized_file = bl_import_serialized.SerializedFile(filepath)
+    assert len(serialized_file) == 2
+
+    first = serialized_file.shape(0)
+    assert first['name'] == 'first'
+    assert not first['face_normals']
+    assert np.array_equal(first['positions'], with_normals['positions'])
+    assert np.array_equal(first['normals'], with_normals['normals'])
+    assert np.array_equal(first['uvs'], with_normals['uvs'])
+    assert np.array_equal(first['faces'], with_normals['faces'])
+    assert 'colors' not in first
+
+    second = serialized_file.shape(1)
+    assert second['name'] == 'second'
+    assert second['face_normals']
+    assert np.array_equal(second['colors'], with_colors['colors']['vertex_color'])
+    assert 'normals' not in second and 'uvs' not in second
+
+    with pytest.raises(IndexError):
+        serialized_file.shape(2)
+
+def test_serialized_invalid_file(tmp_path):
+    bl_import_serialized = _import('importer.bl_import_serialized')
+    filepath = tmp_path / 'invalid.serialized'
+    filepath.write_bytes(b'not a serialized file')
+    with pytest.raises(ValueError):
+        bl_import_serialized.SerializedFile(str(filepath))
+
+def test_serialized_truncated_file(tmp_path):
+    bl_import_serialized = _import('importer.bl_import_serialized')
+    filepath = tmp_path / 'truncated.serialized'
+    _write_serialized(str(filepath), [('first', grid_buffers(3)), ('second', grid_buffers(4))])
+    data = filepath.read_bytes()
+
+    # Truncated files must fail with the errors handled by the importer
+    for size in range(0, len(data), 7):
+        filepath.write_bytes(data[:size])
+        with pytest.raises((ValueError, IndexError, zlib.error)):
+            serialized_file = bl_import_serialized.SerializedFile(str(filepath))
+            for index in range(len(serialized_file)):
+                serialized_file.shape(index)
+
+def test_serialized_create_mesh(tmp_path):
+    import bpy
+    bl_import_serialized = _import('importer.bl_import_serialized')
+    filepath = str(tmp_path / 'grid.serialized')
+    buffers = grid_buffers()
+    _write_serialized(filepath, [('grid', buffers)])
+
+    bl_mesh = bl_import_serialized.create_mesh('grid', bl_import_serialized.SerializedFile(filepath).shape(0))
+    assert isinstance(bl_mesh, bpy.types.Mesh)
+    assert len(bl_mesh.vertices) == len(buffers['positions'])
+    assert len(bl_mesh.polygons) == len(buffers['faces'])
+    assert bl_mesh.use_auto_smooth
+
+def test_serialized_create_mesh_loop_attributes(tmp_path):
+    bl_import_serialized = _import('importer.bl_import_serialized')
+    filepath = str(tmp_path / 'grid.serialized')
+    buffers = grid_buffers(normals=False)
+    buffers['colors'] = {'vertex_color': np.random.default_rng(0).random((16, 3), dtype=np.float32)}
+    _write_serialized(filepath, [('grid', buffers)])
+
+    bl_mesh = bl_import_serialized.create_mesh('grid', bl_import_serialized.SerializedFile(filepath).shape(0))
+    positions = np.empty(3 * len(bl_mesh.vertices), dtype=np.float32)
+    bl_mesh.vertices.foreach_get('co', positions)
+    assert np.array_equal(positions.reshape(-1, 3), buffers['positions'])
+    loop_verts = np.empty(len(bl_mesh.loops), dtype=np.int32)
+    bl_mesh.loops.foreach_get('vertex_index', loop_verts)
+    assert np.array_equal(loop_verts, buffers['faces'].ravel())
+    # The vertex attributes are copied to the loops of each vertex
+    loop_uvs = np.empty(2 * len(bl_mesh.loops), dtype=np.float32)
+    bl_mesh.uv_layers[0].data.foreach_get('uv', loop_uvs)
+    assert np.array_equal(loop_uvs.reshape(-1, 2), buffers['uvs'][loop_verts])
+    loop_colors = np.empty(4 * len(bl_mesh.loops), dtype=np.float32)
+    bl_mesh.vertex_colors[0].data.foreach_get('color', loop_colors)
+    assert np.allclose(loop_colors.reshape(-1, 4)[:, :3], buffers['colors']['vertex_color'][loop_verts], atol=1e-2)
+    assert not any(polygon.use_smooth for polygon in bl_mesh.polygons)
+
+def _export_serialized(directory, mesh_format):
+    ''' Export the current Blender scene with its meshes in .serialized files '''
+    import bpy
+    exporter = importlib.import_module('mitsuba-blender.io.exporter')
+    converter = exporter.SceneConverter()
+    converter.export_ctx.mesh_format = mesh_format
+    converter.set_path(os.path.join(directory, 'scene.xml'))
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    # The XML writer consumes the entries
+    shapes = [(entry['filename'], entry['shape_index']) for entry in converter.export_ctx.scene_data.values()
+              if isinstance(entry, dict) and entry.get('type') == 'serialized']
+    converter.dict_to_xml()
+    return shapes
+
+def _add_collection_cubes():
+    import bpy
+    for i, name in enumerate(('First', 'Second')):
+        b_collection = bpy.data.collections.new(name)
+        bpy.context.scene.collection.children.link(b_collection)
+        bpy.ops.mesh.primitive_cube_add(location=(3 * i, 0, 0))
+        b_cube = bpy.context.object
+        for collection in b_cube.users_collection:
+            collection.objects.unlink(b_cube)
+        b_collection.objects.link(b_cube)
+
+def test_export_serialized(tmp_path):
+    import mitsuba
+    _add_collection_cubes()
+    shapes = _export_serialized(str(tmp_path), 'SERIALIZED')
+    # All the meshes are packed in one file
+    assert sorted(shapes) == [('meshes/geometry.serialized', 0), ('meshes/geometry.serialized', 1)]
+    for filename, shape_index in shapes:
+        mi_mesh = mitsuba.load_dict({'type': 'serialized', 'filename': str(tmp_path / filename),
+                                     'shape_index': shape_index})
+        assert mi_mesh.face_count() == 12
+
+def test_export_serialized_per_collection(tmp_path):
+    _add_collection_cubes()
+    shapes = _export_serialized(str(tmp_path), 'SERIALIZED_COLLECTION')
+    assert sorted(shapes) == [('meshes/First.serialized', 0), ('meshes/Second.serialized', 0)]
+    assert all((tmp_path / filename).is_file() for filename, _ in shapes)
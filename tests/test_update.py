@@ -0,0 +1,261 @@
+import importlib
+import os
+
+import bpy
+import numpy as np
+
+import pytest
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.exporter.{name}')
+
+####################
+##   Scene dict   ##
+####################
+
+class _Transform:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+def test_dict_diff_identical():
+    update = _import('update')
+    entry = {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': [0.5, 0.5, 0.5]}}
+    assert update.dict_diff(entry, dict(entry)) == []
+
+def test_dict_diff_leaves():
+    update = _import('update')
+    old = {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': [0.5, 0.5, 0.5]}}
+    new = {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': [1.0, 0.5, 0.5]}}
+    assert update.dict_diff(old, new, ('mat',)) == [('mat.reflectance.value', [1.0, 0.5, 0.5])]
+
+@pytest.mark.parametrize("old, new", [
+    # Different plugin types
+    ({'type': 'diffuse'}, {'type': 'conductor'}),
+    # Different parameters
+    ({'type': 'diffuse', 'reflectance': 0.5}, {'type': 'diffuse'}),
+    # Nested entry replaced by a value
+    ({'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': 0.5}}, {'type': 'diffuse', 'reflectance': 0.5}),
+    # Different nested plugin types
+    ({'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': 0.5}},
+     {'type': 'diffuse', 'reflectance': {'type': 'bitmap', 'value': 0.5}}),
+])
+def test_dict_diff_structure_changes(old, new):
+    update = _import('update')
+    assert update.dict_diff(old, new) is None
+
+def test_dict_diff_renamed_params():
+    update = _import('update')
+    old = {'type': 'twosided', 'bsdf': {'type': 'diffuse', 'reflectance': 0.5}}
+    new = {'type': 'twosided', 'bsdf': {'type': 'diffuse', 'reflectance': 0.8}}
+    assert update.dict_diff(old, new, ('mat',)) == [('mat.brdf_0.reflectance', 0.8)]
+
+    old = {'type': 'perspective', 'fov': 40}
+    new = {'type': 'perspective', 'fov': 50}
+    assert update.dict_diff(old, new, ('cam',)) == [('cam.x_fov', 50)]
+    old['fov_axis'] = new['fov_axis'] = 'y'
+    assert update.dict_diff(old, new, ('cam',)) == [('cam.fov', 50)]
+
+def test_dict_diff_transforms():
+    update = _import('update')
+    identity = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+    moved = [[1, 0, 0, 1], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+    old = {'type': 'point', 'to_world': _Transform(identity)}
+    assert update.dict_diff(old, {'type': 'point', 'to_world': _Transform(identity)}) == []
+    new = {'type': 'point', 'to_world': _Transform(moved)}
+    assert update.dict_diff(old, new, ('light',)) == [('light.to_world', new['to_world'])]
+
+def test_patch_params():
+    update = _import('update')
+    params = {'mat.reflectance.value': [0.5, 0.5, 0.5], 'mat.roughness': 0.1}
+    old = {'type': 'principled', 'reflectance': 0.5, 'roughness': 0.1}
+    new = {'type': 'principled', 'reflectance': (1.0, 0.0, 0.0), 'roughness': 0.2}
+    assert update.patch_params(params, 'mat', old, new)
+    # Scalar inputs are patched through their uniform texture, and keep their type
+    assert params['mat.reflectance.value'] == [1.0, 0.0, 0.0]
+    assert params['mat.roughness'] == 0.2
+
+def test_patch_params_unknown_param():
+    update = _import('update')
+    params = {'mat.roughness': 0.1}
+    old = {'type': 'principled', 'anisotropic': 0.0}
+    new = {'type': 'principled', 'anisotropic': 0.5}
+    assert not update.patch_params(params, 'mat', old, new)
+
+def test_patch_params_structure_change():
+    update = _import('update')
+    params = {'mat.reflectance.value': 0.5}
+    old = {'type': 'diffuse', 'reflectance': 0.5}
+    new = {'type': 'diffuse', 'reflectance': {'type': 'bitmap', 'filename': 'texture.png'}}
+    assert not update.patch_params(params, 'mat', old, new)
+    assert params['mat.reflectance.value'] == 0.5
+
+def test_patch_params_rejected_value():
+    update = _import('update')
+
+    class Params(dict):
+        def __setitem__(self, key, value):
+            raise TypeError('Unsupported value')
+
+    params = Params({'mat.roughness': 0.1})
+    assert not update.patch_params(params, 'mat', {'type': 'principled', 'roughness': 0.1},
+                                   {'type': 'principled', 'roughness': 0.2})
+
+def test_patch_params_mitsuba_scene():
+    import mitsuba
+    update = _import('update')
+    old = {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': [0.5, 0.5, 0.5]}}
+    new = {'type': 'diffuse', 'reflectance': {'type': 'rgb', 'value': [0.2, 0.3, 0.4]}}
+    params = mitsuba.traverse(mitsuba.load_dict({'type': 'scene', 'mat': old}))
+    assert update.patch_params(params, 'mat', old, new)
+    assert list(params['mat.reflectance.value']) == pytest.approx([0.2, 0.3, 0.4])
+
+########################
+##   Scene updates    ##
+########################
+
+def _add_scene():
+    b_scene = bpy.context.scene
+    b_scene.render.engine = 'MITSUBA'
+    bpy.ops.mesh.primitive_cube_add(location=(0, 0, 0))
+    b_cube = bpy.context.object
+    bpy.ops.object.camera_add(location=(0, -5, 0))
+    b_scene.camera = bpy.context.object
+    bpy.ops.object.light_add(type='POINT', location=(0, 0, 3))
+    b_light = bpy.context.object
+    return b_cube, b_light
+
+def _load_scene(directory):
+    exporter = importlib.import_module('mitsuba-blender.io.exporter')
+    converter = exporter.SceneConverter(render=True)
+    # Named entries are required to update the scene in place
+    converter.export_ctx.export_ids = True
+    converter.set_path(os.path.join(directory, 'scene.xml'))
+    converter.scene_to_dict(bpy.context.evaluated_depsgraph_get())
+    return converter, converter.dict_to_scene()
+
+def _update_scene(converter, mts_scene, edit=None):
+    ''' Apply the pending changes of the Blender scene, with the updates recorded in the depsgraph '''
+    results = []
+
+    def on_update(b_scene, depsgraph):
+        results.append(converter.update_scene(depsgraph, mts_scene))
+
+    bpy.app.handlers.depsgraph_update_post.append(on_update)
+    try:
+        # Operators evaluate the depsgraph themselves
+        if edit is not None:
+            edit()
+        bpy.context.view_layer.update()
+    finally:
+        bpy.app.handlers.depsgraph_update_post.remove(on_update)
+    assert results
+    return all(results)
+
+def _params(mts_scene, key):
+    import mitsuba
+    value = mitsuba.traverse(mts_scene)[key]
+    if hasattr(value, 'matrix'):
+        return np.array(value.matrix)
+    if isinstance(value, float):
+        return np.array(value)
+    # Dynamic arrays can't be converted directly when they are empty
+    return np.fromiter(value, dtype=np.float32)
+
+def test_update_scene_moved_mesh(tmp_path):
+    b_cube, _ = _add_scene()
+    # Smooth shading exports the vertex normals
+    b_cube.data.polygons.foreach_set('use_smooth', [True] * len(b_cube.data.polygons))
+    b_cube.data.update()
+    converter, mts_scene = _load_scene(str(tmp_path / 'patched'))
+    b_cube.location.x = 1.0
+    b_cube.scale.z = 2.0
+    assert _update_scene(converter, mts_scene)
+
+    _, reference = _load_scene(str(tmp_path / 'reference'))
+    assert len(_params(reference, 'mesh-Cube.vertex_normals'))
+    assert np.allclose(_params(mts_scene, 'mesh-Cube.vertex_positions'), _params(reference, 'mesh-Cube.vertex_positions'))
+    assert np.allclose(_params(mts_scene, 'mesh-Cube.vertex_normals'), _params(reference, 'mesh-Cube.vertex_normals'))
+
+def test_update_scene_light(tmp_path):
+    _, b_light = _add_scene()
+    converter, mts_scene = _load_scene(str(tmp_path / 'patched'))
+    b_light.data.energy *= 2
+    b_light.location.z = 4.0
+    assert _update_scene(converter, mts_scene)
+
+    _, reference = _load_scene(str(tmp_path / 'reference'))
+    for key in ('emit-Point.intensity.value', 'emit-Point.position'):
+        assert np.allclose(_params(mts_scene, key), _params(reference, key)), key
+
+def test_update_scene_camera(tmp_path):
+    _add_scene()
+    converter, mts_scene = _load_scene(str(tmp_path / 'patched'))
+    b_camera = bpy.context.scene.camera
+    b_camera.location.x = 2.0
+    b_camera.data.lens = 35
+    assert _update_scene(converter, mts_scene)
+
+    _, reference = _load_scene(str(tmp_path / 'reference'))
+    assert np.allclose(_params(mts_scene, 'Camera.x_fov'), _params(reference, 'Camera.x_fov'))
+    assert np.allclose(_params(mts_scene, 'Camera.to_world'), _params(reference, 'Camera.to_world'))
+
+def test_update_scene_new_object(tmp_path):
+    _add_scene()
+    converter, mts_scene = _load_scene(str(tmp_path))
+    # New objects require a new scene
+    assert not _update_scene(converter, mts_scene, lambda: bpy.ops.mesh.primitive_uv_sphere_add(location=(2, 0, 0)))
+
+##########################
+##   Animation frames   ##
+##########################
+
+def test_may_deform():
+    geometry = _import('geometry')
+    bpy.ops.mesh.primitive_cube_add()
+    b_cube = bpy.context.object
+    assert not geometry.may_deform(b_cube)
+    # Modifiers only deform when they are animated
+    modifier = b_cube.modifiers.new('Subdivision', 'SUBSURF')
+    assert not geometry.may_deform(b_cube)
+    modifier.keyframe_insert('levels', frame=1)
+    assert geometry.may_deform(b_cube)
+
+    bpy.ops.mesh.primitive_cube_add()
+    b_wave = bpy.context.object
+    b_wave.modifiers.new('Wave', 'WAVE')
+    assert geometry.may_deform(b_wave)
+
+def test_update_frame(tmp_path):
+    b_scene = bpy.context.scene
+    b_cube, b_light = _add_scene()
+    b_cube.keyframe_insert('location', frame=1)
+    b_cube.location = (1, 2, 0)
+    b_cube.keyframe_insert('location', frame=2)
+    b_light.data.keyframe_insert('energy', frame=1)
+    b_light.data.energy *= 2
+    b_light.data.keyframe_insert('energy', frame=2)
+    bpy.ops.mesh.primitive_uv_sphere_add(location=(0, 0, 2))
+    bpy.context.object.modifiers.new('Wave', 'WAVE')
+
+    b_scene.frame_set(1)
+    converter, mts_scene = _load_scene(str(tmp_path / 'patched'))
+    b_scene.frame_set(2)
+    assert converter.update_frame(bpy.context.evaluated_depsgraph_get(), mts_scene)
+
+    _, reference = _load_scene(str(tmp_path / 'reference'))
+    for key in ('mesh-Cube.vertex_positions', 'mesh-Sphere.vertex_positions', 'emit-Point.intensity.value'):
+        assert np.allclose(_params(mts_scene, key), _params(reference, key)), key
+    # The sphere deforms from one frame to the next
+    b_scene.frame_set(1)
+    _, first_frame = _load_scene(str(tmp_path / 'first'))
+    assert not np.allclose(_params(first_frame, 'mesh-Sphere.vertex_positions'), _params(reference, 'mesh-Sphere.vertex_positions'))
+
+def test_update_frame_new_object(tmp_path):
+    b_scene = bpy.context.scene
+    _add_scene()
+    b_scene.frame_set(1)
+    converter, mts_scene = _load_scene(str(tmp_path))
+    bpy.ops.mesh.primitive_uv_sphere_add(location=(2, 0, 0))
+    b_scene.frame_set(2)
+    # Objects that appear require a new scene
+    assert not converter.update_frame(bpy.context.evaluated_depsgraph_get(), mts_scene)
@@ -0,0 +1,181 @@
+import importlib
+import socket
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+def _import():
+    return importlib.import_module('mitsuba-blender.engine.v1_workers')
+
+# Render server accepting connections on the port given with -l, like mtssrv
+_server_script = '''
+import socket, sys
+port = int(sys.argv[sys.argv.index('-l') + 1])
+with socket.socket() as sock:
+    sock.bind(('127.0.0.1', port))
+    sock.listen()
+    while True:
+        sock.accept()[0].close()
+'''
+
+# Master answering the renders of scene files named after their outcome
+_master_script = '''
+import json, sys
+print(json.dumps({"ready": True}), flush=True)
+for line in sys.stdin:
+    command = json.loads(line)
+    if command.get("cancel"):
+        print(json.dumps({"id": command["id"], "status": "cancelled"}), flush=True)
+    elif command["scene"] == "done.xml":
+        print(json.dumps({"id": command["id"], "progress": 0.5}), flush=True)
+        print(json.dumps({"id": command["id"], "status": "done", "output": "log"}), flush=True)
+    elif command["scene"] == "failed.xml":
+        print(json.dumps({"id": command["id"], "status": "failed", "output": "error"}), flush=True)
+'''
+
+def _write_script(path, content):
+    path.write_text(f'#!{sys.executable}\n{content}')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+@pytest.fixture
+def mitsuba_dist(tmp_path):
+    ''' Mitsuba 0.6 distribution with a fake render server '''
+    _write_script(tmp_path / 'mtssrv', _server_script)
+    return str(tmp_path / 'mitsuba')
+
+@pytest.fixture
+def rendered_args(monkeypatch):
+    ''' Arguments of the Mitsuba processes started by the pool, which are not run '''
+    v1_workers = _import()
+    args = []
+
+    def run_process(process_args, env, progress_callback=None, test_break=None):
+        args.append(process_args)
+        return 0, b''
+
+    monkeypatch.setattr(v1_workers, 'run_process', run_process)
+    return args
+
+def test_render_without_servers(tmp_path, rendered_args):
+    v1_workers = _import()
+    pool = v1_workers.V1WorkerPool(str(tmp_path / 'mitsuba'), 0)
+    assert pool.render('scene.xml') == (0, b'')
+    assert rendered_args == [[str(tmp_path / 'mitsuba'), 'scene.xml']]
+
+def test_render_missing_server(tmp_path, rendered_args):
+    v1_workers = _import()
+    pool = v1_workers.V1WorkerPool(str(tmp_path / 'mitsuba'), 2)
+    pool.render('scene.xml')
+    # Renders fall back to a local process, without trying to start the servers again
+    assert pool.failed
+    assert not pool.start()
+    assert rendered_args == [[str(tmp_path / 'mitsuba'), 'scene.xml']]
+
+def test_render_clients(mitsuba_dist, rendered_args):
+    v1_workers = _import()
+    # Without the Mitsuba 0.6 Python bindings, the master cannot run
+    pool = v1_workers.V1WorkerPool(mitsuba_dist, 2, python=sys.executable)
+    try:
+        pool.render('scene.xml')
+        assert len(pool.servers) == 2
+        assert all(pool.is_listening(port) for port in pool.ports)
+        assert pool.master_failed
+        connection = ";".join(f"127.0.0.1:{port}" for port in pool.ports)
+        assert rendered_args == [[mitsuba_dist, '-c', connection, '-p', '0', 'scene.xml']]
+    finally:
+        pool.stop()
+    assert not pool.servers
+
+def test_start_port_taken(mitsuba_dist, monkeypatch):
+    v1_workers = _import()
+    free_port = v1_workers.free_port
+    with socket.socket() as taken:
+        # Bound by another process after being picked for the server
+        taken.bind(('127.0.0.1', 0))
+        ports = [taken.getsockname()[1]]
+        monkeypatch.setattr(v1_workers, 'free_port', lambda: ports.pop() if ports else free_port())
+        pool = v1_workers.V1WorkerPool(mitsuba_dist, 1)
+        try:
+            assert pool.start()
+            assert pool.ports[0] != taken.getsockname()[1]
+        finally:
+            pool.stop()
+
+def test_render_master(mitsuba_dist, tmp_path, monkeypatch, rendered_args):
+    v1_workers = _import()
+    monkeypatch.setattr(v1_workers.V1Master, 'script', _write_script(tmp_path / 'master.py', _master_script))
+    pool = v1_workers.V1WorkerPool(mitsuba_dist, 1, python=sys.executable)
+    try:
+        progress = []
+        assert pool.render('done.xml', progress.append) == (0, b'log')
+        assert progress == [0.5]
+        assert pool.render('failed.xml') == (1, b'error')
+        # Cancelled renders have no return code
+        assert pool.render('cancelled.xml', test_break=lambda: True) == (None, b'')
+        # The renders were submitted to the same master, without starting any process
+        assert pool.master.is_running()
+        assert not rendered_args
+    finally:
+        pool.stop()
+
+def test_submit_concurrent_jobs(tmp_path, monkeypatch):
+    v1_workers = _import()
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def render(scene_file, progress_callback=None, test_break=None):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return 0, scene_file.encode()
+
+    pool = v1_workers.V1WorkerPool(str(tmp_path / 'mitsuba'), 0, max_jobs=2)
+    monkeypatch.setattr(pool, 'render', render)
+    futures = [pool.submit(f'{frame}.xml') for frame in range(6)]
+    assert [future.result() for future in futures] == [(0, f'{frame}.xml'.encode()) for frame in range(6)]
+    assert max_running == 2
+    pool.stop()
+
+class _FramePool:
+    ''' Renders a constant image next to the submitted scene files '''
+    def __init__(self):
+        self.scene_files = []
+
+    def submit(self, scene_file):
+        from concurrent.futures import Future
+        import numpy as np
+        from mitsuba import Bitmap
+        self.scene_files.append(scene_file)
+        Bitmap(np.full((4, 6, 3), 0.5, dtype=np.float32)).write(scene_file.replace('.xml', '.exr'))
+        future = Future()
+        future.set_result((0, b''))
+        return future
+
+def test_render_animation_operator(tmp_path, monkeypatch):
+    import bpy
+    v1_workers = _import()
+    pool = _FramePool()
+    monkeypatch.setattr(v1_workers, 'get_pool', lambda *args: pool)
+    b_scene = bpy.context.scene
+    b_scene.render.engine = 'MITSUBA'
+    b_scene.mitsuba.version = 'v1'
+    bpy.ops.mesh.primitive_cube_add()
+    bpy.ops.object.camera_add(location=(0, -5, 0))
+    b_scene.camera = bpy.context.object
+    b_scene.frame_start, b_scene.frame_end = 1, 3
+    b_scene.render.filepath = str(tmp_path / 'frame_')
+    b_scene.render.image_settings.file_format = 'PNG'
+
+    assert bpy.ops.mitsuba.render_animation_v1() == {'FINISHED'}
+    assert len(pool.scene_files) == 3
+    assert all(scene_file.endswith('_v1.xml') for scene_file in pool.scene_files)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['frame_0001.png', 'frame_0002.png', 'frame_0003.png']
@@ -0,0 +1,67 @@
+import importlib
+import threading
+import time
+
+import pytest
+
+def _import(name):
+    return importlib.import_module(f'mitsuba-blender.io.exporter.{name}')
+
+def test_background_writer_runs_all_jobs():
+    writer = _import('writer')
+    results = []
+    lock = threading.Lock()
+
+    def job(i):
+        with lock:
+            results.append(i)
+
+    background_writer = writer.BackgroundWriter(max_workers=2)
+    for i in range(50):
+        background_writer.submit(job, i, size=10)
+    background_writer.join()
+    assert sorted(results) == list(range(50))
+    assert background_writer.pending_bytes == 0
+
+def test_background_writer_memory_budget():
+    writer = _import('writer')
+    max_pending = 0
+    pending = 0
+    lock = threading.Lock()
+
+    def job(size):
+        nonlocal pending, max_pending
+        with lock:
+            pending += size
+            max_pending = max(max_pending, pending)
+        time.sleep(0.01)
+        with lock:
+            pending -= size
+
+    background_writer = writer.BackgroundWriter(max_workers=4, max_pending_bytes=100)
+    for _ in range(20):
+        background_writer.submit(job, 40, size=40)
+    background_writer.join()
+    # At most two jobs of 40 bytes fit in the budget
+    assert max_pending <= 80
+
+    # A job larger than the budget is still accepted when nothing is pending
+    background_writer.submit(job, 1000, size=1000)
+    background_writer.join()
+    assert background_writer.pending_bytes == 0
+
+def test_background_writer_errors():
+    writer = _import('writer')
+
+    def job(i):
+        if i == 3:
+            raise OSError('Disk full')
+
+    background_writer = writer.BackgroundWriter(max_workers=2)
+    for i in range(10):
+        background_writer.submit(job, i)
+    with pytest.raises(OSError):
+        background_writer.join()
+    # The writer can be used again after an error
+    background_writer.submit(job, 0)
+    background_writer.join()
@@ -1 +1,2 @@
-from . import mi_scene_utils
\ No newline at end of file
+from . import mi_scene_utils
+from . import mesh_utils
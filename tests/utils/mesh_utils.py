@@ -0,0 +1,19 @@
+import numpy as np
+
+def grid_buffers(n=4, normals=True, uvs=True):
+    ''' Buffers of a n x n grid of vertices, as returned by geometry.part_buffers '''
+    x, y = np.meshgrid(np.linspace(0, 1, n), np.linspace(0, 1, n))
+    buffers = {
+        'positions': np.stack([x.ravel(), y.ravel(), np.zeros(n * n)], axis=1).astype(np.float32),
+        'colors': {},
+    }
+    if normals:
+        buffers['normals'] = np.tile(np.array([0, 0, 1], dtype=np.float32), (n * n, 1))
+    if uvs:
+        buffers['uvs'] = buffers['positions'][:, :2].copy()
+    i = np.arange(n - 1)
+    corners = (i[None, :] + n * i[:, None]).ravel()
+    faces = np.concatenate([np.stack([corners, corners + 1, corners + n + 1], axis=1),
+                            np.stack([corners, corners + n + 1, corners + n], axis=1)])
+    buffers['faces'] = faces.astype(np.uint32)
+    return buffers